@@ -0,0 +1,169 @@
+# `async for` access to the data moving through the threaded pipeline, so
+# that lightweight consumers (metrics, network publishers, writers) can all
+# run as tasks on one event loop rather than each tying up an OS thread:
+#
+#     async with bundles(synchronizer) as bundle_stream:
+#         async for bundle in bundle_stream:
+#             ...
+#
+# Each iterator is an AsyncSubscription. It registers itself with the
+# producer like any other subscriber queue (the producer thread calls put)
+# and is drained on the event loop. It is a Subscription (see
+# subscription.py) with an async get(), so it is bounded and when full
+# applies one of the overflow policies of the FrameReel:
+#   - block: the producer waits for the consumer. This is backpressure; note
+#     that a slow consumer of bundles then holds back the Synchronizer and so
+#     every other subscriber
+#   - drop_oldest: the oldest waiting item is discarded to make room
+#   - drop_newest: the new item is discarded
+# Frames are published on the capture thread, which must never wait on a
+# consumer, so the frame iterator only ever drops.
+#
+# Cancelling the consuming task, leaving the `async with` block or calling
+# close() unsubscribes from the producer and releases it if it was blocked.
+# Subscriptions must be created on the thread running the event loop.
+
+import asyncio
+import logging
+from queue import Empty
+
+from src.cameras.subscription import Subscription
+
+
+class AsyncSubscription(Subscription):
+    def __init__(self, subscribe, release, maxsize=8, overflow="block", name=None):
+        super().__init__(maxsize, overflow, name)
+
+        self.loop = asyncio.get_running_loop()
+        self._waiter = None  # future the consumer awaits while empty
+
+        self._release = release
+        subscribe(self)
+
+    def put(self, item, block=True, timeout=None):
+        """Called from the producer thread; mirrors Queue.put()"""
+        super().put(item, block, timeout)
+
+        try:
+            self.loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            # the event loop has already been shut down
+            logging.debug("Event loop closed; item left undelivered")
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def get(self):
+        while True:
+            try:
+                return super().get(block=False)
+            except Empty:
+                if self.closed:
+                    raise StopAsyncIteration
+
+            # a put landing between the check above and this await schedules
+            # _wake on the loop, which can only run once this has yielded
+            self._waiter = self.loop.create_future()
+            await self._waiter
+
+    def close(self):
+        """Unsubscribe from the producer and free it if it is waiting on a
+        full queue. Anything still queued can be drained first"""
+        with self.condition:
+            if self.closed:
+                return
+            super().close()
+
+        self._release(self)
+        try:
+            # may be closed from another thread; let a waiting consumer finish
+            self.loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            pass  # event loop already shut down
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.get()
+        except asyncio.CancelledError:
+            self.close()
+            raise
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def frames(stream, maxsize=1, overflow="drop_oldest"):
+    """[frame_time, FramePacket] for each frame read by a LiveStream. With the
+    defaults a consumer sees only the newest frame whenever it is ready"""
+    if overflow == "block":
+        raise ValueError("The capture thread cannot be made to wait on a frame consumer")
+    return AsyncSubscription(
+        stream.latest_frame.subscribe, stream.latest_frame.release, maxsize, overflow
+    )
+
+
+def bundles(synchronizer, maxsize=8, overflow="block"):
+    """Each bundle produced by the Synchronizer"""
+    return AsyncSubscription(
+        synchronizer.subscribe_to_bundle, synchronizer.release_bundle_q, maxsize, overflow
+    )
+
+
+def triangulated_packets(array_triangulator, maxsize=64, overflow="block"):
+    """Each TriangulatedPointsPacket produced by the ArrayTriangulator"""
+    return AsyncSubscription(
+        array_triangulator.subscribe_to_packets,
+        array_triangulator.release_packet_q,
+        maxsize,
+        overflow,
+    )
+
+
+if __name__ == "__main__":
+    from src.calibration.charuco import Charuco
+    from src.cameras.live_stream import LiveStream
+    from src.cameras.synchronizer import Synchronizer
+    from src.cameras.synthetic_camera import SyntheticArray
+
+    RUN_TIME = 5  # seconds
+
+    async def count_bundles(syncr):
+        count = 0
+        async with bundles(syncr) as bundle_stream:
+            async for bundle in bundle_stream:
+                count += 1
+                if count % 20 == 0:
+                    print(f"{count} bundles; synchronizer at {syncr.fps:.1f} fps")
+
+    async def slow_preview(stream):
+        seen = 0
+        try:
+            async with frames(stream) as frame_stream:
+                async for frame_time, packet in frame_stream:
+                    seen += 1
+                    await asyncio.sleep(0.5)  # e.g. a network publisher that can't keep up
+        finally:
+            print(f"preview of port {stream.port} saw {seen} frames; {frame_stream.dropped} dropped")
+
+    async def main(syncr, streams):
+        tasks = [asyncio.create_task(count_bundles(syncr))]
+        tasks += [asyncio.create_task(slow_preview(stream)) for stream in streams.values()]
+        await asyncio.sleep(RUN_TIME)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        print(f"bundle subscribers left after cancelling: {len(syncr.bundle_subscribers)}")
+
+    charuco = Charuco(4, 5, 11, 8.5, square_size_overide_cm=5.4)
+    synthetic_array = SyntheticArray(charuco, 3, fps=20)
+    streams = {port: LiveStream(cam) for port, cam in synthetic_array.get_cameras().items()}
+    syncr = Synchronizer(streams, fps_target=20)
+
+    asyncio.run(main(syncr, streams))
@@ -0,0 +1,105 @@
+# A consumer whose work per bundle changes partway through a session, as
+# corner detection does when the board comes into view of more cameras:
+# light, then heavy, then light again. The Synchronizer is run against it
+# at the fixed 6.2 fps the stereo tools have always used, at a fixed 30 fps,
+# and with a RateController free to move between 2 and 30 fps. Frames come
+# from a 60 fps timing trace replayed in real time, so the cameras are never
+# what holds the rate back.
+#
+# Reported for each phase: the rate fired at, bundles the consumer handled
+# per second, bundles it lost to its queue overflowing, and the latency from
+# capture to the consumer starting on a bundle (which includes the time the
+# synchronizer holds frames to bundle them, so it is longer at low rates).
+#
+# run from the repo root with:
+#   python -m src.benchmarks.adaptive_rate
+
+import logging
+
+LOG_FILE = r"log\adaptive_rate.log"
+LOG_LEVEL = logging.INFO
+LOG_FORMAT = " %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s"
+
+logging.basicConfig(filename=LOG_FILE, filemode="w", format=LOG_FORMAT, level=LOG_LEVEL)
+
+import time
+from queue import Empty
+from threading import Thread
+
+import numpy as np
+
+from src.cameras.rate_controller import RateController
+from src.cameras.subscription import Subscription
+from src.cameras.synchronizer import Synchronizer
+from src.cameras.trace_stream import TimingTrace, start_streams
+
+PORTS = [0, 1, 2]
+PHASES = [("light", 0.02), ("heavy", 0.1), ("light", 0.02)]  # seconds of work per bundle
+PHASE_DURATION = 6
+QUEUE_DEPTH = 8
+
+
+def consume(bundle_q, results, stop):
+    while not stop["stop"]:
+        try:
+            bundle = bundle_q.get(timeout=0.1)
+        except Empty:
+            continue
+        latency = time.perf_counter() - capture_time(bundle)
+        work = stop["work"]
+        end = time.perf_counter() + work
+        while time.perf_counter() < end:
+            pass
+        results[stop["phase"]]["handled"] += 1
+        results[stop["phase"]]["latencies"].append(latency)
+
+
+def capture_time(bundle):
+    # frames of a real time replay are stamped with the time they arrived
+    return max(frame_data["frame_time"] for frame_data in bundle.values() if frame_data is not None)
+
+
+def run(label, fps_target, adaptive):
+    trace = TimingTrace.generate(PORTS, fps=60, duration=len(PHASES) * PHASE_DURATION + 5, stall_rate=0, drop_rate=0)
+    streams = trace.build_streams(realtime=True)
+    syncr = Synchronizer(streams, fps_target=fps_target)
+    bundle_q = Subscription(QUEUE_DEPTH, "drop_oldest", name="consumer")
+    syncr.subscribe_to_bundle(bundle_q)
+    controller = RateController(syncr, min_fps=2, max_fps=30) if adaptive else None
+    start_streams(streams)
+
+    results = [{"handled": 0, "latencies": [], "fps": []} for _ in PHASES]
+    state = {"stop": False, "phase": 0, "work": PHASES[0][1]}
+    consumer = Thread(target=consume, args=(bundle_q, results, state), daemon=True)
+    consumer.start()
+
+    print(label)
+    for index, (name, work) in enumerate(PHASES):
+        state["phase"] = index
+        state["work"] = work
+        dropped_before = bundle_q.dropped
+        phase_end = time.perf_counter() + PHASE_DURATION
+        while time.perf_counter() < phase_end:
+            time.sleep(0.25)
+            results[index]["fps"].append(syncr.fps_target)
+
+        result = results[index]
+        latencies = np.array(result["latencies"]) * 1000 if result["latencies"] else np.array([0])
+        print(
+            f"  {name:<5} ({1000 * work:3.0f} ms/bundle): fired at {np.mean(result['fps']):5.1f} fps "
+            f"(ending {syncr.fps_target:4.1f}) | handled {result['handled'] / PHASE_DURATION:5.1f}/sec "
+            f"| lost {bundle_q.dropped - dropped_before:3d} | latency median {np.median(latencies):4.0f} ms"
+        )
+
+    state["stop"] = True
+    if controller is not None:
+        controller.stop()
+    syncr.stop_event.set()
+    for stream in streams.values():
+        stream.stop()
+
+
+if __name__ == "__main__":
+    run("fixed 6.2 fps", 6.2, adaptive=False)
+    run("fixed 30 fps", 30, adaptive=False)
+    run("adaptive, 2 to 30 fps", 6.2, adaptive=True)
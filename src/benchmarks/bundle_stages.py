@@ -0,0 +1,156 @@
+# Bundles processed per second when the per-frame work is done:
+#   - serially: one consumer thread working through the ports of each bundle
+#     in turn, as the StereoCalibrator and PairedPointStream do
+#   - by a StageEngine on a thread pool
+#   - by a StageEngine on a process pool
+# Two kinds of stage are tried: charuco corner detection (CPU bound, mostly
+# inside cv2 with the GIL released), and a stand-in for work handed off to
+# another device (a model on a GPU, say) that mostly waits. Bundles are
+# rendered ahead of time and fed to each consumer as fast as it takes them,
+# and the engine's output is checked to be complete and in order.
+#
+# run from the repo root with:
+#   python -m src.benchmarks.bundle_stages
+
+import logging
+
+LOG_FILE = r"log\bundle_stages_benchmark.log"
+LOG_LEVEL = logging.INFO
+LOG_FORMAT = " %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s"
+
+logging.basicConfig(filename=LOG_FILE, filemode="w", format=LOG_FORMAT, level=LOG_LEVEL)
+
+import os
+import time
+from threading import Thread
+
+from src.calibration.charuco import Charuco
+from src.calibration.corner_tracker import CornerTracker
+from src.cameras.bundle_stages import StageEngine, corner_stage, run_stages
+from src.cameras.frame_bundle import FrameBundle
+from src.cameras.frame_packet import FrameData, FramePacket
+from src.cameras.subscription import Subscription
+from src.cameras.synthetic_camera import SyntheticArray
+
+PORTS = 3
+RESOLUTION = (1280, 720)
+BUNDLE_COUNT = 60
+WORKERS = 6
+MAX_IN_FLIGHT = 4
+OFFLOAD_TIME = 0.01  # seconds waited on the other device per frame
+
+
+def board():
+    return Charuco(4, 5, 11, 8.5, aruco_scale=0.75, square_size_overide_cm=5.25, inverted=True)
+
+
+_tracker = None  # one per worker process
+
+
+def process_corners(frame_data):
+    global _tracker
+    if _tracker is None:
+        _tracker = CornerTracker(board())
+    ids, img_loc, board_loc = _tracker.get_corners(frame_data["frame"])
+    return {"ids": ids, "img_loc": img_loc, "board_loc": board_loc}
+
+
+def offload(frame_data):
+    time.sleep(OFFLOAD_TIME)
+    return {"offloaded": frame_data["frame_index"]}
+
+
+class PreparedSource:
+    """Hands out the same frames as fresh bundles, so no cached gray image
+    carries over from one run to the next"""
+
+    def __init__(self, frames):
+        self.frames = frames  # port: [frame]
+        self.streams = {port: None for port in frames}
+        self.subscribers = []
+
+    def subscribe_to_bundle(self, q):
+        self.subscribers.append(q)
+
+    def release_bundle_q(self, q):
+        self.subscribers.remove(q)
+        q.close()
+
+    def bundles(self):
+        for index in range(BUNDLE_COUNT):
+            frames = {}
+            for port, port_frames in self.frames.items():
+                frame = port_frames[index % len(port_frames)]
+                packet = FramePacket(index, frame=frame)
+                frames[port] = FrameData(
+                    port=port, packet=packet, frame_index=index, frame_time=index, bundle_index=index
+                )
+            yield FrameBundle(frames, index)
+
+    def play(self):
+        for bundle in self.bundles():
+            for q in self.subscribers:
+                q.put(bundle)
+
+
+def run_serial(source, stages):
+    start = time.perf_counter()
+    for bundle in source.bundles():
+        for port, frame_data in bundle.items():
+            annotations, _ = run_stages(stages, frame_data)
+            bundle.annotate(port, **annotations)
+    return time.perf_counter() - start
+
+
+def run_engine(source, stages, executor):
+    engine = StageEngine(
+        source, stages, workers=WORKERS, executor=executor, max_in_flight=MAX_IN_FLIGHT
+    )
+    out_q = Subscription.lossless(maxsize=BUNDLE_COUNT)
+    engine.subscribe_to_bundle(out_q)
+
+    if executor == "process":
+        # start the workers (and build their trackers) before timing
+        list(engine.pool.map(process_corners, [{"frame": source.frames[0][0]}] * WORKERS))
+
+    start = time.perf_counter()
+    Thread(target=source.play, daemon=True).start()
+    indices = [out_q.get().bundle_index for _ in range(BUNDLE_COUNT)]
+    elapsed = time.perf_counter() - start
+
+    stats = engine.stats()
+    engine.stop()
+    assert indices == list(range(BUNDLE_COUNT)), "bundles emitted out of order"
+    assert stats["peak_in_flight"] <= MAX_IN_FLIGHT
+    return elapsed, stats
+
+
+def report(label, elapsed, stats=None):
+    line = f"  {label:<16} {BUNDLE_COUNT / elapsed:6.1f} bundles/sec"
+    if stats is not None:
+        line += (
+            f" | latency median {stats['latency_median_ms']:6.1f} ms"
+            f" | peak in flight {stats['peak_in_flight']}/{MAX_IN_FLIGHT}"
+            f" | errors {sum(stats['errors'].values())}"
+        )
+    print(line)
+
+
+if __name__ == "__main__":
+    print(f"{PORTS} ports at {RESOLUTION[0]}x{RESOLUTION[1]}, {BUNDLE_COUNT} bundles, {os.cpu_count()} CPUs")
+
+    cameras = SyntheticArray(board(), PORTS, resolution=RESOLUTION, fps=None).get_cameras()
+    frames = {port: [cam.capture.read()[1] for _ in range(10)] for port, cam in cameras.items()}
+    source = PreparedSource(frames)
+
+    corners = corner_stage(CornerTracker(board()))
+    run_serial(source, [("corners", corners)])  # warm up
+
+    print("corner detection")
+    report("serial", run_serial(source, [("corners", corners)]))
+    report("engine threads", *run_engine(source, {"corners": corners}, "thread"))
+    report("engine processes", *run_engine(source, {"corners": process_corners}, "process"))
+
+    print(f"offloaded work ({1000 * OFFLOAD_TIME:.0f} ms per frame)")
+    report("serial", run_serial(source, [("offload", offload)]))
+    report("engine threads", *run_engine(source, {"offload": offload}, "thread"))
@@ -0,0 +1,151 @@
+# Compare frame bundle throughput of the thread based LiveStream against the
+# process based ProcessStream. No hardware is required: each camera is a
+# stand-in capture that decodes a pre-encoded JPEG on every read, which is
+# roughly the work that a UVC camera streaming MJPG puts on the host.
+#
+# run from the repo root with:
+#   python -m src.benchmarks.capture_backends
+
+import logging
+
+LOG_FILE = r"log\capture_backends.log"
+LOG_LEVEL = logging.INFO
+LOG_FORMAT = " %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s"
+
+logging.basicConfig(filename=LOG_FILE, filemode="w", format=LOG_FORMAT, level=LOG_LEVEL)
+
+import time
+from queue import Queue, Empty
+
+import cv2
+import numpy as np
+
+from src.cameras.live_stream import LiveStream
+from src.cameras.process_stream import ProcessStream
+from src.cameras.synchronizer import Synchronizer
+
+CAMERA_COUNTS = [2, 4, 8]
+RESOLUTION = (1280, 720)
+WARM_UP = 2  # seconds
+DURATION = 10  # seconds
+
+
+class DecodingCapture:
+    """Minimal stand-in for cv2.VideoCapture that serves noisy frames"""
+
+    def __init__(self, resolution):
+        width, height = resolution
+        rng = np.random.default_rng()
+        image = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+        _, self.jpeg = cv2.imencode(".jpg", image)
+        self.resolution = resolution
+
+    def isOpened(self):
+        return True
+
+    def grab(self):
+        return True
+
+    def read(self, image=None):
+        frame = cv2.imdecode(self.jpeg, cv2.IMREAD_COLOR)
+        if image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+            frame = image
+        return True, frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.resolution[0]
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.resolution[1]
+        return 0
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        pass
+
+
+class DecodingCaptureFactory:
+    """Picklable so that the capture can be built inside a child process"""
+
+    def __init__(self, resolution):
+        self.resolution = resolution
+
+    def __call__(self):
+        return DecodingCapture(self.resolution)
+
+
+class BenchmarkCamera:
+    """Just enough of the Camera interface for the streams"""
+
+    def __init__(self, port, resolution):
+        self.port = port
+        self.resolution = resolution
+        self.exposure = None
+        self.rotation_count = 0
+        self.capture = DecodingCapture(resolution)
+
+    def connect(self):
+        self.capture = DecodingCapture(self.resolution)
+
+    def disconnect(self):
+        self.capture.release()
+
+
+def build_streams(backend, camera_count):
+    streams = {}
+    for port in range(camera_count):
+        camera = BenchmarkCamera(port, RESOLUTION)
+        if backend == "thread":
+            streams[port] = LiveStream(camera)
+        else:
+            streams[port] = ProcessStream(
+                camera, capture_factory=DecodingCaptureFactory(RESOLUTION)
+            )
+    return streams
+
+
+def bundles_per_second(backend, camera_count):
+    streams = build_streams(backend, camera_count)
+    syncr = Synchronizer(streams, fps_target=None)
+    notice_q = Queue()
+    syncr.subscribe_to_notice(notice_q)
+
+    time.sleep(WARM_UP)
+    # clear out notices from warm up
+    while not notice_q.empty():
+        notice_q.get()
+
+    bundle_count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < DURATION:
+        try:
+            notice_q.get(timeout=1)
+            bundle_count += 1
+        except Empty:
+            pass
+    elapsed = time.perf_counter() - start
+
+    # harvesters are daemon threads blocked on the reels; let them be
+    syncr.stop_event.set()
+    for stream in streams.values():
+        stream.stop()
+        stream.shutter_sync.put("release roll_camera if waiting")
+
+    return bundle_count / elapsed
+
+
+if __name__ == "__main__":
+    results = {}
+    for backend in ["thread", "process"]:
+        for camera_count in CAMERA_COUNTS:
+            rate = bundles_per_second(backend, camera_count)
+            results[(backend, camera_count)] = rate
+            print(f"{backend:>8} backend | {camera_count} cameras | {rate:6.1f} bundles/sec")
+
+    print("\nProcess / thread throughput ratio")
+    for camera_count in CAMERA_COUNTS:
+        ratio = results[("process", camera_count)] / results[("thread", camera_count)]
+        print(f"{camera_count} cameras: {ratio:.2f}x")
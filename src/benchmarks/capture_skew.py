@@ -0,0 +1,65 @@
+# Compare how closely frames line up within a bundle when each stream reads
+# on its own ("read") against grabbing all cameras back-to-back and decoding
+# afterwards ("grab_retrieve"). Synthetic cameras stand in for hardware; their
+# render step plays the part of the decode.
+#
+# run from the repo root with:
+#   python -m src.benchmarks.capture_skew
+
+import logging
+
+LOG_FILE = r"log\capture_skew.log"
+LOG_LEVEL = logging.INFO
+LOG_FORMAT = " %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s"
+
+logging.basicConfig(filename=LOG_FILE, filemode="w", format=LOG_FORMAT, level=LOG_LEVEL)
+
+import time
+
+from src.calibration.charuco import Charuco
+from src.cameras.live_stream import LiveStream
+from src.cameras.synchronizer import Synchronizer, CAPTURE_MODES
+from src.cameras.synthetic_camera import SyntheticArray
+
+CAMERA_COUNT = 4
+RESOLUTION = (640, 480)
+FPS = 10
+WARM_UP = 2  # seconds
+DURATION = 10  # seconds
+
+
+def skew_stats(capture_mode):
+    charuco = Charuco(4, 5, 11, 8.5, square_size_overide_cm=5.4)
+    synthetic_array = SyntheticArray(charuco, CAMERA_COUNT, resolution=RESOLUTION, fps=FPS)
+    streams = {
+        port: LiveStream(cam) for port, cam in synthetic_array.get_cameras().items()
+    }
+    syncr = Synchronizer(streams, fps_target=FPS, capture_mode=capture_mode)
+
+    time.sleep(WARM_UP)
+    syncr.initialize_skew_stats()
+    time.sleep(DURATION)
+    stats = syncr.skew_stats()
+
+    # harvesters are daemon threads blocked on the reels; let them be
+    syncr.stop_event.set()
+    for stream in streams.values():
+        stream.stop()
+        stream.shutter_sync.put("release roll_camera if waiting")
+
+    return stats
+
+
+if __name__ == "__main__":
+    print(f"{CAMERA_COUNT} cameras at {RESOLUTION[0]}x{RESOLUTION[1]}, {FPS} fps target")
+    print(
+        "mode           | bundles | incomplete | dropped | spread mean / p95 / max (ms)"
+    )
+    for capture_mode in CAPTURE_MODES:
+        stats = skew_stats(capture_mode)
+        dropped = sum(stats["dropped_frames"].values())
+        print(
+            f"{capture_mode:14} | {stats['bundles']:7} | {stats['incomplete_bundles']:10} |"
+            f" {dropped:7} | {stats['spread_mean_ms']:6.2f} / {stats['spread_p95_ms']:6.2f}"
+            f" / {stats['spread_max_ms']:6.2f}"
+        )
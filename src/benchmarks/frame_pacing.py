@@ -0,0 +1,85 @@
+# How closely the shutter keeps to fps_target. The bundler used to wait for
+# one period after the last firing, polling with 1 ms sleeps:
+#     while perf_counter() < sync_time + wait_time: sleep(0.001)
+#     sync_time = perf_counter()
+# so every overshoot of the sleep and all the work done between firings was
+# added to the period. The Pacer works to absolute deadlines instead (see
+# pacer.py). Both are run at a range of rates with a few milliseconds of
+# varying work between ticks, standing in for bundling.
+#
+# run from the repo root with:
+#   python -m src.benchmarks.frame_pacing
+
+import logging
+
+LOG_FILE = r"log\frame_pacing.log"
+LOG_LEVEL = logging.INFO
+LOG_FORMAT = " %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s"
+
+logging.basicConfig(filename=LOG_FILE, filemode="w", format=LOG_FORMAT, level=LOG_LEVEL)
+
+import time
+
+import numpy as np
+
+from src.cameras.pacer import Pacer, sleep_overshoot
+
+RATES = [15, 30, 60, 120]
+DURATION = 3  # seconds at each rate
+WORK = 0.003  # most seconds of work between ticks
+
+
+def work(rng):
+    """Busy for a random part of WORK, as bundling would be"""
+    end = time.perf_counter() + rng.uniform(0, WORK)
+    while time.perf_counter() < end:
+        pass
+
+
+def run_polling(fps, rng):
+    ticks = []
+    sync_time = time.perf_counter()
+    end = sync_time + DURATION
+    while time.perf_counter() < end:
+        wait_time = 1 / fps
+        while time.perf_counter() < sync_time + wait_time:
+            time.sleep(0.001)
+        sync_time = time.perf_counter()
+        ticks.append(sync_time)
+        work(rng)
+    return np.array(ticks)
+
+
+def run_pacer(fps, rng):
+    pacer = Pacer(fps)
+    ticks = []
+    end = time.perf_counter() + DURATION
+    while time.perf_counter() < end:
+        pacer.wait()
+        ticks.append(time.perf_counter())
+        work(rng)
+    return np.array(ticks)
+
+
+def report(label, fps, ticks, cpu):
+    # how far each interval strays from the period, in ms
+    jitter = np.abs(np.diff(ticks) - 1 / fps) * 1000
+    achieved = (len(ticks) - 1) / (ticks[-1] - ticks[0])
+    # where the last tick fell against where it was due
+    drift = (ticks[-1] - ticks[0] - (len(ticks) - 1) / fps) * 1000
+    print(
+        f"  {label:<8} {achieved:6.1f} fps | jitter median {np.median(jitter):5.2f} / "
+        f"p95 {np.percentile(jitter, 95):5.2f} ms | drift {drift:7.1f} ms | CPU {100 * cpu / DURATION:3.0f}%"
+    )
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    print(f"time.sleep() overshoot measured at {sleep_overshoot() * 1000:.3f} ms")
+
+    for fps in RATES:
+        print(f"target {fps} fps over {DURATION} sec")
+        for label, run in (("polling", run_polling), ("pacer", run_pacer)):
+            cpu_start = time.process_time()
+            ticks = run(fps, rng)
+            report(label, fps, ticks, time.process_time() - cpu_start)
@@ -0,0 +1,122 @@
+# Cost on the consumer side of carrying frames as JPEG. A stream of synthetic
+# JPEG frames (standing in for an MJPG camera) is recorded and previewed:
+#   - decoded: every frame is decoded at capture, as with passthrough off,
+#     then re-encoded by the mp4 writer
+#   - passthrough: frames stay compressed; the recorder writes the bytes as
+#     they are and only the frames the preview looks at are decoded
+# Then a short synchronized recording is made with passthrough on and read
+# back to check that nothing was lost.
+#
+# run from the repo root with:
+#   python -m src.benchmarks.mjpeg_passthrough
+
+import logging
+
+LOG_FILE = r"log\mjpeg_passthrough.log"
+LOG_LEVEL = logging.INFO
+LOG_FORMAT = " %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s"
+
+logging.basicConfig(filename=LOG_FILE, filemode="w", format=LOG_FORMAT, level=LOG_LEVEL)
+
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import pandas as pd
+
+from src.calibration.charuco import Charuco
+from src.cameras.frame_packet import FramePacket
+from src.cameras.live_stream import LiveStream
+from src.cameras.synchronizer import Synchronizer
+from src.cameras.synthetic_camera import SyntheticArray
+from src.recording.port_writer import MJPEGWriter
+from src.recording.video_recorder import VideoRecorder
+
+RESOLUTION = (1280, 720)
+FRAME_COUNT = 100
+PREVIEW_EVERY = 3  # preview looks at one frame in this many
+CAMERA_COUNT = 3
+FPS = 10
+RECORD_TIME = 3  # seconds
+
+
+def synthetic_jpegs(charuco):
+    cam = SyntheticArray(charuco, 1, resolution=RESOLUTION, fps=None).get_cameras()[0]
+    cam.capture.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+    jpegs = []
+    for _ in range(FRAME_COUNT):
+        _, jpeg = cam.capture.read()
+        jpegs.append(jpeg)
+    return jpegs
+
+
+def consume(jpegs, folder, passthrough):
+    """Seconds spent recording every frame and previewing some of them"""
+    start = time.perf_counter()
+    if passthrough:
+        writer = MJPEGWriter(str(Path(folder, "passthrough.mjpeg")))
+    else:
+        fourcc = cv2.VideoWriter_fourcc(*"MP4V")
+        writer = cv2.VideoWriter(str(Path(folder, "decoded.mp4")), fourcc, FPS, RESOLUTION)
+
+    for index, jpeg in enumerate(jpegs):
+        if passthrough:
+            packet = FramePacket(index, jpeg=jpeg)
+            writer.write_jpeg(packet.jpeg)
+        else:
+            packet = FramePacket(index, frame=cv2.imdecode(jpeg, cv2.IMREAD_COLOR))
+            writer.write(packet.frame)
+
+        if index % PREVIEW_EVERY == 0:
+            preview = packet.frame  # decoded here, and only here, under passthrough
+
+    writer.release()
+    return time.perf_counter() - start
+
+
+def record(charuco, folder):
+    synthetic_array = SyntheticArray(charuco, CAMERA_COUNT, fps=FPS)
+    streams = {}
+    for port, cam in synthetic_array.get_cameras().items():
+        streams[port] = LiveStream(cam)
+        streams[port].set_mjpeg_passthrough()
+
+    syncr = Synchronizer(streams, fps_target=FPS)
+    recorder = VideoRecorder(syncr)
+    recorder.start_recording(folder)
+    time.sleep(RECORD_TIME)
+    recorder.stop_recording()
+    recorder.recording_thread.join()
+
+    syncr.stop_event.set()
+    for stream in streams.values():
+        stream.stop()
+        stream.shutter_sync.put("release roll_camera if waiting")
+
+    history = pd.read_csv(Path(folder, "frame_time_history.csv"))
+    for port in streams:
+        capture = cv2.VideoCapture(str(Path(folder, f"port_{port}.mjpeg")))
+        read_back = 0
+        while capture.read()[0]:
+            read_back += 1
+        recorded = (history["port"] == port).sum()
+        print(f"port {port}: {recorded} frames recorded, {read_back} read back")
+
+
+if __name__ == "__main__":
+    charuco = Charuco(4, 5, 11, 8.5, square_size_overide_cm=5.4)
+    jpegs = synthetic_jpegs(charuco)
+
+    with tempfile.TemporaryDirectory() as folder:
+        for passthrough in (False, True):
+            elapsed = consume(jpegs, folder, passthrough)
+            label = "passthrough" if passthrough else "decoded"
+            print(
+                f"{label:>11}: {1000 * elapsed / FRAME_COUNT:.2f} ms/frame to record "
+                f"{FRAME_COUNT} frames at {RESOLUTION[0]}x{RESOLUTION[1]} "
+                f"and preview 1 in {PREVIEW_EVERY}"
+            )
+
+    with tempfile.TemporaryDirectory() as folder:
+        record(charuco, folder)
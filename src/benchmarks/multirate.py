@@ -0,0 +1,95 @@
+# Bundling cameras that run at different rates: two ports at 30 fps and two
+# at 60 fps, from a generated timing trace with jitter, stalls and drops.
+# The trace is bundled by the Synchronizer as it always has (one layer per
+# firing, every port treated alike) and in multi-rate mode, where a bundle
+# is built for each frame of a 30 fps master port and the 60 fps ports are
+# decimated to the frame nearest in time. Both are replayed as fast as
+# possible, so the bundles are the same on every run, and then in real time.
+#
+# For each the report gives the bundles made, how many of them lacked a
+# frame from some port, what became of each port's frames, and the spread
+# of frame times within bundles.
+#
+# run from the repo root with:
+#   python -m src.benchmarks.multirate
+
+import logging
+
+LOG_FILE = r"log\multirate.log"
+LOG_LEVEL = logging.INFO
+LOG_FORMAT = " %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s"
+
+logging.basicConfig(filename=LOG_FILE, filemode="w", format=LOG_FORMAT, level=LOG_LEVEL)
+
+import time
+from queue import Empty, Queue
+
+from src.cameras.synchronizer import Synchronizer
+from src.cameras.trace_stream import TimingTrace, start_streams
+
+PORT_RATES = {0: 30, 1: 30, 2: 60, 3: 60}
+DURATION = 20  # seconds of generated trace
+REALTIME_DURATION = 5  # seconds
+
+
+def mixed_trace():
+    frame_times = {}
+    for fps in sorted(set(PORT_RATES.values())):
+        ports = [port for port, rate in PORT_RATES.items() if rate == fps]
+        frame_times.update(TimingTrace.generate(ports, fps=fps, duration=DURATION, seed=fps).frame_times)
+    return TimingTrace(frame_times)
+
+
+def replay(trace, realtime, multirate, max_duration=None):
+    streams = trace.build_streams(realtime)
+    syncr = Synchronizer(
+        streams,
+        fps_target=min(PORT_RATES.values()) if realtime else None,
+        port_rates=PORT_RATES if multirate else None,
+    )
+    bundle_q = Queue()
+    syncr.subscribe_to_bundle(bundle_q)
+    start_streams(streams)
+
+    bundles = 0
+    start = time.perf_counter()
+    while max_duration is None or time.perf_counter() - start < max_duration:
+        try:
+            bundle = bundle_q.get(timeout=1)
+        except Empty:
+            break  # every port has come to the end of the trace
+        bundles += 1
+
+    syncr.stop_event.set()
+    for stream in streams.values():
+        stream.stop()
+
+    # the last bundle seen carries the rate each port was delivering at
+    return bundles, syncr.skew_stats(), bundle.port_fps
+
+
+def report(label, bundles, stats, port_fps):
+    print(
+        f"  {label:<11} {bundles} bundles, {stats['incomplete_bundles']} incomplete, "
+        f"spread mean {stats['spread_mean_ms']:.1f} ms / p95 {stats['spread_p95_ms']:.1f} ms"
+    )
+    for port in PORT_RATES:
+        fps = port_fps[port]
+        print(
+            f"    port {port} ({PORT_RATES[port]} fps, delivering {fps or 0:5.1f}): "
+            f"{stats['dropped_frames'][port]} dropped, {stats['decimated_frames'][port]} decimated"
+        )
+
+
+if __name__ == "__main__":
+    trace = mixed_trace()
+    for port, summary in trace.summary().items():
+        print(f"port {port}: {summary['frames']} frames, interval median {summary['interval_median_ms']:.1f} ms")
+
+    print("as fast as possible")
+    for label, multirate in (("single rate", False), ("multi-rate", True)):
+        report(label, *replay(trace, realtime=False, multirate=multirate))
+
+    print(f"real time ({REALTIME_DURATION} sec)")
+    for label, multirate in (("single rate", False), ("multi-rate", True)):
+        report(label, *replay(trace, realtime=True, multirate=multirate, max_duration=REALTIME_DURATION))
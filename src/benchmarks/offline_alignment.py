@@ -0,0 +1,71 @@
+# Offline alignment of a timing trace against the live Synchronizer fed by
+# the same trace (replayed as fast as possible, see trace_replay.py). Reports
+# the time each takes and the bundles they come up with. The Synchronizer
+# drops frames it judges out of sync; the alignment keeps every frame, so
+# more of its bundles can be incomplete.
+#
+# With no argument a trace with jitter, stalls and drops is generated from a
+# fixed seed; otherwise the frame_time_history.csv of a recording is used.
+#
+# run from the repo root with:
+#   python -m src.benchmarks.offline_alignment [path/to/frame_time_history.csv]
+
+import logging
+
+LOG_FILE = r"log\offline_alignment_benchmark.log"
+LOG_LEVEL = logging.INFO
+LOG_FORMAT = " %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s"
+
+logging.basicConfig(filename=LOG_FILE, filemode="w", format=LOG_FORMAT, level=LOG_LEVEL)
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.benchmarks.trace_replay import replay
+from src.cameras.trace_stream import TimingTrace
+from src.recording.offline_alignment import align, alignment_stats
+
+PORTS = [0, 1, 2, 3]
+FPS = 30
+DURATION = 60  # seconds of generated trace
+
+
+def report(label, seconds, stats):
+    print(
+        f"{label}: {seconds:.3f} sec, {stats['bundles']} bundles, "
+        f"{stats['incomplete_bundles']} incomplete, "
+        f"spread mean {stats['spread_mean_ms']:.1f} ms / p95 {stats['spread_p95_ms']:.1f} ms "
+        f"/ max {stats['spread_max_ms']:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        trace = TimingTrace.from_history(Path(sys.argv[1]))
+    else:
+        trace = TimingTrace.generate(PORTS, fps=FPS, duration=DURATION)
+    frames = sum(len(times) for times in trace.frame_times.values())
+    print(f"{len(trace.ports)} ports, {frames} frames over {trace.duration:.1f} sec")
+
+    start = time.perf_counter()
+    _, live_stats = replay(trace, realtime=False)
+    live_time = time.perf_counter() - start - 1  # less the wait that notices the end of the trace
+    report("live synchronizer", live_time, live_stats)
+    print(f"  frames dropped as out of sync: {sum(live_stats['dropped_frames'].values())}")
+
+    start = time.perf_counter()
+    bundle_indices = align(trace.frame_times)
+    offline_time = time.perf_counter() - start
+
+    table = pd.DataFrame(
+        {
+            "bundle_index": np.concatenate([bundle_indices[port] for port in trace.ports]),
+            "frame_time": np.concatenate([trace.frame_times[port] for port in trace.ports]),
+        }
+    )
+    report("offline alignment", offline_time, alignment_stats(table, trace.ports))
+    print(f"  speedup: {live_time / offline_time:.0f}x")
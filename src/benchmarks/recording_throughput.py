@@ -0,0 +1,172 @@
+# Frames recorded per second from several cameras, with every port's video
+# encoded to mp4:
+#   - serially: one thread writing the ports of each bundle in turn, as the
+#     VideoRecorder used to
+#   - by the VideoRecorder with a writer thread per port
+#   - by the VideoRecorder with a writer process per port
+# Bundles of synthetic frames (with noise added, so that they cost about as
+# much to encode as a camera's) are put out at a fixed rate for a fixed time,
+# as a Synchronizer would, and never wait on the recorder. Reported for each
+# are the frames that made it into the videos and the frames lost for each
+# port, along with how long the recorder took to finish once capture had
+# stopped. Writing ports side by side only pays where there are cores for
+# the writers to run on; with one, it just adds the cost of handing over.
+#
+# run from the repo root with:
+#   python -m src.benchmarks.recording_throughput
+
+import logging
+
+LOG_FILE = r"log\recording_throughput.log"
+LOG_LEVEL = logging.INFO
+LOG_FORMAT = " %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s"
+
+logging.basicConfig(filename=LOG_FILE, filemode="w", format=LOG_FORMAT, level=LOG_LEVEL)
+
+import os
+import tempfile
+import time
+from pathlib import Path
+from queue import Empty
+from threading import Thread
+
+import cv2
+import numpy as np
+
+from src.calibration.charuco import Charuco
+from src.cameras.frame_bundle import FrameBundle
+from src.cameras.frame_packet import FrameData, FramePacket
+from src.cameras.pacer import Pacer
+from src.cameras.subscription import Subscription
+from src.cameras.synthetic_camera import SyntheticArray
+from src.recording.video_recorder import RECORD_QUEUE_DEPTH, VideoRecorder
+
+PORTS = 4
+RESOLUTION = (1280, 720)
+FPS = 30
+DURATION = 5  # seconds of capture
+FRAME_POOL = 30  # distinct frames per port, cycled through
+NOISE = 4  # standard deviation of the sensor noise added to the rendered frames
+
+
+class PacedSource:
+    """Puts out bundles of prepared frames at a steady rate, with enough of a
+    Synchronizer's interface for the VideoRecorder"""
+
+    def __init__(self, frames):
+        self.frames = frames  # port: [frame]
+        self.streams = {port: _Stream() for port in frames}
+        self.fps_target = FPS
+        self.bundle_subscribers = []
+
+    def subscribe_to_bundle(self, q):
+        self.bundle_subscribers.append(q)
+
+    def release_bundle_q(self, q):
+        self.bundle_subscribers.remove(q)
+
+    def play(self):
+        pacer = Pacer(FPS)
+        for index in range(FPS * DURATION):
+            pacer.wait()
+            frame_time = time.perf_counter()
+            frames = {}
+            for port, port_frames in self.frames.items():
+                packet = FramePacket(frame_time, frame=port_frames[index % len(port_frames)])
+                frames[port] = FrameData(
+                    port=port, packet=packet, frame_index=index, frame_time=frame_time, bundle_index=index
+                )
+            bundle = FrameBundle(frames, index)
+            for q in self.bundle_subscribers:
+                q.put(bundle)
+
+
+class _Stream:
+    class camera:
+        resolution = RESOLUTION
+
+
+def noisy(frame, rng):
+    """Rendered frames are flat enough to encode far faster than a camera's"""
+    noise = rng.normal(0, NOISE, frame.shape)
+    return np.clip(frame + noise, 0, 255).astype(np.uint8)
+
+
+def record_serially(source, folder):
+    fourcc = cv2.VideoWriter_fourcc(*"MP4V")
+    writers = {
+        port: cv2.VideoWriter(str(Path(folder, f"serial_{port}.mp4")), fourcc, FPS, RESOLUTION)
+        for port in source.frames
+    }
+    bundle_q = Subscription(RECORD_QUEUE_DEPTH, "drop_oldest", name="serial recorder")
+    source.subscribe_to_bundle(bundle_q)
+    written = {port: 0 for port in source.frames}
+    capturing = [True]
+
+    def write_worker():
+        while capturing[0] or bundle_q.qsize() > 0:
+            try:
+                bundle = bundle_q.get(timeout=0.1)
+            except Empty:
+                continue
+            for port, frame_data in bundle.items():
+                writers[port].write(frame_data["packet"].frame)
+                written[port] += 1
+
+    worker = Thread(target=write_worker, daemon=True)
+    worker.start()
+    source.play()
+    capturing[0] = False
+    capture_end = time.perf_counter()
+    worker.join()
+    for writer in writers.values():
+        writer.release()
+    finish = time.perf_counter() - capture_end
+
+    lost = {port: bundle_q.dropped for port in source.frames}
+    return written, lost, finish
+
+
+def record_per_port(source, folder, kind):
+    recorder = VideoRecorder(source, writer=kind)
+    recorder.start_recording(folder)
+    while not recorder.port_writers or len(source.bundle_subscribers) == 0:
+        time.sleep(0.01)  # wait for the recorder to subscribe
+
+    source.play()
+    capture_end = time.perf_counter()
+    recorder.stop_recording()
+    recorder.recording_thread.join()
+    finish = time.perf_counter() - capture_end
+
+    stats = recorder.stats()
+    written = {port: port_stats["written"] for port, port_stats in stats.items()}
+    lost = {
+        port: FPS * DURATION - port_stats["offered"] + port_stats["dropped"] for port, port_stats in stats.items()
+    }
+    return written, lost, finish
+
+
+def report(label, written, lost, finish):
+    print(
+        f"  {label:<18} {sum(written.values()) / DURATION:6.1f} frames/sec kept "
+        f"| per port kept {min(written.values())}-{max(written.values())} "
+        f"lost {min(lost.values())}-{max(lost.values())} | finished {finish:.2f} sec after capture"
+    )
+
+
+if __name__ == "__main__":
+    charuco = Charuco(4, 5, 11, 8.5, aruco_scale=0.75, square_size_overide_cm=5.25, inverted=True)
+    cameras = SyntheticArray(charuco, PORTS, resolution=RESOLUTION, fps=None).get_cameras()
+    rng = np.random.default_rng(0)
+    frames = {port: [noisy(cam.capture.read()[1], rng) for _ in range(FRAME_POOL)] for port, cam in cameras.items()}
+
+    print(
+        f"{PORTS} ports at {RESOLUTION[0]}x{RESOLUTION[1]} and {FPS} fps for {DURATION} sec "
+        f"({PORTS * FPS * DURATION} frames), {os.cpu_count()} CPUs"
+    )
+    with tempfile.TemporaryDirectory() as folder:
+        report("serial", *record_serially(PacedSource(frames), folder))
+    for kind in ("thread", "process"):
+        with tempfile.TemporaryDirectory() as folder:
+            report(f"per port {kind}", *record_per_port(PacedSource(frames), folder, kind))
@@ -0,0 +1,85 @@
+# Change the resolution of one camera while the array is being synchronized
+# and check that the other cameras keep delivering bundles in the meantime.
+# Synthetic cameras are given a delay on opening to stand in for the time a
+# real device takes to reconnect.
+#
+# run from the repo root with:
+#   python -m src.benchmarks.resolution_switch
+
+import logging
+
+LOG_FILE = r"log\resolution_switch.log"
+LOG_LEVEL = logging.INFO
+LOG_FORMAT = " %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s"
+
+logging.basicConfig(filename=LOG_FILE, filemode="w", format=LOG_FORMAT, level=LOG_LEVEL)
+
+import time
+from queue import Queue, Empty
+
+from src.calibration.charuco import Charuco
+from src.cameras.live_stream import LiveStream
+from src.cameras.synchronizer import Synchronizer
+from src.cameras.synthetic_camera import SyntheticArray
+
+CAMERA_COUNT = 4
+FPS = 10
+OPEN_DELAY = 1.0  # seconds
+SWITCH_PORT = 0
+RESOLUTIONS = [(1280, 720), (640, 480)]
+SETTLE = 3  # seconds between switches
+
+
+def count_bundles(bundle_q, duration):
+    """Bundles received over the duration, and how many had a frame from
+    the switching port"""
+    bundles = 0
+    with_switch_port = 0
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        try:
+            bundle = bundle_q.get(timeout=0.1)
+        except Empty:
+            continue
+        bundles += 1
+        if bundle[SWITCH_PORT] is not None:
+            with_switch_port += 1
+    return bundles, with_switch_port
+
+
+if __name__ == "__main__":
+    charuco = Charuco(4, 5, 11, 8.5, square_size_overide_cm=5.4)
+    synthetic_array = SyntheticArray(charuco, CAMERA_COUNT, fps=FPS, open_delay=OPEN_DELAY)
+    streams = {port: LiveStream(cam) for port, cam in synthetic_array.get_cameras().items()}
+
+    syncr = Synchronizer(streams, fps_target=FPS)
+    bundle_q = Queue()
+    syncr.subscribe_to_bundle(bundle_q)
+
+    resolution_q = Queue()
+    streams[SWITCH_PORT].subscribe_to_resolution_change(resolution_q)
+
+    time.sleep(SETTLE)
+    while not bundle_q.empty():
+        bundle_q.get()
+
+    bundles, _ = count_bundles(bundle_q, SETTLE)
+    print(f"steady state: {bundles / SETTLE:.1f} bundles/sec")
+
+    for resolution in RESOLUTIONS:
+        switch = streams[SWITCH_PORT].change_resolution(resolution, block=False)
+        bundles, with_switch_port = count_bundles(bundle_q, SETTLE)
+        switch.join()
+        elapsed = resolution_q.get(timeout=SETTLE)["time_to_first_frame"]
+
+        print(
+            f"switch port {SWITCH_PORT} to {resolution[0]}x{resolution[1]}: "
+            f"first frame after {elapsed:.2f} sec; "
+            f"{bundles / SETTLE:.1f} bundles/sec over the next {SETTLE} sec, "
+            f"{with_switch_port} with port {SWITCH_PORT}"
+        )
+
+    syncr.stop_event.set()
+    for stream in streams.values():
+        stream.stop()
+        stream.shutter_sync.put("release roll_camera if waiting")
@@ -0,0 +1,85 @@
+# Time spent per frame when several consumers work on the same frame, as the
+# StereoCalibrator, PairedPointStream and stereo preview do with a bundle:
+#   - separate: each consumer is handed the bare image and converts it itself
+#   - shared: consumers are handed the FramePacket and share its cached gray
+#     image and pyramid levels
+# Conversions are timed on their own as well as with the corner detection
+# that follows them.
+#
+# run from the repo root with:
+#   python -m src.benchmarks.shared_preprocessing
+
+import logging
+
+LOG_FILE = r"log\shared_preprocessing.log"
+LOG_LEVEL = logging.INFO
+LOG_FORMAT = " %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s"
+
+logging.basicConfig(filename=LOG_FILE, filemode="w", format=LOG_FORMAT, level=LOG_LEVEL)
+
+import time
+
+import cv2
+
+from src.calibration.charuco import Charuco
+from src.calibration.corner_tracker import CornerTracker
+from src.cameras.frame_packet import FramePacket
+from src.cameras.synthetic_camera import SyntheticArray
+
+RESOLUTION = (1920, 1080)
+FRAME_COUNT = 30
+TRACKER_COUNT = 2  # consumers running corner detection on every frame
+THUMBNAIL_HEIGHT = 250
+PREVIEW_LEVEL = 2  # pyramid level a thumbnail of that size is built from
+
+
+def preview(image):
+    """Thumbnail as built by the StereoFrameBuilder: copied to draw on,
+    mirrored, padded square and resized"""
+    image = cv2.flip(image.copy(), 1)
+    pad = (image.shape[1] - image.shape[0]) // 2
+    image = cv2.copyMakeBorder(image, pad, pad, 0, 0, cv2.BORDER_CONSTANT, value=[0, 0, 0])
+    return cv2.resize(image, (THUMBNAIL_HEIGHT, THUMBNAIL_HEIGHT))
+
+
+def preprocess(frames, shared):
+    """Just the conversions, without the detection that follows them"""
+    start = time.perf_counter()
+    for frame_time, frame in enumerate(frames):
+        packet = FramePacket(frame_time, frame=frame)
+        for _ in range(TRACKER_COUNT):
+            if shared:
+                gray = packet.inverted_gray
+            else:
+                gray = ~cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        preview(packet.pyramid(PREVIEW_LEVEL) if shared else frame)
+    return time.perf_counter() - start
+
+
+def consume(frames, trackers, shared):
+    start = time.perf_counter()
+    for frame_time, frame in enumerate(frames):
+        packet = FramePacket(frame_time, frame=frame)
+        for tracker in trackers:
+            tracker.get_corners(packet if shared else frame)
+        preview(packet.pyramid(PREVIEW_LEVEL) if shared else frame)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    charuco = Charuco(4, 5, 11, 8.5, square_size_overide_cm=5.4)
+    cam = SyntheticArray(charuco, 1, resolution=RESOLUTION, fps=None).get_cameras()[0]
+    frames = [cam.capture.read()[1] for _ in range(FRAME_COUNT)]
+    trackers = [CornerTracker(charuco) for _ in range(TRACKER_COUNT)]
+
+    consume(frames, trackers, shared=False)  # warm up
+
+    for shared in (False, True):
+        label = "shared" if shared else "separate"
+        conversions = preprocess(frames, shared)
+        elapsed = consume(frames, trackers, shared)
+        print(
+            f"{label:>8}: {1000 * conversions / FRAME_COUNT:.2f} ms/frame converting, "
+            f"{1000 * elapsed / FRAME_COUNT:.2f} ms/frame in total for {TRACKER_COUNT} "
+            f"corner trackers and a preview at {RESOLUTION[0]}x{RESOLUTION[1]}"
+        )
@@ -0,0 +1,80 @@
+# How far apart do the stream loops wake up when the shutter fires? Compares
+# the old trigger (a "fire" put on one queue per port, one after another)
+# with the shared Shutter. Each "stream" here is a thread that waits on its
+# trigger and then sleeps briefly in place of reading a frame.
+#
+# run from the repo root with:
+#   python -m src.benchmarks.shutter_wake
+
+import logging
+
+LOG_FILE = r"log\shutter_wake.log"
+LOG_LEVEL = logging.INFO
+LOG_FORMAT = " %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s"
+
+logging.basicConfig(filename=LOG_FILE, filemode="w", format=LOG_FORMAT, level=LOG_LEVEL)
+
+import time
+from queue import Queue
+from threading import Thread, Event
+
+import numpy as np
+
+from src.cameras.shutter import Shutter
+
+PORT_COUNTS = [2, 4, 8, 16]
+FIRINGS = 200
+PERIOD = 0.02  # seconds between firings
+READ_TIME = 0.005  # seconds each stream spends "reading" after waking
+
+
+def stream_loop(trigger, wake_times, stop_event):
+    while not stop_event.is_set():
+        trigger.get()
+        wake_times.append(time.perf_counter())
+        time.sleep(READ_TIME)
+
+
+def wake_spreads(trigger_type, port_count):
+    """Milliseconds between the first and last stream waking for each firing"""
+    stop_event = Event()
+    shutter = Shutter()
+    if trigger_type == "queues":
+        triggers = [Queue() for _ in range(port_count)]
+    else:
+        triggers = [shutter.handle(port) for port in range(port_count)]
+
+    wake_times = [[] for _ in range(port_count)]
+    threads = [
+        Thread(target=stream_loop, args=(trigger, wakes, stop_event), daemon=True)
+        for trigger, wakes in zip(triggers, wake_times)
+    ]
+    for t in threads:
+        t.start()
+
+    for _ in range(FIRINGS):
+        time.sleep(PERIOD)
+        if trigger_type == "queues":
+            for q in triggers:
+                q.put("fire")
+        else:
+            shutter.fire()
+
+    time.sleep(PERIOD)
+    stop_event.set()
+    for trigger in triggers:
+        trigger.put("stop")
+
+    wakes = np.array([w[:FIRINGS] for w in wake_times])
+    return (wakes.max(axis=0) - wakes.min(axis=0)) * 1000
+
+
+if __name__ == "__main__":
+    print("trigger | ports | wake spread mean / p95 / max (ms)")
+    for port_count in PORT_COUNTS:
+        for trigger_type in ["queues", "shutter"]:
+            spreads = wake_spreads(trigger_type, port_count)
+            print(
+                f"{trigger_type:7} | {port_count:5} | {np.mean(spreads):6.3f} /"
+                f" {np.percentile(spreads, 95):6.3f} / {np.max(spreads):6.3f}"
+            )
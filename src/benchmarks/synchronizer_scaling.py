@@ -0,0 +1,115 @@
+# How the Synchronizer scales with the number of cameras, from 2 to 32.
+#   - core: deciding which frames go in a layer, timed on its own. The
+#     vectorized assign_frames is compared against the per-port loops it
+#     replaced (kept here as the reference), and checked to agree with them
+#   - end to end: a generated timing trace replayed as fast as possible
+#     through a Synchronizer (see trace_stream.py), reporting bundles/sec and
+#     CPU time per bundle across every thread of the process
+#
+# run from the repo root with:
+#   python -m src.benchmarks.synchronizer_scaling
+
+import logging
+
+LOG_FILE = r"log\synchronizer_scaling.log"
+LOG_LEVEL = logging.INFO
+LOG_FORMAT = " %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s"
+
+logging.basicConfig(filename=LOG_FILE, filemode="w", format=LOG_FORMAT, level=LOG_LEVEL)
+
+import time
+from queue import Queue, Empty
+
+import numpy as np
+
+from src.cameras.synchronizer import Synchronizer, assign_frames
+from src.cameras.trace_stream import TimingTrace, start_streams
+
+PORT_COUNTS = [2, 4, 8, 16, 32]
+FPS = 30
+LAYERS = 2000  # layers assigned by the core comparison
+DURATION = 10  # seconds of trace replayed end to end
+
+
+def reference_assignment(current, upcoming):
+    """Frame assignment as the bundler used to do it, one port at a time"""
+    ports = range(len(current))
+    assigned = []
+    for port in ports:
+        earliest_next = min((upcoming[p] for p in ports if p != port), default=np.inf)
+        latest_current = max((current[p] for p in ports if p != port), default=-np.inf)
+        frame_time = current[port]
+        if frame_time > earliest_next:
+            assigned.append(False)
+        elif earliest_next - frame_time < frame_time - latest_current:
+            assigned.append(False)
+        else:
+            assigned.append(True)
+    return np.array(assigned)
+
+
+def time_core(port_count, rng):
+    """Microseconds per layer for the reference and vectorized assignment"""
+    layers = []
+    for _ in range(LAYERS):
+        current = rng.normal(0, 0.005, port_count)
+        upcoming = current + 1 / FPS + rng.normal(0, 0.005, port_count)
+        layers.append((current, upcoming))
+
+    start = time.perf_counter()
+    reference = [reference_assignment(current, upcoming) for current, upcoming in layers]
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectorized = [assign_frames(current, upcoming)[0] for current, upcoming in layers]
+    vectorized_time = time.perf_counter() - start
+
+    agree = all(np.array_equal(a, b) for a, b in zip(reference, vectorized))
+    return 1e6 * reference_time / LAYERS, 1e6 * vectorized_time / LAYERS, agree
+
+
+def time_end_to_end(port_count):
+    """Bundles per second and CPU milliseconds per bundle"""
+    trace = TimingTrace.generate(list(range(port_count)), fps=FPS, duration=DURATION)
+    streams = trace.build_streams(realtime=False)
+    syncr = Synchronizer(streams, fps_target=None)
+    bundle_q = Queue()
+    syncr.subscribe_to_bundle(bundle_q)
+
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    start_streams(streams)
+
+    bundles = 0
+    last_bundle = start
+    while True:
+        try:
+            bundle_q.get(timeout=1)
+        except Empty:
+            break  # end of the trace
+        bundles += 1
+        last_bundle = time.perf_counter()
+    cpu = time.process_time() - cpu_start  # the idle wait at the end costs none
+
+    syncr.stop_event.set()
+    for stream in streams.values():
+        stream.stop()
+
+    return bundles / (last_bundle - start), 1000 * cpu / bundles
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+
+    print("core frame assignment, microseconds per layer")
+    for port_count in PORT_COUNTS:
+        reference, vectorized, agree = time_core(port_count, rng)
+        print(
+            f"{port_count:>3} ports: per-port loops {reference:7.1f} | "
+            f"vectorized {vectorized:6.1f} | same result: {agree}"
+        )
+
+    print("end to end, trace replayed as fast as possible")
+    for port_count in PORT_COUNTS:
+        rate, cpu = time_end_to_end(port_count)
+        print(f"{port_count:>3} ports: {rate:7.1f} bundles/sec, {cpu:.2f} ms CPU per bundle")
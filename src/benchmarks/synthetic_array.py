@@ -0,0 +1,81 @@
+# Load test of the synchronizer and stereocalibrator against an array of
+# synthetic cameras. Because the true extrinsics of the array are known, the
+# stereocalibration output can be scored against ground truth.
+#
+# run from the repo root with:
+#   python -m src.benchmarks.synthetic_array
+
+import logging
+
+LOG_FILE = r"log\synthetic_array.log"
+LOG_LEVEL = logging.INFO
+LOG_FORMAT = " %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s"
+
+logging.basicConfig(filename=LOG_FILE, filemode="w", format=LOG_FORMAT, level=LOG_LEVEL)
+
+import time
+from queue import Queue, Empty
+
+import cv2
+import numpy as np
+
+from src.calibration.charuco import Charuco
+from src.calibration.corner_tracker import CornerTracker
+from src.calibration.stereocalibrator import StereoCalibrator
+from src.cameras.live_stream import LiveStream
+from src.cameras.synchronizer import Synchronizer
+from src.cameras.synthetic_camera import SyntheticArray
+
+CAMERA_COUNT = 8
+FPS_TARGET = 10
+TIME_LIMIT = 120  # seconds
+
+
+def rotation_error_degrees(rotation, true_rotation):
+    rvec, _ = cv2.Rodrigues(np.array(rotation) @ np.array(true_rotation).T)
+    return np.degrees(np.linalg.norm(rvec))
+
+
+if __name__ == "__main__":
+    charuco = Charuco(
+        4, 5, 11, 8.5, aruco_scale=0.75, square_size_overide_cm=5.25, inverted=True
+    )
+
+    print(f"Building {CAMERA_COUNT} synthetic cameras...")
+    synthetic_array = SyntheticArray(charuco, CAMERA_COUNT)
+    cameras = synthetic_array.get_cameras()
+    truth = synthetic_array.ground_truth_config()
+
+    streams = {port: LiveStream(cam) for port, cam in cameras.items()}
+    syncr = Synchronizer(streams, fps_target=FPS_TARGET)
+    stereocal = StereoCalibrator(syncr, CornerTracker(charuco))
+
+    notice_q = Queue()
+    syncr.subscribe_to_notice(notice_q)
+
+    bundle_count = 0
+    start = time.perf_counter()
+    while stereocal.uncalibrated_pairs and time.perf_counter() - start < TIME_LIMIT:
+        try:
+            notice_q.get(timeout=1)
+            bundle_count += 1
+        except Empty:
+            pass
+    elapsed = time.perf_counter() - start
+
+    print(f"{bundle_count} bundles in {elapsed:.1f} sec: {bundle_count/elapsed:.1f} bundles/sec")
+    print(f"Uncalibrated pairs remaining: {stereocal.uncalibrated_pairs}")
+
+    print("\npair   | grids | RMSE  | rotation error (deg) | translation error (mm)")
+    for pair, output in stereocal.stereo_outputs.items():
+        if output["rotation"] is None:
+            continue
+        true_pair = truth[f"stereo_{pair[0]}_{pair[1]}"]
+        rotation_error = rotation_error_degrees(output["rotation"], true_pair["rotation"])
+        translation_error = 1000 * np.linalg.norm(
+            np.array(output["translation"]) - np.array(true_pair["translation"])
+        )
+        print(
+            f"{str(pair):6} | {output['grid_count']:5} | {output['RMSE']:.3f} |"
+            f" {rotation_error:20.3f} | {translation_error:22.2f}"
+        )
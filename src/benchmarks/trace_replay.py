@@ -0,0 +1,88 @@
+# Run the Synchronizer against a timing trace and report how well it bundles.
+# With no argument a trace with jitter, stalls and drops is generated from a
+# fixed seed; otherwise the frame_time_history.csv of a recording is replayed.
+#
+# The trace is replayed as fast as possible twice to show that the bundles
+# come out the same every time, so a change to the Synchronizer can be judged
+# on the difference it makes alone. It is then replayed in real time for a
+# few seconds to exercise the pacing as well.
+#
+# run from the repo root with:
+#   python -m src.benchmarks.trace_replay [path/to/frame_time_history.csv]
+
+import logging
+
+LOG_FILE = r"log\trace_replay.log"
+LOG_LEVEL = logging.INFO
+LOG_FORMAT = " %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s"
+
+logging.basicConfig(filename=LOG_FILE, filemode="w", format=LOG_FORMAT, level=LOG_LEVEL)
+
+import sys
+import time
+from pathlib import Path
+from queue import Queue, Empty
+
+from src.cameras.synchronizer import Synchronizer
+from src.cameras.trace_stream import TimingTrace, start_streams
+
+PORTS = [0, 1, 2, 3]
+FPS = 30
+DURATION = 20  # seconds of generated trace
+REALTIME_DURATION = 5  # seconds
+
+
+def replay(trace, realtime, max_duration=None):
+    """Bundles produced from the trace, as the frame times of each port"""
+    streams = trace.build_streams(realtime)
+    syncr = Synchronizer(streams, fps_target=FPS if realtime else None)
+    bundle_q = Queue()
+    syncr.subscribe_to_bundle(bundle_q)
+    start_streams(streams)
+
+    bundles = []
+    start = time.perf_counter()
+    while max_duration is None or time.perf_counter() - start < max_duration:
+        try:
+            bundle = bundle_q.get(timeout=1)
+        except Empty:
+            break  # every port has come to the end of the trace
+        bundles.append(
+            tuple(None if frame_data is None else frame_data["frame_time"] for frame_data in bundle.values())
+        )
+
+    syncr.stop_event.set()
+    for stream in streams.values():
+        stream.stop()
+
+    return bundles, syncr.skew_stats()
+
+
+def report(label, bundles, stats):
+    print(
+        f"{label}: {len(bundles)} bundles, {stats['incomplete_bundles']} incomplete, "
+        f"frames dropped as out of sync {stats['dropped_frames']}, "
+        f"spread mean {stats['spread_mean_ms']:.1f} ms / p95 {stats['spread_p95_ms']:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        trace = TimingTrace.from_history(Path(sys.argv[1]))
+    else:
+        trace = TimingTrace.generate(PORTS, fps=FPS, duration=DURATION)
+
+    for port, summary in trace.summary().items():
+        print(
+            f"port {port}: {summary['frames']} frames, interval median "
+            f"{summary['interval_median_ms']:.1f} ms / max {summary['interval_max_ms']:.1f} ms, "
+            f"{summary['gaps']} gaps"
+        )
+
+    first_bundles, stats = replay(trace, realtime=False)
+    report("as fast as possible", first_bundles, stats)
+    second_bundles, _ = replay(trace, realtime=False)
+    print(f"second replay gives identical bundles: {first_bundles == second_bundles}")
+
+    bundles, stats = replay(trace, realtime=True, max_duration=REALTIME_DURATION)
+    report(f"real time ({REALTIME_DURATION} sec)", bundles, stats)
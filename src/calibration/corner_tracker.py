@@ -19,6 +19,7 @@ import numpy as np
 
 import src.calibration.draw_charuco
 from src.calibration.charuco import Charuco
+from src.cameras.frame_packet import FramePacket
 
 
 class CornerTracker:
@@ -36,50 +37,53 @@ class CornerTracker:
 
     def get_corners(self, frame):
         """Will check for charuco corners in the frame, if it doesn't find any, 
-        then it will look for corners in the mirror image of the frame"""
+        then it will look for corners in the mirror image of the frame.
 
-        self.ids = np.array([])
-        self.img_loc = np.array([])
-        self.frame = frame
+        The frame may be a FramePacket, in which case the gray image is
+        shared with any other consumer of the same frame.
+
+        Nothing about the frame is kept on the tracker, so one tracker can
+        work on the frames of several ports at once (see bundle_stages.py)"""
+
+        if not isinstance(frame, FramePacket):
+            frame = FramePacket(None, frame=frame)
 
         # invert the frame for detection if needed
-        self.gray = cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY)  # convert to gray
         if self.charuco.inverted:
-            self.gray = ~self.gray  # invert
+            gray = frame.inverted_gray
+        else:
+            gray = frame.gray
 
-        self.find_corners_single_frame(mirror=False)
-        # print(self._frame_corner_ids)
-        if not self.ids.any():
+        ids, img_loc = self.find_corners_single_frame(gray, mirror=False)
+        # print(_frame_corner_ids)
+        if not ids.any():
             # print("Checking mirror image")
-            self.gray = cv2.flip(self.gray, 1)
-            self.find_corners_single_frame(mirror=True)
+            ids, img_loc = self.find_corners_single_frame(cv2.flip(gray, 1), mirror=True)
 
-        return self.ids, self.img_loc, self.board_loc
+        return ids, img_loc, self.board_loc(ids)
 
-    def find_corners_single_frame(self, mirror):
+    def find_corners_single_frame(self, gray, mirror):
+        ids = np.array([])
+        img_loc = np.array([])
 
         # detect if aruco markers are present
         aruco_corners, aruco_ids, rejected = cv2.aruco.detectMarkers(
-            self.gray, self.dictionary
+            gray, self.dictionary
         )
 
-        frame_width = self.frame.shape[1]  # used for flipping mirrored corners back
-
-        # correct the mirror frame before putting text on it if it's flipped
-        if mirror:
-            self.frame = cv2.flip(self.frame, 1)
+        frame_width = gray.shape[1]  # used for flipping mirrored corners back
 
         # if so, then interpolate to the Charuco Corners and return what you found
         if len(aruco_corners) > 3:
             (success, _img_loc, _ids,) = cv2.aruco.interpolateCornersCharuco(
-                aruco_corners, aruco_ids, self.gray, self.board
+                aruco_corners, aruco_ids, gray, self.board
             )
 
             # This occasionally errors out...
             # only offers possible refinement so if it fails, just move along
             try:
                 _img_loc = cv2.cornerSubPix(
-                    self.gray,
+                    gray,
                     _img_loc,
                     self.conv_size,
                     (-1, -1),
@@ -89,19 +93,19 @@ class CornerTracker:
                 pass
 
             if success:
-                # assign to tracker
-                self.ids = _ids
-                self.img_loc = _img_loc
+                ids = _ids
+                img_loc = _img_loc
 
                 # flip coordinates if mirrored image fed in
                 if mirror:
-                    self.img_loc[:, :, 0] = frame_width - self.img_loc[:, :, 0]
+                    img_loc[:, :, 0] = frame_width - img_loc[:, :, 0]
+
+        return ids, img_loc
 
-    @property
-    def board_loc(self):
+    def board_loc(self, ids):
         """Objective position of charuco corners in a board frame of reference"""
-        if self.ids.any():
-            return self.charuco.board.chessboardCorners[self.ids, :]
+        if ids.any():
+            return self.charuco.board.chessboardCorners[ids, :]
         else:
             return np.array([])
 
@@ -44,6 +44,11 @@ class MonoCalibrator:
 
         self.initialize_grid_history()
 
+        # the grid history is started over whenever the resolution changes
+        self.resolution_change_q = Queue()
+        self.pending_resolution_changes = []
+        self.stream.subscribe_to_resolution_change(self.resolution_change_q)
+
         self.last_calibration_time = (
             time.perf_counter()
         )  # need to initialize to *something*
@@ -77,6 +82,18 @@ class MonoCalibrator:
     def stop(self):
         self.stop_event.set()
         self.thread.join()
+        self.stream.release_resolution_q(self.resolution_change_q)
+
+    def check_resolution_change(self, frame_time):
+        """Start the grid history over once frames at a new resolution arrive"""
+        while not self.resolution_change_q.empty():
+            self.pending_resolution_changes.append(self.resolution_change_q.get())
+
+        for change in self.pending_resolution_changes.copy():
+            if frame_time >= change["first_frame_time"]:
+                logging.info(f"Resolution at port {self.port} changed to {change['resolution']}")
+                self.pending_resolution_changes.remove(change)
+                self.initialize_grid_history()
         
     def collect_corners(self):
         """
@@ -86,17 +103,26 @@ class MonoCalibrator:
         that enough time has past since the last set was recorded
 
         """
-        # wait for camera to start rolling
         logging.debug("Entering collect_corners thread loop")
-        while not hasattr(self.stream, "_working_frame"):
-            time.sleep(.01) # wait for initial frame data to populate
-        
+        frame_version = 0
+        last_frame_time = None
+
         while not self.stop_event.is_set():
-            # self.stream.shutter_sync.put("Fire")
-            # frame_data = self.stream.reel.get()
-            self.frame = self.stream._working_frame
-            # this is a dumb placeholder to throttle the frame rate
-            time.sleep(1/self.target_fps)
+            # block until the stream has a frame this has not seen yet;
+            # time out now and then to keep an eye on the stop event
+            latest = self.stream.latest_frame.wait_for_newer(frame_version, timeout=0.5)
+            if latest is None:
+                continue
+            frame_version, frame_time, packet = latest
+
+            # throttle to the target rate by passing over frames that come too soon;
+            # frames passed over are never decoded
+            if last_frame_time is not None and frame_time - last_frame_time < 1 / self.target_fps:
+                continue
+            last_frame_time = frame_time
+            self.frame_time, self.frame = frame_time, packet.frame
+            self.packet = packet
+            self.check_resolution_change(frame_time)
 
             # create  a blank frame to fill dropped frames
             # if frame_data:
@@ -114,7 +140,7 @@ class MonoCalibrator:
                     self.ids,
                     self.img_loc,
                     self.board_loc,
-                ) = self.corner_tracker.get_corners(self.frame)
+                ) = self.corner_tracker.get_corners(self.packet)
 
                 if self.ids.any():
                     enough_corners = len(self.ids) > self.min_points_to_process
@@ -168,7 +194,8 @@ class MonoCalibrator:
             self.grid_frame_ready_q.put("frame ready")
 
         else:
-            logging.debug("Reinitializing Grid Capture History")
+            # should have been caught by check_resolution_change
+            logging.warning(f"Frame at port {self.port} does not match grid history; reinitializing")
             self.initialize_grid_history()
             self.grid_frame = self.grid_capture_history
             self.grid_frame_ready_q.put("frame ready")
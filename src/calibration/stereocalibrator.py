@@ -19,6 +19,7 @@ from threading import Thread, Event
 import cv2
 import numpy as np
 
+from src.cameras.subscription import Subscription
 from src.cameras.synchronizer import Synchronizer
 
 
@@ -36,8 +37,10 @@ class StereoCalibrator:
 
 
         # self.stacked_frames = Queue()  # ultimately will be removing this
-        self.bundle_available_q = Queue()
-        self.synchronizer.subscribe_to_notice(self.bundle_available_q)
+        # only the newest bundle is of interest; any that arrive while one is
+        # being processed replace each other rather than piling up
+        self.bundle_available_q = Subscription.latest(name="stereocalibrator")
+        self.synchronizer.subscribe_to_bundle(self.bundle_available_q)
         self.cal_frames_ready_q = Queue()
         self.stop_event = Event()
 
@@ -117,14 +120,14 @@ class StereoCalibrator:
         processing of it."""
         logging.debug(f"Currently {len(self.uncalibrated_pairs)} uncalibrated pairs ")
 
-        while not self.stop_event.set():
-            self.bundle_available_q.get()
+        while not self.stop_event.is_set():
+            bundle = self.bundle_available_q.get()
             
             # may get hung up on get, so additional item put on queue
-            if self.stop_event.set():
+            if self.stop_event.is_set():
                 break
             
-            self.current_bundle = self.synchronizer.current_bundle
+            self.current_bundle = bundle
             logging.debug("Frame bundle harvested by stereocalibrator")
 
             self.add_corner_data()
@@ -145,19 +148,21 @@ class StereoCalibrator:
 
             # if len(self.uncalibrated_pairs) == 0:
             #     self.stereo_calibrate()
+        self.synchronizer.release_bundle_q(self.bundle_available_q)
         logging.info("Stereocalibration bundle harvester successfully shut-down...")
 
     def add_corner_data(self):
-        """Assign corner data for each frame"""
+        """Annotate the bundle with the corner data of each frame, unless a
+        StageEngine running corner_stage has done so already"""
         for port in self.current_bundle.keys():
+            if self.current_bundle.annotations.has(port, "ids"):
+                continue
             if self.current_bundle[port] is not None:
                 ids, img_loc, board_loc = self.corner_tracker.get_corners(
-                    self.current_bundle[port]["frame"]
+                    self.current_bundle[port]["packet"]
                 )
 
-                self.current_bundle[port]["ids"] = ids
-                self.current_bundle[port]["img_loc"] = img_loc
-                self.current_bundle[port]["board_loc"] = board_loc
+                self.current_bundle.annotate(port, ids=ids, img_loc=img_loc, board_loc=board_loc)
 
                 logging.debug(f"Port {port}: {ids}")
 
@@ -188,8 +193,8 @@ class StereoCalibrator:
     def get_common_ids(self, portA, portB):
         """Intersection of grid corners observed in the active grid pair"""
         if self.current_bundle[portA] and self.current_bundle[portB]:
-            ids_A = self.current_bundle[portA]["ids"]
-            ids_B = self.current_bundle[portB]["ids"]
+            ids_A = self.current_bundle.annotation(portA, "ids")
+            ids_B = self.current_bundle.annotation(portB, "ids")
             common_ids = np.intersect1d(ids_A, ids_B)
             common_ids = common_ids.tolist()
 
@@ -281,9 +286,10 @@ class StereoCalibrator:
         """Pull out objective location and image location of board corners for
         a port that are on the list of common ids"""
 
-        ids = self.current_bundle[port]["ids"]
-        img_loc = self.current_bundle[port]["img_loc"].tolist()
-        board_loc = self.current_bundle[port]["board_loc"].tolist()
+        corners = self.current_bundle.annotations.of_port(port)
+        ids = corners["ids"]
+        img_loc = corners["img_loc"].tolist()
+        board_loc = corners["board_loc"].tolist()
 
         common_img_loc = []
         common_board_loc = []
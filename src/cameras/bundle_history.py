@@ -0,0 +1,178 @@
+# The most recent bundles from a Synchronizer (or any other source of
+# bundles), kept in memory so that a consumer that starts late (a recording
+# begun just after something happened, a window opened partway through a
+# session) can still get at what came just before it. Bundles can be looked
+# up by time or by bundle index.
+#
+# The history is a bundle subscriber like any other: it only needs put(), so
+# it can be given to subscribe_to_bundle(). Its size is capped three ways,
+# and the oldest bundles are let go as soon as any one cap is reached:
+#   - max_seconds: span of time from the oldest bundle to the newest
+#   - max_bundles: number of bundles
+#   - max_bytes: memory held by the frames, and by the images derived from
+#     them (grayscale, pyramid levels; see frame_packet.py). Those are often
+#     only made once a bundle is already in the history, so the bundles are
+#     measured again every REMEASURE_SECONDS
+# keep_every=n holds on to only every nth bundle, so the same memory covers
+# n times as long, at 1/n of the rate.
+#
+# Bundles are kept as they were published: their frames are read-only and
+# are never reused by the stream (see frame_reel.py), so nothing is copied.
+# Frames captured as JPEG are held as they are, which takes a small fraction
+# of the memory. Annotations attached to a bundle later show up in the
+# history too.
+#
+# A consumer joining late should subscribe first and then read the history,
+# skipping any bundle from its subscription with a bundle_index it has
+# already been given from the history.
+
+import logging
+import time
+from collections import deque
+from threading import Lock
+
+import numpy as np
+
+
+HISTORY_SECONDS = 2
+HISTORY_BYTES = 512 * 1024**2
+REMEASURE_SECONDS = 1
+
+
+def bundle_time(bundle):
+    """Mean time of the frames in a bundle (None if it has none)"""
+    frame_times = [frame_data["frame_time"] for frame_data in bundle.values() if frame_data is not None]
+    if len(frame_times) == 0:
+        return None
+    return float(np.mean(frame_times))
+
+
+def bundle_bytes(bundle):
+    """Memory held by the packets of a bundle (see FramePacket.nbytes)"""
+    return sum(frame_data["packet"].nbytes for frame_data in bundle.values() if frame_data is not None)
+
+
+class BundleHistory:
+    def __init__(
+        self, max_seconds=HISTORY_SECONDS, max_bundles=None, max_bytes=HISTORY_BYTES, keep_every=1
+    ):
+        if keep_every < 1:
+            raise ValueError("keep_every must be at least 1")
+
+        self.max_seconds = max_seconds
+        self.max_bundles = max_bundles
+        self.max_bytes = max_bytes
+        self.keep_every = keep_every
+
+        # oldest first; each entry is [bundle time, bundle index, bundle, bytes]
+        self.entries = deque()
+        self.lock = Lock()
+
+        self.nbytes = 0
+        self.measured = time.perf_counter()  # when every bundle was last measured
+        self.offered = 0  # bundles put, whether or not they were kept
+        self.evicted = 0
+
+    def put(self, bundle, block=True, timeout=None):
+        """Called by the source with each new bundle; never blocks it"""
+        self.offered += 1
+        if (self.offered - 1) % self.keep_every != 0:
+            return
+
+        frame_time = bundle_time(bundle)
+        if frame_time is None:
+            return  # nothing in it worth keeping
+
+        nbytes = bundle_bytes(bundle)
+
+        with self.lock:
+            self.entries.append([frame_time, bundle.bundle_index, bundle, nbytes])
+            self.nbytes += nbytes
+            if time.perf_counter() - self.measured > REMEASURE_SECONDS:
+                self.remeasure()
+            self.evict()
+
+    def remeasure(self):
+        """Count the images derived from frames since their bundles came in"""
+        for entry in self.entries:
+            entry[3] = bundle_bytes(entry[2])
+        self.nbytes = sum(entry[3] for entry in self.entries)
+        self.measured = time.perf_counter()
+
+    def evict(self):
+        """Let go of the oldest bundles until every cap is met. The newest
+        bundle is always kept"""
+        newest_time = self.entries[-1][0]
+        while len(self.entries) > 1:
+            oldest_time = self.entries[0][0]
+            over = (
+                (self.max_seconds is not None and newest_time - oldest_time > self.max_seconds)
+                or (self.max_bundles is not None and len(self.entries) > self.max_bundles)
+                or (self.max_bytes is not None and self.nbytes > self.max_bytes)
+            )
+            if not over:
+                break
+            _, _, _, nbytes = self.entries.popleft()
+            self.nbytes -= nbytes
+            self.evicted += 1
+
+    def between(self, start_time=None, end_time=None):
+        """Bundles with a mean frame time from start_time up to and
+        including end_time, oldest first"""
+        with self.lock:
+            entries = list(self.entries)
+        return [
+            bundle
+            for frame_time, _, bundle, _ in entries
+            if (start_time is None or frame_time >= start_time) and (end_time is None or frame_time <= end_time)
+        ]
+
+    def since(self, seconds):
+        """Bundles from the last `seconds` before the newest"""
+        newest = self.newest_time()
+        if newest is None:
+            return []
+        return self.between(newest - seconds)
+
+    def by_index(self, first_index, last_index=None):
+        """Bundles with a bundle_index from first_index to last_index inclusive"""
+        with self.lock:
+            entries = list(self.entries)
+        return [
+            bundle
+            for _, bundle_index, bundle, _ in entries
+            if bundle_index >= first_index and (last_index is None or bundle_index <= last_index)
+        ]
+
+    def nearest(self, frame_time):
+        """The bundle closest in time to frame_time"""
+        with self.lock:
+            if len(self.entries) == 0:
+                return None
+            times = np.array([entry[0] for entry in self.entries])
+            return self.entries[int(np.argmin(np.abs(times - frame_time)))][2]
+
+    def newest_time(self):
+        with self.lock:
+            return self.entries[-1][0] if self.entries else None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        with self.lock:
+            span = self.entries[-1][0] - self.entries[0][0] if self.entries else 0
+            first_index = self.entries[0][1] if self.entries else None
+            last_index = self.entries[-1][1] if self.entries else None
+        return {
+            "bundles": len(self.entries),
+            "span_sec": span,
+            "first_index": first_index,
+            "last_index": last_index,
+            "megabytes": self.nbytes / 1024**2,
+            "offered": self.offered,
+            "evicted": self.evicted,
+        }
+
+    def __repr__(self):
+        return f"BundleHistory(max_seconds={self.max_seconds}, keep_every={self.keep_every})"
@@ -0,0 +1,314 @@
+# Runs per-frame processing (corner detection, pose estimation...) on every
+# bundle a Synchronizer puts out, across a pool of workers, and hands the
+# bundles on to its own subscribers with the results attached as annotations.
+# Consumers that used to subscribe to the synchronizer and then work through
+# each bundle on their own thread, one port after another, can subscribe to
+# the engine instead and find the work already done.
+#
+# A stage is a function registered under a name. It is given the FrameData of
+# one port and returns a dict of values to annotate on that port (anything
+# else is annotated under the stage's name; None annotates nothing). The
+# stages of a port run one after another in the order they were registered,
+# while the ports of a bundle, and successive bundles, run in parallel.
+#
+# With executor="thread" the stage is given the FrameData itself and shares
+# the packet's cached gray images with everyone else. cv2 releases the GIL
+# for most of its work, so threads are the usual choice. With
+# executor="process" the stage is given a plain dict of port, frame_index,
+# frame_time, bundle_index and the decoded frame, which is pickled across to
+# the worker process; the stage function must be picklable itself (defined at
+# module level).
+#
+# Bundles come out in the order they went in, however the work on them
+# finishes. No more than max_in_flight bundles are being worked on at once.
+# When that many are waiting on the pool, the engine stops taking bundles and
+# its subscription to the source fills. The overflow policy of that
+# subscription then decides what happens: "block" holds up the source (and
+# with it all of the source's other subscribers), while "drop_oldest" lets
+# bundles be skipped.
+#
+# The engine presents subscribe_to_bundle(), release_bundle_q() and streams,
+# so it stands in for the synchronizer for any consumer that only needs
+# those (the StereoCalibrator, for instance). Engines can be chained.
+
+import logging
+
+LOG_FILE = r"log\bundle_stages.log"
+LOG_LEVEL = logging.INFO
+LOG_FORMAT = " %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s"
+
+logging.basicConfig(filename=LOG_FILE, filemode="w", format=LOG_FORMAT, level=LOG_LEVEL)
+
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from queue import Empty, Queue
+from threading import BoundedSemaphore, Event, Lock, Thread
+
+import numpy as np
+
+from src.cameras.subscription import Subscription
+
+EXECUTORS = ("thread", "process")
+MAX_IN_FLIGHT = 4  # bundles being worked on at once
+LATENCY_HISTORY = 500  # bundles kept for latency statistics
+POLL_INTERVAL = 0.1  # seconds between checks for stop while waiting on the source
+
+
+def run_stages(stages, frame_data):
+    """Apply each stage to one port's frame. Returns the annotations and any
+    errors raised, both by stage name, so that one failing stage doesn't
+    cost the results of the others"""
+    annotations = {}
+    errors = {}
+    for name, stage in stages:
+        try:
+            result = stage(frame_data)
+        except Exception as e:
+            errors[name] = repr(e)
+            continue
+
+        if result is None:
+            continue
+        if isinstance(result, dict):
+            annotations.update(result)
+        else:
+            annotations[name] = result
+    return annotations, errors
+
+
+def portable(frame_data):
+    """What a worker process is given in place of the FrameData, which holds
+    on to a packet that can't be pickled"""
+    return {
+        "port": frame_data["port"],
+        "frame_index": frame_data["frame_index"],
+        "frame_time": frame_data["frame_time"],
+        "bundle_index": frame_data["bundle_index"],
+        "frame": np.asarray(frame_data["frame"]),
+    }
+
+
+class StageEngine:
+    def __init__(
+        self,
+        source,
+        stages=None,
+        workers=None,
+        executor="thread",
+        max_in_flight=MAX_IN_FLIGHT,
+        overflow="block",
+    ):
+        if executor not in EXECUTORS:
+            raise ValueError(f"Executor must be one of {EXECUTORS}, not {executor}")
+        if max_in_flight < 1:
+            raise ValueError("At least 1 bundle must be allowed in flight")
+
+        self.source = source
+        self.streams = source.streams
+        self.executor = executor
+        self.max_in_flight = max_in_flight
+
+        self.stages = []  # [name, function]
+        self.stage_lock = Lock()
+        for name, function in (stages or {}).items():
+            self.register(name, function)
+
+        if executor == "thread":
+            self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stage")
+        else:
+            self.pool = ProcessPoolExecutor(max_workers=workers)
+
+        self.bundle_subscribers = []
+
+        # stats
+        self.bundles_in = 0
+        self.bundles_out = 0
+        self.errors = {}  # stage name: count
+        self.latency = deque(maxlen=LATENCY_HISTORY)  # seconds from intake to emit
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.count_lock = Lock()
+
+        # a bundle takes a slot when it is taken from the source and gives it
+        # back once it has been emitted
+        self.slots = BoundedSemaphore(max_in_flight)
+        # bundles submitted to the pool, in order, with the futures of their ports
+        self.pending = Queue()
+        self.stop_event = Event()
+
+        self.bundle_in_q = Subscription(max_in_flight, overflow, name="stage engine")
+        self.source.subscribe_to_bundle(self.bundle_in_q)
+
+        self.intake_thread = Thread(target=self.intake_worker, args=(), daemon=True)
+        self.intake_thread.start()
+        self.emit_thread = Thread(target=self.emit_worker, args=(), daemon=True)
+        self.emit_thread.start()
+
+    def register(self, name, function):
+        """Add a stage; it applies from the next bundle taken from the source"""
+        logging.info(f"Registering bundle stage: {name}")
+        with self.stage_lock:
+            if name in [registered for registered, _ in self.stages]:
+                raise ValueError(f"A stage named {name} is already registered")
+            self.stages.append([name, function])
+
+    def unregister(self, name):
+        logging.info(f"Removing bundle stage: {name}")
+        with self.stage_lock:
+            self.stages = [stage for stage in self.stages if stage[0] != name]
+
+    def subscribe_to_bundle(self, q):
+        logging.info(f"Adding queue to receive processed bundles: {q}")
+        self.bundle_subscribers.append(q)
+
+    def release_bundle_q(self, q):
+        logging.info(f"Releasing processed bundle queue: {q}")
+        self.bundle_subscribers.remove(q)
+        if isinstance(q, Subscription):
+            q.close()
+
+    def stop(self):
+        """Finish the bundles already in flight, then shut down the pool"""
+        self.stop_event.set()
+        self.source.release_bundle_q(self.bundle_in_q)
+        for q in self.bundle_subscribers:
+            if isinstance(q, Subscription):
+                q.close()  # free the emitter if it is waiting on a full one
+        self.intake_thread.join()
+        self.emit_thread.join()
+        self.pool.shutdown()
+        logging.info("Stage engine stopped")
+
+    def intake_worker(self):
+        logging.info("Stage engine taking bundles")
+        while not self.stop_event.is_set():
+            # waits here while max_in_flight bundles are being worked on
+            self.slots.acquire()
+            try:
+                bundle = self.bundle_in_q.get(timeout=POLL_INTERVAL)
+            except Empty:
+                self.slots.release()
+                continue
+
+            with self.count_lock:
+                self.in_flight += 1
+                self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+            with self.stage_lock:
+                stages = [tuple(stage) for stage in self.stages]
+
+            intake_time = time.perf_counter()
+            futures = {}
+            for port, frame_data in bundle.items():
+                if frame_data is None:
+                    continue
+                if self.executor == "process":
+                    frame_data = portable(frame_data)
+                futures[port] = self.pool.submit(run_stages, stages, frame_data)
+
+            self.bundles_in += 1
+            self.pending.put([bundle, futures, intake_time])
+
+        self.pending.put(None)  # let the emitter finish what is in flight
+        logging.info("Stage engine intake ended")
+
+    def emit_worker(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            bundle, futures, intake_time = item
+
+            for port, future in futures.items():
+                try:
+                    annotations, errors = future.result()
+                except Exception as e:
+                    # the work itself could not be done (e.g. a stage that can't be pickled)
+                    logging.error(f"Stages failed on port {port} of bundle {bundle.bundle_index}: {e!r}")
+                    self.errors["engine"] = self.errors.get("engine", 0) + 1
+                    continue
+
+                for name, error in errors.items():
+                    logging.warning(f"Stage {name} failed on port {port} of bundle {bundle.bundle_index}: {error}")
+                    self.errors[name] = self.errors.get(name, 0) + 1
+                if annotations:
+                    bundle.annotate(port, **annotations)
+
+            self.latency.append(time.perf_counter() - intake_time)
+            self.bundles_out += 1
+
+            for q in list(self.bundle_subscribers):
+                logging.debug(f"Placing processed bundle on queue: {q}")
+                q.put(bundle)
+
+            with self.count_lock:
+                self.in_flight -= 1
+            self.slots.release()
+
+        logging.info("Stage engine emitter ended")
+
+    def stats(self):
+        """Throughput of the engine and time bundles spend in it (ms)"""
+        stats = {
+            "executor": self.executor,
+            "stages": [name for name, _ in self.stages],
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "bundles_in": self.bundles_in,
+            "bundles_out": self.bundles_out,
+            "errors": dict(self.errors),
+            "source_subscription": self.bundle_in_q.stats(),
+        }
+        if len(self.latency) > 0:
+            latency = np.array(self.latency) * 1000
+            stats.update(
+                {
+                    "latency_median_ms": float(np.median(latency)),
+                    "latency_p95_ms": float(np.percentile(latency, 95)),
+                }
+            )
+        return stats
+
+
+def corner_stage(corner_tracker):
+    """A stage that finds the charuco corners of a frame and annotates them
+    as the StereoCalibrator expects (ids, img_loc, board_loc). The tracker
+    can't be pickled, so this is for the thread executor only"""
+
+    def find_corners(frame_data):
+        ids, img_loc, board_loc = corner_tracker.get_corners(frame_data["packet"])
+        return {"ids": ids, "img_loc": img_loc, "board_loc": board_loc}
+
+    return find_corners
+
+
+if __name__ == "__main__":
+    from src.calibration.charuco import Charuco
+    from src.calibration.corner_tracker import CornerTracker
+    from src.cameras.live_stream import LiveStream
+    from src.cameras.synchronizer import Synchronizer
+    from src.cameras.synthetic_camera import SyntheticArray
+
+    charuco = Charuco(4, 5, 11, 8.5, aruco_scale=0.75, square_size_overide_cm=5.25, inverted=True)
+    trackr = CornerTracker(charuco)
+
+    cameras = SyntheticArray(charuco, camera_count=3).get_cameras()
+    streams = {port: LiveStream(cam) for port, cam in cameras.items()}
+    syncr = Synchronizer(streams, fps_target=15)
+
+    engine = StageEngine(syncr, {"corners": corner_stage(trackr)}, workers=3)
+    bundle_q = Subscription.lossless(name="stage demo")
+    engine.subscribe_to_bundle(bundle_q)
+
+    last_index = -1
+    for _ in range(60):
+        bundle = bundle_q.get()
+        assert bundle.bundle_index > last_index  # bundles arrive in order
+        last_index = bundle.bundle_index
+        found = {port: len(bundle.annotation(port, "ids", [])) for port in bundle}
+        print(f"bundle {bundle.bundle_index}: corners found {found}")
+
+    engine.stop()
+    print(engine.stats())
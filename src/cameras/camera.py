@@ -22,6 +22,8 @@ from threading import Thread
 
 import cv2
 
+from src.cameras.capability_cache import device_identity
+
 TEST_FRAME_COUNT = 10
 MIN_RESOLUTION_CHECK = 500
 MAX_RESOLUTION_CHECK = 10000
@@ -31,15 +33,23 @@ class Camera(object):
 
     # https://docs.opencv.org/3.4/d4/d15/group__videoio__flags__base.html
     # see above for constants used to access properties
-    def __init__(self, port):
+    def __init__(self, port, capability_cache=None):
 
         # check if source has a data feed before proceeding...if not it is
         # either in use or fake
         logging.info(f"Attempting to connect video capure at port {port}")
-        test_capture = cv2.VideoCapture(port)
+        connect_start = time.perf_counter()
+        self.port = port
+        test_capture = self.open_capture()
+
+        # identity has to be read before anything about the capture is changed
+        self.capability_cache = capability_cache
+        self.identity = device_identity(port, test_capture)
+
         for _ in range(0, TEST_FRAME_COUNT):
             good_read, frame = test_capture.read()
-
+            if good_read:
+                break
             # pass # dealing with this in the else statemetn below...not a real camera
         if good_read:
             logging.info(f"Good read at port {port}...proceeding")
@@ -56,15 +66,44 @@ class Camera(object):
             # sets orientation in the GUI, but otherwise does not affect the frame
             self.rotation_count = 0  # +1 for each 90 degree CW rotation, -1 for CCW
 
-            self.set_exposure()
-            self.set_default_resolution()
-            self.set_possible_resolutions()
-
             # camera initializes as uncalibrated
             self.error = None
             self.camera_matrix = None
             self.distortion = None
             self.grid_count = None
+
+            cached = self.get_cached_capabilities()
+            if cached is not None:
+                logging.info(f"Using cached capabilities for camera at port {port}")
+                self.default_resolution = tuple(cached["default_resolution"])
+                self._exposure = cached["exposure"]
+                self.exposure = self._exposure
+                if "possible_resolutions" in cached:
+                    self._possible_resolutions = [
+                        tuple(res) for res in cached["possible_resolutions"]
+                    ]
+                else:
+                    self._possible_resolutions = None
+            else:
+                self.set_exposure()
+                self.set_default_resolution()
+                # full list of resolutions is only built when asked for
+                self._possible_resolutions = None
+                single_resolution = self.get_nearest_resolution(
+                    MIN_RESOLUTION_CHECK
+                ) == self.get_nearest_resolution(MAX_RESOLUTION_CHECK)
+
+                if single_resolution:
+                    # probably not real
+                    self.port = port
+                    self.capture = None
+                    self.active_port = False
+                    logging.info(f"Camera at port {port} may be virtual")
+                    raise Exception(f"{port}...likely not real")
+
+                self.cache_capabilities(
+                    default_resolution=self.default_resolution, exposure=self._exposure
+                )
         else:
             # probably busy
             self.port = port
@@ -72,13 +111,30 @@ class Camera(object):
             self.active_port = False
             logging.info(f"Camera at port {port} appears to be busy")
             raise Exception(f"Not reading at port {port}...likely in use")
-        if isinstance(self.possible_resolutions[0], int):
-            # probably not real
-            self.port = port
-            self.capture = None
-            self.active_port = False
-            logging.info(f"Camera at port {port} may be virtual")
-            raise Exception(f"{port}...likely not real")
+
+        # reported while the capture is closed
+        self._last_resolution = self.default_resolution
+
+        self.connect_time = time.perf_counter() - connect_start
+        logging.info(f"Camera at port {port} connected in {self.connect_time:.2f} seconds")
+
+    def get_cached_capabilities(self):
+        if self.capability_cache is None:
+            return None
+        return self.capability_cache.get(self.identity)
+
+    def cache_capabilities(self, **capabilities):
+        if self.capability_cache is not None:
+            self.capability_cache.update(self.identity, **capabilities)
+
+    @property
+    def possible_resolutions(self):
+        """Enumerating resolutions takes many round trips to the device, so
+        only do it when something (i.e. the config dialog) asks"""
+        if self._possible_resolutions is None:
+            self.set_possible_resolutions()
+            self.cache_capabilities(possible_resolutions=self._possible_resolutions)
+        return self._possible_resolutions
 
     @property
     def exposure(self):
@@ -110,7 +166,12 @@ class Camera(object):
 
     @property
     def resolution(self):
-        return (self._width, self._height)
+        if not self.capture.isOpened():
+            # capture may be owned by another process (see process_stream.py)
+            # or released by whoever was using it
+            return self._last_resolution
+        self._last_resolution = (self._width, self._height)
+        return self._last_resolution
 
     @resolution.setter
     def resolution(self, value):
@@ -162,9 +223,9 @@ class Camera(object):
                 resolutions.add(new_res)
             resolutions = list(resolutions)
             resolutions.sort()
-            self.possible_resolutions = resolutions
+            self._possible_resolutions = resolutions
         else:
-            self.possible_resolutions = self.default_resolution
+            self._possible_resolutions = [self.default_resolution]
 
     def rotate_CW(self):
         if self.rotation_count == 3:
@@ -178,11 +239,27 @@ class Camera(object):
         else:
             self.rotation_count = self.rotation_count - 1
 
+    def request_mjpeg_passthrough(self, enabled=True):
+        """Ask the device for MJPG and for read() to return the JPEG bytes
+        undecoded. Must be done before setting the resolution as a change of
+        format can reset it. Returns False if the backend refused; some
+        decode regardless, which is caught frame by frame (see frame_packet.py)"""
+        if enabled:
+            self.capture.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"MJPG"))
+        accepted = self.capture.set(cv2.CAP_PROP_CONVERT_RGB, 0 if enabled else 1)
+        logging.info(f"MJPEG passthrough {'requested' if enabled else 'turned off'} at port {self.port}; accepted: {accepted}")
+        return bool(accepted)
+
     def disconnect(self):
+        self._last_resolution = self.resolution
         self.capture.release()
 
     def connect(self):
-        self.capture = cv2.VideoCapture(self.port)
+        self.capture = self.open_capture()
+
+    def open_capture(self):
+        """Overridden by stand-in cameras (see synthetic_camera.py)"""
+        return cv2.VideoCapture(self.port)
 
     def calibration_summary(self):
         # Calibration output presented in label on far right
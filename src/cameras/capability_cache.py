@@ -0,0 +1,128 @@
+# Probing a camera for what it can do is slow: each resolution check is a
+# round trip to the device, and Session.find_cameras does this for every
+# port on every launch. The results rarely change for a given device, so they
+# are stored here between sessions.
+#
+# Entries are keyed by device identity: the port along with properties the
+# backend reports right after opening (backend name, pixel format and the
+# resolution the device comes up in). If a different device shows up at the
+# same port, the identity changes and the old entry is simply not used.
+#
+# Entries also expire after MAX_AGE_DAYS, and can be cleared explicitly.
+
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+from threading import Lock
+
+import cv2
+import toml
+
+CACHE_PATH = Path(Path.home(), ".calicam", "device_capabilities.toml")
+MAX_AGE_DAYS = 30
+
+
+def device_identity(port, capture):
+    """Cheap properties of a freshly opened capture that together identify the device"""
+    try:
+        backend = capture.getBackendName()
+    except cv2.error:
+        backend = "unknown"
+    fourcc = int(capture.get(cv2.CAP_PROP_FOURCC))
+    width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    return f"port_{port}_{backend}_{fourcc}_{width}x{height}"
+
+
+class CapabilityCache:
+    def __init__(self, path=CACHE_PATH, max_age_days=MAX_AGE_DAYS):
+        self.path = Path(path)
+        self.max_age = timedelta(days=max_age_days)
+        self.lock = Lock()  # cameras are connected from a thread pool
+
+        if self.path.exists():
+            try:
+                self.entries = toml.load(self.path)
+                logging.info(f"Loaded {len(self.entries)} cached device capabilities")
+            except toml.TomlDecodeError:
+                logging.warning(f"Unreadable capability cache at {self.path}; starting fresh")
+                self.entries = {}
+        else:
+            self.entries = {}
+
+    def get(self, identity):
+        """Return the cached capabilities for a device, or None if there are
+        none or they have expired"""
+        with self.lock:
+            entry = self.entries.get(identity)
+            if entry is None:
+                return None
+
+            age = datetime.now() - datetime.fromisoformat(entry["cached_at"])
+            if age > self.max_age:
+                logging.info(f"Cached capabilities for {identity} expired")
+                del self.entries[identity]
+                return None
+
+            return entry
+
+    def update(self, identity, **capabilities):
+        """Store (or add to) the capabilities of a device"""
+        with self.lock:
+            entry = self.entries.setdefault(identity, {})
+            for key, value in capabilities.items():
+                if isinstance(value, tuple):
+                    value = list(value)
+                elif isinstance(value, list):
+                    value = [list(v) if isinstance(v, tuple) else v for v in value]
+                entry[key] = value
+            entry["cached_at"] = datetime.now().isoformat()
+            self._save()
+
+    def invalidate(self, port=None):
+        """Forget cached capabilities for a port, or for every device if no
+        port is given"""
+        with self.lock:
+            for identity in list(self.entries.keys()):
+                if port is None or identity.startswith(f"port_{port}_"):
+                    logging.info(f"Invalidating cached capabilities for {identity}")
+                    del self.entries[identity]
+            self._save()
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w") as f:
+            toml.dump(self.entries, f)
+
+
+if __name__ == "__main__":
+    import time
+    from tempfile import TemporaryDirectory
+
+    from src.calibration.charuco import Charuco
+    from src.cameras.synthetic_camera import SyntheticArray, SyntheticCamera
+
+    # report startup time with a cold and a warm cache. Synthetic cameras are
+    # used here so that this runs anywhere; swap in Camera(port, cache) to
+    # measure real devices
+    charuco = Charuco(4, 5, 11, 8.5, square_size_overide_cm=5.4)
+    synthetic_array = SyntheticArray(charuco, camera_count=4)
+
+    with TemporaryDirectory() as temp_dir:
+        cache = CapabilityCache(Path(temp_dir, "device_capabilities.toml"))
+
+        trials = [
+            ("no cache, eager enumeration", None, True),
+            ("cold cache, lazy enumeration", cache, False),
+            ("warm cache", cache, False),
+        ]
+        for label, trial_cache, enumerate_now in trials:
+            start = time.perf_counter()
+            for port, factory in synthetic_array.capture_factories.items():
+                cam = SyntheticCamera(port, factory, capability_cache=trial_cache)
+                if enumerate_now:
+                    cam.possible_resolutions  # what Camera.__init__ used to do
+                cam.disconnect()
+            elapsed = time.perf_counter() - start
+            print(f"{label:>30}: {elapsed:.2f} sec to connect {len(synthetic_array.ports)} cameras")
@@ -0,0 +1,69 @@
+# The bundle of frames (one per port) that the Synchronizer hands to every
+# one of its subscribers. A single bundle is shared by all of them, so it
+# can't be changed once built: its ports, the FrameData of each port and the
+# frames themselves are all read-only. No consumer needs a defensive copy,
+# and none can pull the data out from under another.
+#
+# Results that consumers work out from the frames (the corners found by the
+# StereoCalibrator, for instance) go in the bundle's annotations instead.
+# These are kept per port, and everything given in one call to annotate()
+# appears together, so a reader on another thread sees either all of a
+# port's detection results or none of them.
+
+from collections.abc import Mapping
+from threading import Lock
+
+
+class Annotations:
+    def __init__(self):
+        self._by_port = {}
+        self._lock = Lock()
+
+    def set(self, port, **values):
+        with self._lock:
+            # replace rather than update so that readers holding the old dict are undisturbed
+            self._by_port[port] = {**self._by_port.get(port, {}), **values}
+
+    def get(self, port, key, default=None):
+        with self._lock:
+            return self._by_port.get(port, {}).get(key, default)
+
+    def has(self, port, key):
+        with self._lock:
+            return key in self._by_port.get(port, {})
+
+    def of_port(self, port):
+        """Everything annotated on the port so far"""
+        with self._lock:
+            return dict(self._by_port.get(port, {}))
+
+
+class FrameBundle(Mapping):
+    """port: FrameData, or None for a port with no frame in this bundle.
+    port_fps holds the rate each port has been delivering frames at, which
+    differs between ports when cameras run at mixed rates"""
+
+    def __init__(self, frames: dict, bundle_index=None, port_fps=None):
+        self._frames = dict(frames)
+        self.bundle_index = bundle_index
+        self.port_fps = dict(port_fps or {})
+        self.annotations = Annotations()
+
+    def __getitem__(self, port):
+        return self._frames[port]
+
+    def __iter__(self):
+        return iter(self._frames)
+
+    def __len__(self):
+        return len(self._frames)
+
+    def annotate(self, port, **values):
+        self.annotations.set(port, **values)
+
+    def annotation(self, port, key, default=None):
+        return self.annotations.get(port, key, default)
+
+    def __repr__(self):
+        ports = {port: frame_data is not None for port, frame_data in self._frames.items()}
+        return f"FrameBundle({self.bundle_index}, frames present: {ports})"
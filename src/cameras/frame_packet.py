@@ -0,0 +1,150 @@
+# One captured frame as it moves from a stream through the synchronizer to
+# its consumers. A camera running with MJPEG passthrough (see LiveStream)
+# hands over the JPEG bytes exactly as the device sent them rather than
+# decoded pixels. The packet holds on to those and only decodes them the
+# first time someone asks for the image, so consumers that need pixels
+# (corner detection, preview) share a single decode, and consumers that do
+# not (the VideoRecorder) never pay for one.
+#
+# Frames that arrive already decoded are wrapped the same way so that
+# consumers do not need to care which kind they were given.
+#
+# The packet also caches images derived from the frame that more than one
+# consumer wants: grayscale, inverted grayscale (for boards printed white on
+# black) and downscaled pyramid levels. Each is computed the first time it is
+# asked for and then shared, so calibrators, point trackers and previews
+# working on the same frame do not each repeat the conversion.
+#
+# One packet is shared by every consumer of the frame, so the frame and the
+# images derived from it are handed out as read-only views (no copy is made).
+# Copy before drawing on one.
+
+import logging
+from threading import RLock
+
+import cv2
+
+
+def read_only(image):
+    """A view of the image that can't be written through. The view keeps a
+    reference to the image, which is how a reel knows its buffer is still
+    held and must not be read into again"""
+    view = image.view()
+    view.flags.writeable = False
+    return view
+
+
+class FramePacket:
+    def __init__(self, frame_time, frame=None, jpeg=None):
+        if frame is None and jpeg is None:
+            raise ValueError("A frame packet needs either a frame or JPEG bytes")
+
+        self.frame_time = frame_time
+        self.jpeg = jpeg  # 1 dimensional uint8 array; None if captured decoded
+        self._frame = None if frame is None else read_only(frame)
+        self._derived = {}  # cached images computed from the frame
+        self._lock = RLock()  # derived images decode the frame while holding it
+
+    @classmethod
+    def from_capture(cls, frame_time, frame):
+        """A capture asked for passthrough returns the raw JPEG as a flat
+        buffer, though some backends ignore the request and decode anyway"""
+        if frame.ndim == 1:
+            return cls(frame_time, jpeg=frame)
+        return cls(frame_time, frame=frame)
+
+    @property
+    def compressed(self):
+        return self.jpeg is not None
+
+    @property
+    def decoded(self):
+        return self._frame is not None
+
+    @property
+    def nbytes(self):
+        """Memory held by the packet: the frame as captured, its decode if it
+        has been decoded, and the derived images cached so far"""
+        nbytes = 0 if self.jpeg is None else self.jpeg.nbytes
+        if self._frame is not None:
+            nbytes += self._frame.nbytes
+        # listed first, as another consumer may be adding to the cache
+        return nbytes + sum(image.nbytes for image in list(self._derived.values()))
+
+    @property
+    def frame(self):
+        """The BGR image, decoded on first access"""
+        if self._frame is None:
+            with self._lock:
+                # another consumer may have decoded it while this one waited
+                if self._frame is None:
+                    frame = self._decode()
+                    self._frame = None if frame is None else read_only(frame)
+        return self._frame
+
+    def _decode(self):
+        frame = cv2.imdecode(self.jpeg, cv2.IMREAD_COLOR)
+        if frame is None:
+            logging.warning(f"Unable to decode JPEG frame captured at {self.frame_time}")
+        return frame
+
+    def _cached(self, key, compute):
+        """Compute a derived image at most once, however many threads ask"""
+        image = self._derived.get(key)
+        if image is None:
+            with self._lock:
+                image = self._derived.get(key)
+                if image is None:
+                    image = read_only(compute())
+                    self._derived[key] = image
+        return image
+
+    @property
+    def gray(self):
+        return self._cached("gray", lambda: cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY))
+
+    @property
+    def inverted_gray(self):
+        return self._cached("inverted_gray", lambda: ~self.gray)
+
+    def pyramid(self, level=1):
+        """The BGR frame halved in each dimension `level` times. Each level
+        is built from the one above it, so lower levels come cheap. Halving
+        by pixel area is a fraction of the cost of cv2.pyrDown's blur and
+        plenty for previews"""
+        if level == 0:
+            return self.frame
+        return self._cached(("pyramid", level), lambda: self._halve(self.pyramid(level - 1)))
+
+    def _halve(self, image):
+        size = (image.shape[1] // 2, image.shape[0] // 2)
+        return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+    def encoded(self, quality=90):
+        """JPEG bytes of the frame, encoding only if it was captured decoded"""
+        if self.jpeg is not None:
+            return self.jpeg
+        _, jpeg = cv2.imencode(".jpg", self._frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        return jpeg
+
+
+class FrameData(dict):
+    """One port's entry in a synchronized bundle. Consumers index it by
+    "frame" as always, but the image is only pulled from the packet (and
+    decoded if need be) when that key is actually read. Note that
+    bundle.get("frame") bypasses this; use bundle["frame"]
+
+    Frame data is shared by every consumer of the bundle and is read-only.
+    Derive a new one with FrameData(frame_data, key=value), and attach
+    results to the bundle with FrameBundle.annotate()"""
+
+    def __missing__(self, key):
+        if key == "frame" and "packet" in self:
+            return self["packet"].frame
+        raise KeyError(key)
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Frame data is shared by all consumers of a bundle; annotate the bundle instead")
+
+    __setitem__ = __delitem__ = _read_only
+    update = pop = popitem = clear = setdefault = _read_only
@@ -0,0 +1,223 @@
+# A fixed-capacity ring of preallocated frame buffers that serves as the
+# "reel" of a LiveStream. The camera reads directly into a reserved slot so
+# that no new numpy array is allocated per frame, and the reel can never grow
+# beyond its capacity no matter how slow the consumer is.
+#
+# The reel presents the same get() interface as the Queue it replaces, so a
+# Synchronizer harvesting frames does not need to know the difference.
+#
+# Frames are handed out by get() as read-only views of the buffer they were
+# read into, with no copy made. A buffer is only read into again once nothing
+# outside the reel refers to it any more (every view of it has been let go).
+# A consumer that holds on to a frame past the point where the ring comes
+# back around to its buffer (a bundle kept in a history, a slow subscriber)
+# keeps that buffer to itself, and the slot is given a new one. Frames stay
+# as they were captured for as long as anyone holds them, and a new buffer
+# is only allocated when one is actually still in use.
+#
+# Frames that arrive in arrays of their own (JPEG bytes under MJPEG
+# passthrough, or a capture that returned a new array) don't use a buffer at
+# all: reserve_slot() holds a place in the ring for them without one.
+
+import logging
+import sys
+import time
+from queue import Empty, Full
+from threading import Condition
+
+import numpy as np
+
+from src.cameras.frame_packet import read_only
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "drop_newest")
+
+
+def references(buffer):
+    """Reference count of a buffer, which every view of it adds to (numpy
+    views refer to the array that owns the memory, however deep they go)"""
+    return sys.getrefcount(buffer)
+
+
+class FrameReel:
+    def __init__(self, capacity=8, overflow="drop_oldest"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(
+                f"Overflow policy must be one of {OVERFLOW_POLICIES}, not {overflow}"
+            )
+        if capacity < 2:
+            raise ValueError("Reel capacity must be at least 2 frames")
+
+        self.capacity = capacity  # maximum number of unread frames
+        self.overflow = overflow
+
+        # one extra slot is held back for the frame currently being read in
+        self._slot_count = capacity + 1
+        self._slots = [None] * self._slot_count  # buffers frames are read into
+        self._frames = [None] * self._slot_count  # what get() hands out for each slot
+        self._frame_times = [None] * self._slot_count
+        self._scratch = None  # read target for frames that will be dropped
+        self._unheld_refs = None  # references to a buffer when only the reel has it
+
+        self._head = 0  # index of the oldest unread frame
+        self._count = 0  # number of committed but unread frames
+        self._reserved = None  # slot index currently being read into
+
+        self.condition = Condition()
+
+        # counters
+        self.frames_in = 0
+        self.frames_out = 0
+        self.dropped_oldest = 0
+        self.dropped_newest = 0
+        self.peak_occupancy = 0
+        self.buffers_replaced = 0  # buffers left to a consumer still holding them
+
+    def allocate(self, shape, dtype=np.uint8):
+        """Preallocate every slot for frames of the given shape. Any unread
+        frames are discarded, so call this before the stream starts pushing
+        or when the resolution changes"""
+        with self.condition:
+            logging.info(f"Allocating {self._slot_count} reel buffers of shape {shape}")
+            self._slots = [np.empty(shape, dtype=dtype) for _ in range(self._slot_count)]
+            self._frames = [None] * self._slot_count
+            self._frame_times = [None] * self._slot_count
+            self._scratch = np.empty(shape, dtype=dtype)
+            # only the reel holds it; reserve() counts slot buffers the same way
+            self._unheld_refs = references(self._scratch)
+            self._head = 0
+            self._count = 0
+            self._reserved = None
+            self.condition.notify_all()
+
+    @property
+    def occupancy(self):
+        """Number of frames currently waiting to be read"""
+        return self._count
+
+    def qsize(self):
+        return self._count
+
+    def empty(self):
+        return self._count == 0
+
+    def full(self):
+        return self._count == self.capacity
+
+    @property
+    def dropped(self):
+        return self.dropped_oldest + self.dropped_newest
+
+    def stats(self):
+        return {
+            "capacity": self.capacity,
+            "overflow": self.overflow,
+            "occupancy": self._count,
+            "peak_occupancy": self.peak_occupancy,
+            "frames_in": self.frames_in,
+            "frames_out": self.frames_out,
+            "dropped_oldest": self.dropped_oldest,
+            "dropped_newest": self.dropped_newest,
+            "buffers_replaced": self.buffers_replaced,
+        }
+
+    def _reserve(self, timeout):
+        """Hold the next slot (-1 for a frame that will be dropped). Frames
+        only make way for new ones on commit, so a failed read costs nothing"""
+        if self._count == self.capacity and self.overflow == "block":
+            end_time = None if timeout is None else time.perf_counter() + timeout
+            while self._count == self.capacity:
+                remaining = None if end_time is None else end_time - time.perf_counter()
+                if remaining is not None and remaining <= 0:
+                    raise Full
+                self.condition.wait(remaining)
+
+        if self._count == self.capacity and self.overflow == "drop_newest":
+            self._reserved = -1
+        else:
+            # with a full reel under drop_oldest this is the spare slot
+            self._reserved = (self._head + self._count) % self._slot_count
+        return self._reserved
+
+    def reserve(self, timeout=None):
+        """Return the buffer the next frame should be read into. The buffer is
+        not visible to consumers until commit() is called.
+
+        With a full reel, the overflow policy decides what happens:
+            - block: wait for the consumer to free up a slot (raises Full on timeout)
+            - drop_oldest: the oldest unread frame is discarded on commit to make room
+            - drop_newest: a scratch buffer is returned and the frame is discarded on commit
+        """
+        with self.condition:
+            slot = self._reserve(timeout)
+            if slot == -1:
+                if references(self._scratch) > self._unheld_refs:
+                    self._scratch = self._replacement(self._scratch)
+                return self._scratch
+            if references(self._slots[slot]) > self._unheld_refs:
+                self._slots[slot] = self._replacement(self._slots[slot])
+            return self._slots[slot]
+
+    def _replacement(self, buffer):
+        """A new buffer for a slot whose own is still held by a consumer"""
+        self.buffers_replaced += 1
+        return np.empty_like(buffer)
+
+    def reserve_slot(self, timeout=None):
+        """Hold a place in the reel for a frame that brings its own array, as
+        reserve() does but without a buffer"""
+        with self.condition:
+            self._reserve(timeout)
+
+    def commit(self, frame_time, frame):
+        """Publish the frame that was read into the reserved buffer (or a
+        FramePacket or array of its own in the reserved slot)"""
+        with self.condition:
+            if self._reserved is None:
+                raise RuntimeError("No reel buffer was reserved before commit")
+
+            if self._reserved == -1:
+                self.dropped_newest += 1
+            else:
+                if self._count == self.capacity:
+                    # make the oldest frame unreadable; its slot is the next spare
+                    self._frames[self._head] = None
+                    self._head = (self._head + 1) % self._slot_count
+                    self._count -= 1
+                    self.dropped_oldest += 1
+
+                if isinstance(frame, np.ndarray):
+                    frame = read_only(frame)
+                self._frames[self._reserved] = frame
+                self._frame_times[self._reserved] = frame_time
+                self._count += 1
+                self.frames_in += 1
+                self.peak_occupancy = max(self.peak_occupancy, self._count)
+                self.condition.notify_all()
+
+            self._reserved = None
+
+    def cancel(self):
+        """Release a reservation without publishing a frame (e.g. bad read)"""
+        with self.condition:
+            self._reserved = None
+
+    def get(self, block=True, timeout=None):
+        """Mirrors Queue.get(); returns [frame_time, frame]"""
+        with self.condition:
+            if not block:
+                if self._count == 0:
+                    raise Empty
+            elif not self.condition.wait_for(lambda: self._count > 0, timeout):
+                raise Empty
+
+            index = self._head
+            frame_time = self._frame_times[index]
+            frame = self._frames[index]
+            self._frames[index] = None  # the consumer holds it now
+
+            self._head = (self._head + 1) % self._slot_count
+            self._count -= 1
+            self.frames_out += 1
+            self.condition.notify_all()
+
+        return [frame_time, frame]
@@ -0,0 +1,57 @@
+# The most recent frame read by a stream, along with a version number that
+# goes up by one with every new frame. Consumers that only care about what
+# the camera sees right now (the GUI preview, the MonoCalibrator) remember
+# the version they last handled and block until a newer one is published,
+# rather than polling on a timer. They never see the same frame twice and
+# use no CPU while nothing new has arrived.
+#
+# The LiveStream publishes a FramePacket (see frame_packet.py), so with MJPEG
+# passthrough a frame nobody looks at is never decoded. Frames published here
+# must not be modified afterwards by the stream, so a consumer holding one is
+# never looking at a half-overwritten image. A frame read into a reel buffer
+# is published here as a view of that buffer, and the reel won't read into a
+# buffer again while a view of it is held (see frame_reel.py).
+
+from threading import Condition
+
+
+class LatestFrame:
+    def __init__(self):
+        self.condition = Condition()
+        self.version = 0  # 0 means nothing has been published yet
+        self.frame_time = None
+        self.frame = None
+        self.subscribers = []  # queues that are also put [frame_time, frame]
+
+    def subscribe(self, q):
+        """Every frame is also put on the queue. This happens on the capture
+        thread, so the queue should drop rather than block when full (e.g.
+        an AsyncSubscription with the "drop_oldest" overflow policy)"""
+        self.subscribers.append(q)
+
+    def release(self, q):
+        self.subscribers.remove(q)
+
+    def publish(self, frame_time, frame):
+        with self.condition:
+            self.version += 1
+            self.frame_time = frame_time
+            self.frame = frame
+            self.condition.notify_all()
+
+        for q in self.subscribers:
+            q.put([frame_time, frame])
+
+    def get(self):
+        """The current (version, frame_time, frame) without waiting"""
+        with self.condition:
+            return self.version, self.frame_time, self.frame
+
+    def wait_for_newer(self, version, timeout=None):
+        """Block until a frame newer than `version` is published and return
+        (version, frame_time, frame). Frames published in the meantime are
+        skipped over. Returns None on timeout"""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.version > version, timeout):
+                return None
+            return self.version, self.frame_time, self.frame
@@ -12,27 +12,62 @@ import sys
 import time as time_module # peculier bug popped up during module testing...perhaps related to conda environment?
 from datetime import datetime
 from pathlib import Path
-from queue import Queue
-from threading import Thread, Event
+from queue import Queue, Full
+from threading import Thread, Event, Lock, Semaphore
 
 import cv2
 import mediapipe as mp
 import numpy as np
 
 from src.cameras.camera import Camera
+from src.cameras.frame_packet import FramePacket
+from src.cameras.frame_reel import FrameReel
+from src.cameras.latest_frame import LatestFrame
+from src.cameras.telemetry import StreamTelemetry
+
+REEL_CAPACITY = 8  # frames held for the synchronizer before overflow policy applies
 
 
 class LiveStream:
-    def __init__(self, camera):
+    def __init__(self, camera, reel_capacity=REEL_CAPACITY, reel_overflow="drop_oldest"):
         self.camera = camera
         self.port = camera.port
 
-        self.reel = Queue(-1)  # infinite size....hopefully doesn't blow up
+        # fixed size ring of preallocated frames; see frame_reel.py for overflow policies
+        self.reel = FrameReel(reel_capacity, reel_overflow)
+        self.reel.allocate(self.frame_shape)
         self.shutter_sync = Queue()
         self.stop_confirm = Queue()
         self.stop_event = Event() 
 
         self.push_to_reel = False
+
+        # When set, frames bound for the reel are grabbed by whoever fires the
+        # shutter (see Synchronizer capture_mode) and this thread only
+        # retrieves (decodes) them. Timestamps are then taken at grab.
+        self.grab_retrieve = False
+        self.grab_time = None
+        self.capture_lock = Lock()  # capture is touched by the grabbing thread too
+        self.retrieved = Semaphore(1)  # a grabbed frame must be retrieved before the next grab
+
+        # When set, the camera is asked for MJPG and frames are carried as
+        # the undecoded JPEG the device sent (see frame_packet.py). They
+        # vary in size so are not read into the preallocated reel buffers
+        self.mjpeg_passthrough = False
+
+        # a resolution change takes the stream offline for a moment
+        self.reconnecting = False
+        self.reconnect_time = None  # frames from before this are stale
+        self.resolution_subscribers = []
+        self._pending_resolution_change = None
+        self.time_to_first_frame = None
+
+        # most recent frame for previews and calibrators; see latest_frame.py
+        self.latest_frame = LatestFrame()
+
+        self.telemetry = StreamTelemetry(self.port)
+        self._reel_drops_seen = 0
+
         self.show_fps = False
         self.FPS_actual = 0
         # Start the thread to read frames from the video stream
@@ -43,6 +78,22 @@ class LiveStream:
         self.frame_time = time_module.perf_counter()
         self.avg_delta_time = 1 # trying to avoid div 0 error...not sure about this though
         
+    @property
+    def frame_shape(self):
+        width, height = self.camera.resolution
+        return (height, width, 3)
+
+    def set_mjpeg_passthrough(self, enabled=True):
+        """Carry frames as undecoded JPEG. Whether the device obliges only
+        shows up in the frames themselves, so consumers check each packet"""
+        with self.capture_lock:
+            self.camera.request_mjpeg_passthrough(enabled)
+            self.mjpeg_passthrough = enabled
+
+    def reel_stats(self):
+        """Drop counters and occupancy of the frame reel"""
+        return self.reel.stats()
+
 
     def get_FPS_actual(self):
         """set the actual frame rate; called within roll_camera()"""
@@ -84,19 +135,54 @@ class LiveStream:
                     _ = self.shutter_sync.get()
                     logging.debug(f"Shutter fire signal retrieved at port {self.port}")
 
-                # read in working frame
-                read_start = time_module.perf_counter()
-                self.success, self._working_frame = self.camera.capture.read()
-                
-                if self.show_fps:
-                    self._add_fps()
-                
-                read_stop = time_module.perf_counter()
-                self.frame_time = (read_start + read_stop) / 2
+                # frames destined for the reel are read directly into its buffers;
+                # JPEG bytes under passthrough come in arrays of their own
+                buffer = None
+                reserved = False
+                if self.push_to_reel:
+                    reserved, buffer = self._reserve_reel_slot()
+                    if not reserved:
+                        continue  # stop signal arrived while the reel was full
 
-                if self.push_to_reel and self.success:
-                    logging.debug(f"Pushing frame to reel at port {self.port}")
-                    self.reel.put([self.frame_time, self._working_frame])
+                read_start = time_module.perf_counter()
+                if self.push_to_reel and self.grab_retrieve:
+                    # frame was already grabbed; only the decode happens here
+                    self.success, self._working_frame = self._retrieve(buffer)
+                    read_stop = time_module.perf_counter()
+                else:
+                    # read in working frame
+                    with self.capture_lock:
+                        self.success, self._working_frame = self.camera.capture.read(buffer)
+                    read_stop = time_module.perf_counter()
+                    self.frame_time = (read_start + read_stop) / 2
+
+                if self.success:
+                    self.telemetry.record_read(read_start, read_stop, self.frame_time)
+                    if self._pending_resolution_change is not None:
+                        self._announce_resolution_change(self.frame_time, read_stop)
+
+                    packet = FramePacket.from_capture(self.frame_time, self._working_frame)
+                    if packet.compressed:
+                        # one packet serves the reel and the preview so that
+                        # it is decoded at most once between them
+                        reel_frame = packet
+                    else:
+                        if self.show_fps:
+                            self._add_fps()
+                        # the preview and the reel share the buffer it was read into
+                        reel_frame = packet.frame
+
+                    self.latest_frame.publish(self.frame_time, packet)
+                else:
+                    self.telemetry.record_failed_read()
+
+                if reserved:
+                    if self.success:
+                        logging.debug(f"Pushing frame to reel at port {self.port}")
+                        self.reel.commit(self.frame_time, reel_frame)
+                        self._record_reel_telemetry()
+                    else:
+                        self.reel.cancel()
 
                 # Rate of calling recalc must be frequency of this loop
                 self.FPS_actual = self.get_FPS_actual()
@@ -105,7 +191,105 @@ class LiveStream:
         self.stop_event.clear()
         self.stop_confirm.put("Successful Stop")
 
-    def change_resolution(self, res):
+    def _record_reel_telemetry(self):
+        self.telemetry.record_depth(self.reel.occupancy)
+        new_drops = self.reel.dropped - self._reel_drops_seen
+        if new_drops:
+            self.telemetry.record_drop(new_drops)
+            self._reel_drops_seen += new_drops
+
+    def ready_to_grab(self, timeout=1):
+        """Wait for the previously grabbed frame to be retrieved. Must return
+        True before grab() is called"""
+        if self.retrieved.acquire(timeout=timeout):
+            return True
+        logging.warning(f"Previous grab at port {self.port} not yet retrieved")
+        return False
+
+    def grab(self):
+        """Latch the next frame on the device without decoding it. Called by
+        the thread firing the shutter so that all cameras can be grabbed
+        back-to-back; the roll_camera thread retrieves the frame afterwards"""
+        with self.capture_lock:
+            success = self.camera.capture.grab()
+            # the frame is in hand as soon as grab returns
+            self.grab_time = time_module.perf_counter() if success else None
+
+        if not success:
+            self.retrieved.release()
+        return success
+
+    def _retrieve(self, buffer):
+        """Decode the frame latched by grab(), stamped with the time of the grab"""
+        if self.grab_time is None:
+            # shutter fired without a grab (e.g. to break out of the loop)
+            return False, None
+
+        with self.capture_lock:
+            success, frame = self.camera.capture.retrieve(buffer)
+        self.frame_time = self.grab_time
+        self.grab_time = None
+        self.retrieved.release()
+        return success, frame
+
+    def _reserve_reel_slot(self):
+        """Returns (reserved, buffer to read into). Under MJPEG passthrough only
+        a slot is reserved and the buffer is None. Under the "block" overflow
+        policy this waits for the consumer to free up a slot, but still keeps
+        an eye on the stop signal"""
+        while not self.stop_event.is_set():
+            try:
+                if self.mjpeg_passthrough:
+                    self.reel.reserve_slot(timeout=0.1)
+                    return True, None
+                return True, self.reel.reserve(timeout=0.1)
+            except Full:
+                logging.debug(f"Reel full at port {self.port}; waiting for consumer")
+        return False, None
+
+    def subscribe_to_resolution_change(self, q):
+        """The queue will receive a dictionary describing each change of
+        resolution, put there just before the first frame at the new
+        resolution is published. Frames with a frame_time at or after the
+        event's first_frame_time are at the new resolution"""
+        logging.info(f"Adding queue to receive resolution changes at port {self.port}")
+        self.resolution_subscribers.append(q)
+
+    def release_resolution_q(self, q):
+        logging.info(f"Releasing resolution change queue at port {self.port}")
+        self.resolution_subscribers.remove(q)
+
+    def _announce_resolution_change(self, frame_time, read_stop):
+        change = self._pending_resolution_change
+        self._pending_resolution_change = None
+
+        self.time_to_first_frame = read_stop - change["change_start"]
+        logging.info(
+            f"First frame at {change['resolution']} from port {self.port} arrived "
+            f"{self.time_to_first_frame:.2f} seconds after the change was requested"
+        )
+
+        event = {
+            "port": self.port,
+            "resolution": change["resolution"],
+            "first_frame_time": frame_time,
+            "time_to_first_frame": self.time_to_first_frame,
+        }
+        for q in self.resolution_subscribers:
+            q.put(event)
+
+    def change_resolution(self, res, block=True):
+        """Reconnect the camera at a new resolution. While this is underway
+        the stream is flagged as reconnecting so that a synchronizer leaves
+        it out of bundles rather than waiting on it. With block=False the
+        change is made on a background thread, which is returned"""
+        if not block:
+            thread = Thread(target=self.change_resolution, args=(res,), daemon=True)
+            thread.start()
+            return thread
+
+        change_start = time_module.perf_counter()
+        self.reconnecting = True
 
         logging.info(f"About to stop camera at port {self.port}")
         self.stop_event.set()
@@ -116,17 +300,37 @@ class LiveStream:
         self.FPS_actual = 0
         self.avg_delta_time = None
 
-        # reconnecting a few times without disconnnect sometimes crashed python
-        logging.info(f"Disconnecting from port {self.port}")
-        self.camera.disconnect()
-        logging.info(f"Reconnecting to port {self.port}")
-        self.camera.connect()
+        with self.capture_lock:
+            # reconnecting a few times without disconnnect sometimes crashed python
+            logging.info(f"Disconnecting from port {self.port}")
+            self.camera.disconnect()
+            logging.info(f"Reconnecting to port {self.port}")
+            self.camera.connect()
+            self.telemetry.record_reconnect()
+
+            if self.mjpeg_passthrough:
+                # a fresh capture starts out decoding
+                self.camera.request_mjpeg_passthrough()
+            self.camera.resolution = res
+            self.reel.allocate(self.frame_shape)
+
+            # anything grabbed or triggered before the change is stale
+            self.grab_time = None
+            self.retrieved = Semaphore(1)
+            while not self.shutter_sync.empty():
+                self.shutter_sync.get_nowait()
+
+        self._pending_resolution_change = {
+            "resolution": tuple(self.camera.resolution),
+            "change_start": change_start,
+        }
+        self.reconnect_time = time_module.perf_counter()
 
-        self.camera.resolution = res
         # Spin up the thread again now that resolution is changed
         logging.info(f"Beginning roll_camera thread at port {self.port} with resolution {res}")
         self.thread = Thread(target=self.roll_camera, args=(), daemon=True)
         self.thread.start()
+        self.reconnecting = False
 
     def _add_fps(self):
         """NOTE: this is used in code at bottom, not in external use"""
@@ -0,0 +1,138 @@
+# Paces a loop (the Synchronizer firing its shutter) at a target rate. Each
+# tick has a deadline on a fixed grid, start + n / fps, rather than being one
+# period after the last tick actually happened. Lateness on one tick then
+# doesn't push back all the ticks that follow, so the rate achieved over a
+# recording is the rate asked for and the nominal fps of its video is true.
+#
+# Waiting is a sleep for most of the way followed by a spin for the rest.
+# time.sleep() tends to overshoot, by an amount that depends on the OS and
+# its timer; that overshoot is measured once and the sleep cut short by it.
+# The spin that covers the remainder is short, so the wait is precise
+# without polling the clock for the whole period.
+#
+# When a tick comes too late:
+#   - by less than catch_up periods, the missed deadlines still stand and
+#     the next ticks come immediately until the loop is back on the grid
+#   - by more, the missed ticks are skipped and the next tick waits for the
+#     next deadline on the grid, so there is no burst of catching up
+#
+# The intervals between ticks and their lateness are kept to report jitter.
+
+import logging
+import time
+from collections import deque
+from functools import lru_cache
+
+import numpy as np
+
+TICK_HISTORY = 500  # ticks kept for jitter statistics
+CATCH_UP = 1  # periods a tick can be behind and still be made up
+
+
+@lru_cache(maxsize=None)
+def sleep_overshoot(samples=50, request=0.001):
+    """Typical amount by which time.sleep() oversleeps on this machine (90th
+    percentile of a few short sleeps), in seconds"""
+    overshoots = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        time.sleep(request)
+        overshoots.append(time.perf_counter() - start - request)
+    overshoot = float(np.percentile(overshoots, 90))
+    logging.info(f"time.sleep() overshoots by up to {overshoot * 1000:.3f} ms")
+    return max(overshoot, 0)
+
+
+class Pacer:
+    def __init__(self, fps, catch_up=CATCH_UP):
+        self.catch_up = catch_up
+        self.spin_margin = sleep_overshoot()
+
+        self.tick_times = deque(maxlen=TICK_HISTORY)
+        self.lateness = deque(maxlen=TICK_HISTORY)  # seconds after the deadline
+        self.ticks = 0
+        self.skipped = 0
+
+        self.fps = None
+        self.grid_start = None  # time of the first tick on the grid of deadlines
+        self.grid_index = 0  # place on the grid of the next tick
+        self.set_fps(fps)
+
+    def set_fps(self, fps):
+        """Change the rate; the grid of deadlines (and the jitter statistics)
+        start over from the next tick"""
+        if fps == self.fps:
+            return
+        if fps is not None and fps <= 0:
+            raise ValueError(f"Pacing rate must be positive, not {fps}")
+        logging.info(f"Pacing at {fps} fps")
+        self.fps = fps
+        self.grid_start = None
+        self.grid_index = 0
+        self.tick_times.clear()
+        self.lateness.clear()
+
+    @property
+    def period(self):
+        return 1 / self.fps
+
+    def deadline(self):
+        return self.grid_start + self.grid_index * self.period
+
+    def wait(self, fps=None):
+        """Block until the next tick is due. Passing fps lets the rate be
+        changed in place. Returns the lateness of the tick in seconds"""
+        if fps is not None:
+            self.set_fps(fps)
+
+        now = time.perf_counter()
+        if self.grid_start is None:
+            # first tick on a new grid goes now
+            self.grid_start = now
+            self.grid_index = 0
+
+        deadline = self.deadline()
+        behind = (now - deadline) / self.period
+        if behind > self.catch_up:
+            # give up on the missed ticks and wait for the next one on the grid
+            missed = int(np.ceil(behind))
+            self.skipped += missed
+            self.grid_index += missed
+            deadline = self.deadline()
+            logging.debug(f"Pacer behind by {behind:.1f} periods; skipped {missed} ticks")
+
+        remaining = deadline - time.perf_counter()
+        if remaining > self.spin_margin:
+            time.sleep(remaining - self.spin_margin)
+        while time.perf_counter() < deadline:
+            pass
+
+        tick_time = time.perf_counter()
+        self.tick_times.append(tick_time)
+        self.lateness.append(tick_time - deadline)
+        self.ticks += 1
+        self.grid_index += 1
+        return tick_time - deadline
+
+    def stats(self):
+        """Achieved rate, and jitter of the ticks (ms)"""
+        stats = {
+            "fps_target": self.fps,
+            "ticks": self.ticks,
+            "skipped": self.skipped,
+            "spin_margin_ms": self.spin_margin * 1000,
+        }
+        if len(self.tick_times) > 2:
+            intervals = np.diff(self.tick_times) * 1000
+            lateness = np.array(self.lateness) * 1000
+            stats.update(
+                {
+                    "fps_actual": (len(self.tick_times) - 1) / (self.tick_times[-1] - self.tick_times[0]),
+                    "interval_mean_ms": float(np.mean(intervals)),
+                    "interval_std_ms": float(np.std(intervals)),
+                    "lateness_median_ms": float(np.median(lateness)),
+                    "lateness_p95_ms": float(np.percentile(lateness, 95)),
+                    "lateness_max_ms": float(np.max(lateness)),
+                }
+            )
+        return stats
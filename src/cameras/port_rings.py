@@ -0,0 +1,121 @@
+# Frames harvested by a Synchronizer that have not yet been put in a bundle.
+# Each port gets a fixed-size ring, addressed by integer position, holding
+# its pending frames oldest first: the first is the port's "current" frame
+# (the candidate for the bundle being built) and the second its "next".
+# Frame times are also kept in one array across all ports so the bundler
+# can look at every port's current and next times at once.
+#
+# One condition variable is notified whenever a frame arrives, so the
+# bundler can sleep until every port it is waiting on has what it needs
+# rather than polling. Rings never grow: when one port lags and the others
+# keep delivering, their oldest pending frames are dropped once the ring is
+# full (and counted as overflow), instead of piling up without limit.
+
+import logging
+from threading import Condition
+
+import numpy as np
+
+RING_CAPACITY = 32  # pending frames held per port
+
+
+class PortRings:
+    def __init__(self, ports, capacity=RING_CAPACITY):
+        if capacity < 2:
+            raise ValueError("Port rings must hold at least a current and next frame")
+
+        self.ports = list(ports)
+        self.capacity = capacity
+        self.row = {port: row for row, port in enumerate(self.ports)}
+
+        self.entries = [[None] * capacity for _ in self.ports]
+        self.frame_times = np.full((len(self.ports), capacity), np.nan)
+        self.head = np.zeros(len(self.ports), dtype=np.int64)  # position of the current frame
+        self.count = np.zeros(len(self.ports), dtype=np.int64)  # pending frames
+
+        self.overflow = {port: 0 for port in self.ports}
+        self.condition = Condition()
+
+    def push(self, port, frame_data):
+        """Add a newly harvested frame to the end of the port's ring"""
+        row = self.row[port]
+        with self.condition:
+            if self.count[row] == self.capacity:
+                self._drop_current(row)
+                self.overflow[port] += 1
+                logging.debug(f"Ring full at port {port}; dropping its oldest pending frame")
+
+            position = (self.head[row] + self.count[row]) % self.capacity
+            self.entries[row][position] = frame_data
+            self.frame_times[row, position] = frame_data["frame_time"]
+            self.count[row] += 1
+            self.condition.notify_all()
+
+    def _drop_current(self, row):
+        head = self.head[row]
+        self.entries[row][head] = None
+        self.frame_times[row, head] = np.nan
+        self.head[row] = (head + 1) % self.capacity
+        self.count[row] -= 1
+
+    def pending(self, port):
+        return int(self.count[self.row[port]])
+
+    def current(self, port):
+        row = self.row[port]
+        return self.entries[row][self.head[row]] if self.count[row] > 0 else None
+
+    def next(self, port):
+        row = self.row[port]
+        return self.entries[row][(self.head[row] + 1) % self.capacity] if self.count[row] > 1 else None
+
+    def current_time(self, port):
+        row = self.row[port]
+        return self.frame_times[row, self.head[row]]
+
+    def next_time(self, port):
+        row = self.row[port]
+        return self.frame_times[row, (self.head[row] + 1) % self.capacity]
+
+    def pending_times(self, port):
+        """Frame times of all of the port's pending frames, oldest first"""
+        row = self.row[port]
+        positions = (self.head[row] + np.arange(self.count[row])) % self.capacity
+        return self.frame_times[row, positions]
+
+    def latest_time(self, port):
+        """Time of the port's most recent pending frame (-inf if it has none)"""
+        row = self.row[port]
+        if self.count[row] == 0:
+            return -np.inf
+        return self.frame_times[row, (self.head[row] + self.count[row] - 1) % self.capacity]
+
+    def rows(self, ports):
+        """Row of each port in the arrays below"""
+        return np.array([self.row[port] for port in ports], dtype=np.int64)
+
+    def current_times(self, rows):
+        return self.frame_times[rows, self.head[rows]]
+
+    def next_times(self, rows):
+        return self.frame_times[rows, (self.head[rows] + 1) % self.capacity]
+
+    def pop(self, port):
+        """Remove and return the port's current frame; its next becomes current"""
+        row = self.row[port]
+        with self.condition:
+            frame_data = self.entries[row][self.head[row]]
+            self._drop_current(row)
+        return frame_data
+
+    def has_next(self, rows):
+        """True when every one of the rows has both a current and next frame"""
+        return bool(np.all(self.count[rows] > 1))
+
+    def wake(self):
+        """Release anything waiting on the condition (e.g. to notice a stop)"""
+        with self.condition:
+            self.condition.notify_all()
+
+    def __len__(self):
+        return int(self.count.sum())
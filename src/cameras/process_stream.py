@@ -0,0 +1,382 @@
+# An optional alternative to the LiveStream that runs the camera read loop
+# in its own process so that frame capture is not competing for the GIL with
+# the synchronizer, the frame harvesters, and everything downstream.
+#
+# Frames are written by the child process directly into slots of a
+# multiprocessing.shared_memory block. Only the slot index and frame time
+# cross the process boundary via a queue, so no frame is ever pickled.
+#
+# From the perspective of the Synchronizer this behaves like a LiveStream:
+# it has a `reel` with a get() method, a `shutter_sync` with a put() method,
+# and a `push_to_reel` flag. It also keeps a `latest_frame` for previews and
+# the MonoCalibrator. While nothing is synchronizing the stream, the capture
+# process reads frames for the preview alone, and a thread in this process
+# takes them as they come; synchronized frames are published there as well.
+#
+# As with the FrameReel, frames handed out by the reel are never its slots:
+# each frame is copied out of shared memory as it is taken, and the slot goes
+# straight back to the camera process.
+
+import logging
+import multiprocessing as mp
+import time
+from multiprocessing import shared_memory
+from queue import Empty
+from threading import Event, Thread
+
+import cv2
+import numpy as np
+
+from src.cameras.frame_packet import FramePacket
+from src.cameras.latest_frame import LatestFrame
+from src.cameras.telemetry import StreamTelemetry
+
+SLOT_CAPACITY = 8  # unread frames the camera process may get ahead of the consumer
+POLL_INTERVAL = 0.1  # seconds between checks of the stop signal in blocking calls
+
+
+class CaptureFactory:
+    """Picklable recipe for opening a camera inside the child process.
+    Called with no arguments it returns an opened cv2.VideoCapture"""
+
+    def __init__(self, port, resolution, exposure=None):
+        self.port = port
+        self.resolution = resolution
+        self.exposure = exposure
+
+    def __call__(self):
+        capture = cv2.VideoCapture(self.port)
+        capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.resolution[0])
+        capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.resolution[1])
+        if self.exposure is not None:
+            capture.set(cv2.CAP_PROP_EXPOSURE, self.exposure)
+        return capture
+
+
+def capture_worker(
+    port,
+    capture_factory,
+    shm_name,
+    shape,
+    slot_count,
+    shutter_sync,
+    push_to_reel,
+    free_slots,
+    filled_slots,
+    preview_slots,
+    stop_event,
+):
+    """Runs in the child process. Reads frames into free shared memory slots
+    and announces each filled slot with its frame time, on filled_slots when
+    the shutter fired it or preview_slots otherwise"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    slots = np.ndarray((slot_count, *shape), dtype=np.uint8, buffer=shm.buf)
+    capture = capture_factory()
+
+    height, width = shape[0], shape[1]
+
+    while not stop_event.is_set():
+        if push_to_reel.is_set():
+            try:
+                shutter_sync.get(timeout=POLL_INTERVAL)
+            except Empty:
+                continue
+
+            # wait for the consumer to hand back a slot
+            slot = None
+            while slot is None and not stop_event.is_set():
+                try:
+                    slot = free_slots.get(timeout=POLL_INTERVAL)
+                except Empty:
+                    pass
+            if slot is None:
+                break
+            announce = filled_slots
+        else:
+            # frames only go to the preview, and only once it has taken the last
+            try:
+                slot = free_slots.get(timeout=POLL_INTERVAL)
+            except Empty:
+                capture.grab()  # keep the capture buffer fresh in the meantime
+                continue
+            announce = preview_slots
+
+        read_start = time.perf_counter()
+        success, frame = capture.read(slots[slot])
+        read_stop = time.perf_counter()
+
+        if not success:
+            free_slots.put(slot)
+            continue
+
+        if frame.shape != slots[slot].shape:
+            # device did not honor the requested resolution
+            slots[slot] = cv2.resize(frame, (width, height))
+
+        # perf_counter is system-wide on Linux/Windows so the parent can
+        # compare these frame times with those of other processes
+        frame_time = (read_start + read_stop) / 2
+        announce.put((slot, frame_time, read_stop - read_start))
+
+    capture.release()
+    del slots
+    shm.close()
+
+
+class SharedMemoryReel:
+    """Parent side view of the frames produced by the capture process.
+    Mirrors the Queue.get() interface of the reel on a LiveStream"""
+
+    def __init__(self, capacity, telemetry=None, on_frame=None):
+        self.capacity = capacity
+        self.telemetry = telemetry
+        self.on_frame = on_frame  # called with (frame_time, read_stop, frame) for each frame taken
+        self.free_slots = mp.Queue()
+        self.filled_slots = mp.Queue()
+        self.preview_slots = mp.Queue()
+        self.slots = None
+
+        self.frames_out = 0
+
+    def load_slots(self, slots):
+        """Take on a new block of slots (on start up or after a resolution change)"""
+        self.slots = slots
+        for slot in range(len(slots)):
+            self.free_slots.put(slot)
+
+    def unload_slots(self):
+        """Forget the current block of slots once the capture process is done with it"""
+        for q in (self.free_slots, self.filled_slots, self.preview_slots):
+            while True:
+                try:
+                    q.get(timeout=POLL_INTERVAL)
+                except Empty:
+                    break
+        self.slots = None
+
+    def get(self, block=True, timeout=None):
+        slot, frame_time, read_duration = self.filled_slots.get(block, timeout)
+        frame = self.take(slot, frame_time, read_duration)
+        self.frames_out += 1
+        return [frame_time, frame]
+
+    def take(self, slot, frame_time, read_duration):
+        """Copy the frame out of a filled slot and hand the slot back"""
+        # the read happened in the capture process; only its duration came across
+        read_stop = frame_time + read_duration / 2
+        if self.telemetry is not None:
+            self.telemetry.record_read(read_stop - read_duration, read_stop, frame_time)
+            try:
+                self.telemetry.record_depth(self.filled_slots.qsize())
+            except NotImplementedError:
+                pass  # qsize is unavailable on macOS
+
+        # the slot is read into again as soon as it is handed back
+        frame = self.slots[slot].copy()
+        self.free_slots.put(slot)
+
+        if self.on_frame is not None:
+            self.on_frame(frame_time, read_stop, frame)
+        return frame
+
+    def qsize(self):
+        return self.filled_slots.qsize()
+
+    def empty(self):
+        return self.filled_slots.empty()
+
+
+class ProcessStream:
+    def __init__(self, camera, capture_factory=None, capacity=SLOT_CAPACITY):
+        self.camera = camera
+        self.port = camera.port
+
+        if capture_factory is None:
+            # stand-in cameras bring their own recipe for opening a capture
+            capture_factory = getattr(camera, "capture_factory", None)
+        if capture_factory is None:
+            capture_factory = CaptureFactory(
+                camera.port, camera.resolution, camera.exposure
+            )
+        self.capture_factory = capture_factory
+
+        # these persist across restarts of the capture process so that a
+        # synchronizer holding on to them is unaffected
+        self.telemetry = StreamTelemetry(self.port)
+
+        self.reconnecting = False
+        self.reconnect_time = None  # frames from before this are stale
+        self.resolution_subscribers = []
+        self._pending_resolution_change = None
+        self.time_to_first_frame = None
+        self.reel = SharedMemoryReel(capacity, self.telemetry, on_frame=self._publish)
+        self.shutter_sync = mp.Queue()
+        self._push_to_reel = mp.Event()
+        self.stop_event = mp.Event()
+
+        # most recent frame for previews and calibrators; see latest_frame.py
+        self.latest_frame = LatestFrame()
+        self.preview_stop = Event()
+
+        # the device can only be opened once, so the child process takes over
+        logging.info(f"Handing capture at port {self.port} over to a child process")
+        self.camera.disconnect()
+        self.start_process()
+
+    @property
+    def push_to_reel(self):
+        return self._push_to_reel.is_set()
+
+    @push_to_reel.setter
+    def push_to_reel(self, value):
+        if value:
+            self._push_to_reel.set()
+        else:
+            self._push_to_reel.clear()
+
+    @property
+    def FPS_actual(self):
+        """Frame rate of the capture process, as seen by the frames taken from it"""
+        return self.telemetry.summary()["fps"] or 0
+
+    def start_process(self):
+        width, height = self.camera.resolution
+        self.shape = (height, width, 3)
+        if hasattr(self.capture_factory, "resolution"):
+            self.capture_factory.resolution = (width, height)
+
+        # one slot for each frame that may be waiting on the consumer
+        slot_count = self.reel.capacity
+        frame_bytes = int(np.prod(self.shape))
+        self.shm = shared_memory.SharedMemory(create=True, size=slot_count * frame_bytes)
+        self.reel.load_slots(
+            np.ndarray((slot_count, *self.shape), dtype=np.uint8, buffer=self.shm.buf)
+        )
+
+        self.stop_event.clear()
+        self.process = mp.Process(
+            target=capture_worker,
+            args=(
+                self.port,
+                self.capture_factory,
+                self.shm.name,
+                self.shape,
+                slot_count,
+                self.shutter_sync,
+                self._push_to_reel,
+                self.reel.free_slots,
+                self.reel.filled_slots,
+                self.reel.preview_slots,
+                self.stop_event,
+            ),
+            daemon=True,
+        )
+        self.process.start()
+        logging.info(f"Capture process started for port {self.port} at {width}x{height}")
+
+        self.preview_stop.clear()
+        self.preview_thread = Thread(target=self.take_previews, args=(), daemon=True)
+        self.preview_thread.start()
+
+    def take_previews(self):
+        """Worker function that takes frames read while nothing is
+        synchronizing the stream, so that the preview keeps up"""
+        while not self.preview_stop.is_set():
+            try:
+                slot, frame_time, read_duration = self.reel.preview_slots.get(timeout=POLL_INTERVAL)
+            except Empty:
+                continue
+            self.reel.take(slot, frame_time, read_duration)
+
+    def _publish(self, frame_time, read_stop, frame):
+        if self._pending_resolution_change is not None:
+            self._announce_resolution_change(frame_time, read_stop)
+        self.latest_frame.publish(frame_time, FramePacket(frame_time, frame=frame))
+
+    def stop_process(self):
+        self.stop_event.set()
+        logging.info(f"Stop signal sent to capture process at port {self.port}")
+        self.process.join(timeout=5 * POLL_INTERVAL + 1)
+        if self.process.is_alive():
+            logging.warning(f"Capture process at port {self.port} did not exit; terminating")
+            self.process.terminate()
+
+        # slots must not be taken once they have been handed back for good
+        self.preview_stop.set()
+        self.preview_thread.join()
+
+        # views onto the shared memory must be dropped before it can be closed
+        self.reel.unload_slots()
+        try:
+            self.shm.close()
+        except BufferError:
+            logging.warning(f"Frames from port {self.port} still referenced; leaving shared memory mapped")
+        self.shm.unlink()
+
+    def stop(self):
+        self.push_to_reel = False
+        self.stop_process()
+
+        # reconnect in this process so the camera can be used as before
+        self.camera.connect()
+        self.camera.resolution = (self.shape[1], self.shape[0])
+        logging.info(f"Capture at port {self.port} returned to the main process")
+
+    def subscribe_to_resolution_change(self, q):
+        """See LiveStream.subscribe_to_resolution_change"""
+        logging.info(f"Adding queue to receive resolution changes at port {self.port}")
+        self.resolution_subscribers.append(q)
+
+    def release_resolution_q(self, q):
+        logging.info(f"Releasing resolution change queue at port {self.port}")
+        self.resolution_subscribers.remove(q)
+
+    def _announce_resolution_change(self, frame_time, read_stop):
+        """See LiveStream._announce_resolution_change; called with the first
+        frame taken from the restarted capture process"""
+        change = self._pending_resolution_change
+        self._pending_resolution_change = None
+
+        self.time_to_first_frame = read_stop - change["change_start"]
+        logging.info(
+            f"First frame at {change['resolution']} from port {self.port} arrived "
+            f"{self.time_to_first_frame:.2f} seconds after the change was requested"
+        )
+
+        event = {
+            "port": self.port,
+            "resolution": change["resolution"],
+            "first_frame_time": frame_time,
+            "time_to_first_frame": self.time_to_first_frame,
+        }
+        for q in self.resolution_subscribers:
+            q.put(event)
+
+    def change_resolution(self, res, block=True):
+        if not block:
+            thread = Thread(target=self.change_resolution, args=(res,), daemon=True)
+            thread.start()
+            return thread
+
+        change_start = time.perf_counter()
+        self.reconnecting = True
+        self.stop_process()
+
+        # briefly take the device back to find out what resolution it settles on
+        self.camera.connect()
+        self.camera.resolution = res
+        self.camera.disconnect()
+
+        # every frame from the new process is at the new size; the first one
+        # taken announces the change
+        self._pending_resolution_change = {
+            "resolution": self.camera.resolution,
+            "change_start": change_start,
+        }
+        self.reconnect_time = time.perf_counter()
+        self.start_process()
+        self.telemetry.record_reconnect()
+
+        logging.info(f"Capture process at port {self.port} restarted in {time.perf_counter() - change_start:.2f} seconds")
+        self.reconnecting = False
@@ -0,0 +1,185 @@
+# Adjusts the rate at which a Synchronizer fires its shutter to what its
+# consumers can keep up with, within bounds set by the user. A fixed
+# fps_target is either too high for the consumers of the moment (corner
+# detection on every stereo pair lags, and its queue backs up or drops) or
+# too low (everything is idle and frames that could have been used are
+# never captured).
+#
+# Every check interval the controller looks at each bundle Subscription of
+# the synchronizer:
+#   - processing time: how long the consumer spends on a bundle, which caps
+#     the rate it could sustain (with some headroom kept back)
+#   - lag: how long the oldest waiting bundle has been waiting
+#   - drops: bundles discarded since the last check
+# A consumer that is backing up (lag of more than a couple of periods, or
+# any new drops) cuts the rate by a fraction at once. Otherwise the rate
+# climbs by a smaller fraction each check, up to what the slowest consumer
+# can take. It doesn't climb while the synchronizer can't keep to the rate
+# it already has (its pacer is skipping ticks).
+#
+# Each change is published to rate subscribers as a dict of time,
+# fps_target and reason, so that anything that depends on the rate can
+# follow it. hold() freezes the rate (the VideoRecorder holds it while
+# recording so the video's frame rate stays true) until resume().
+
+import logging
+import time
+from collections import deque
+from threading import Event, Lock, Thread
+
+from src.cameras.subscription import Subscription
+
+CHECK_INTERVAL = 0.5  # seconds between adjustments
+HEADROOM = 0.8  # fraction of a consumer's capacity to run at
+LAG_LIMIT = 2  # periods a bundle can wait before its consumer counts as backed up
+DECREASE = 0.75  # factor applied to the rate when a consumer backs up
+INCREASE = 1.25  # factor applied per check while all consumers keep up
+CHANGE_HISTORY = 100
+
+
+class RateController:
+    def __init__(self, synchronizer, min_fps, max_fps, watch=None):
+        if synchronizer.fps_target is None or getattr(synchronizer, "multirate", False):
+            raise ValueError("Only a synchronizer paced at a single fps_target can be adjusted")
+        if not 0 < min_fps <= max_fps:
+            raise ValueError(f"Rate bounds must satisfy 0 < min_fps <= max_fps, not {min_fps}, {max_fps}")
+
+        self.synchronizer = synchronizer
+        self.min_fps = min_fps
+        self.max_fps = max_fps
+        self.watch = watch  # names of the subscriptions to follow; all of them if None
+
+        self.rate_subscribers = []
+        self.changes = deque(maxlen=CHANGE_HISTORY)  # published rate changes
+        self.held = 0  # outstanding calls to hold()
+        self.lock = Lock()
+        self.dropped_seen = {}  # subscription: drops at the last check
+        self.skipped_seen = synchronizer.pacer.skipped  # ticks the pacer had missed at the last check
+
+        self.set_rate(self.clamp(synchronizer.fps_target), "starting bounds")
+        self.synchronizer.rate_controller = self
+
+        self.stop_event = Event()
+        self.thread = Thread(target=self.control_worker, args=(), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+        if getattr(self.synchronizer, "rate_controller", None) is self:
+            self.synchronizer.rate_controller = None
+
+    def subscribe_to_rate(self, q):
+        logging.info("Adding queue to receive frame rate changes")
+        self.rate_subscribers.append(q)
+
+    def release_rate_q(self, q):
+        logging.info("Releasing frame rate queue")
+        self.rate_subscribers.remove(q)
+
+    def set_bounds(self, min_fps=None, max_fps=None):
+        with self.lock:
+            self.min_fps = self.min_fps if min_fps is None else min_fps
+            self.max_fps = self.max_fps if max_fps is None else max_fps
+            self.min_fps = min(self.min_fps, self.max_fps)
+        self.set_rate(self.clamp(self.fps_target), "bounds changed")
+
+    def hold(self):
+        """Keep the rate where it is until resume() is called as often"""
+        with self.lock:
+            self.held += 1
+        logging.info(f"Frame rate held at {self.fps_target}")
+
+    def resume(self):
+        with self.lock:
+            self.held = max(self.held - 1, 0)
+        logging.info("Frame rate adjustment resumed")
+
+    @property
+    def fps_target(self):
+        return self.synchronizer.fps_target
+
+    def clamp(self, fps):
+        return min(max(fps, self.min_fps), self.max_fps)
+
+    def set_rate(self, fps, reason):
+        fps = round(fps, 2)
+        if fps == self.synchronizer.fps_target and len(self.changes) > 0:
+            return
+        logging.info(f"Frame rate target {self.synchronizer.fps_target} -> {fps} ({reason})")
+        self.synchronizer.fps_target = fps
+
+        change = {"time": time.perf_counter(), "fps_target": fps, "reason": reason}
+        self.changes.append(change)
+        for q in self.rate_subscribers:
+            q.put(change)
+
+    def watched(self):
+        subscriptions = [q for q in self.synchronizer.bundle_subscribers if isinstance(q, Subscription)]
+        if self.watch is not None:
+            subscriptions = [q for q in subscriptions if q.name in self.watch]
+        return subscriptions
+
+    def assess(self):
+        """Whether any consumer is backing up, and the fastest rate that the
+        slowest of them could keep up with (None if not yet known)"""
+        period = 1 / self.fps_target
+        backed_up = []
+        capacity = None
+
+        for q in self.watched():
+            dropped = q.dropped - self.dropped_seen.get(q, q.dropped)
+            self.dropped_seen[q] = q.dropped
+            if dropped > 0 or q.lag() > LAG_LIMIT * period:
+                backed_up.append(q.name)
+
+            processing_time = q.processing_time()
+            if processing_time:
+                consumer_capacity = HEADROOM / processing_time
+                capacity = consumer_capacity if capacity is None else min(capacity, consumer_capacity)
+
+        return backed_up, capacity
+
+    def adjust(self):
+        backed_up, capacity = self.assess()
+        target = self.fps_target
+
+        skipped = self.synchronizer.pacer.skipped - self.skipped_seen
+        self.skipped_seen = self.synchronizer.pacer.skipped
+
+        if backed_up:
+            new_fps = target * DECREASE
+            reason = f"backed up: {', '.join(str(name) for name in backed_up)}"
+        elif skipped > 0:
+            return  # the synchronizer isn't keeping to the current rate anyway
+        else:
+            new_fps = target * INCREASE
+            reason = "keeping up"
+
+        if capacity is not None and new_fps > capacity:
+            new_fps = capacity
+            reason += f"; slowest consumer can take {capacity:.1f} fps"
+
+        with self.lock:
+            new_fps = self.clamp(new_fps)
+        if abs(new_fps - target) >= 0.05:
+            self.set_rate(new_fps, reason)
+
+    def control_worker(self):
+        logging.info(f"Adjusting frame rate between {self.min_fps} and {self.max_fps} fps")
+        while not self.stop_event.wait(CHECK_INTERVAL):
+            if self.held:
+                continue
+            self.adjust()
+        logging.info("Frame rate controller stopped")
+
+    def stats(self):
+        return {
+            "fps_target": self.fps_target,
+            "fps_actual": self.synchronizer.fps,
+            "min_fps": self.min_fps,
+            "max_fps": self.max_fps,
+            "held": self.held > 0,
+            "changes": len(self.changes),
+            "last_change": self.changes[-1] if self.changes else None,
+        }
@@ -0,0 +1,400 @@
+# Cameras on other machines, bundled by a Synchronizer on this one. A capture
+# volume can need more USB cameras than one host can drive, so each extra
+# host runs a StreamPublisher for its cameras and the central host stands a
+# RemoteStream in for each of them. To the Synchronizer a RemoteStream looks
+# like any other stream: frames arrive on its `reel` and the shutter is fired
+# through its `shutter_sync`.
+#
+# Two ZeroMQ sockets connect each RemoteStream to its publisher:
+#   - frames (PUSH -> PULL on base_port): a JSON header with the port, frame
+#     time and layout, then the image, JPEG compressed by default. If the
+#     link can't keep up, the publisher drops frames rather than queueing
+#   - control (REQ -> REP on base_port + 1): the central host fires the
+#     shutter with a request stamped with its clock, and the publisher
+#     replies with the time on its own clock that the request came in and
+#     that its reply went out
+#
+# Frame times are taken on the publishing host's clock, which is not the
+# central host's. Each exchange on the control socket is also an NTP-style
+# clock sample. With the central clock at t0 (request sent) and t3 (reply
+# received), and the remote clock at t1 (request received) and t2 (reply
+# sent):
+#     offset = ((t1 - t0) + (t2 - t3)) / 2     round trip = (t3 - t0) - (t2 - t1)
+# The offset estimate is taken from the sample with the shortest round trip
+# among the recent ones, as those were least held up along the way, and
+# each frame time is brought onto the central clock as it comes in. Between
+# firings the clock is sampled now and then anyway, so the estimate keeps
+# up with drift even while the shutter is idle.
+#
+# Everything runs as well over localhost, so a rig of "remote" hosts can be
+# tried out as processes on one machine. A publisher can be told to act as
+# though its clock were off by some amount to see the offset corrected.
+#
+# central host:
+#     streams = {port: RemoteStream(port, host, base_port) for ...}
+#     syncr = Synchronizer(streams, fps_target=30)
+#     start_streams(streams)
+# each camera host:
+#     python -m src.cameras.remote_stream publish <camera port> <base_port>
+# all on one machine, as separate processes:
+#     python -m src.cameras.remote_stream
+
+import logging
+
+LOG_FILE = r"log\remote_stream.log"
+LOG_LEVEL = logging.DEBUG
+LOG_FORMAT = " %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s"
+
+logging.basicConfig(filename=LOG_FILE, filemode="w", format=LOG_FORMAT, level=LOG_LEVEL)
+
+import json
+import time
+from collections import deque
+from queue import Queue, Empty
+from threading import Thread, Event
+
+import cv2
+import numpy as np
+import zmq
+
+from src.cameras.frame_packet import FramePacket
+
+FRAME_QUEUE_DEPTH = 8  # frames a publisher holds for a slow link before dropping
+JPEG_QUALITY = 90
+CLOCK_SAMPLES = 64  # recent exchanges the offset estimate is drawn from
+SYNC_BURST = 16  # exchanges made before any frames are taken in
+SYNC_INTERVAL = 0.5  # seconds between clock samples while the shutter is idle
+CONTROL_TIMEOUT = 1000  # ms to wait for a publisher to reply before giving up on it
+POLL_INTERVAL = 100  # ms between checks of the stop signal in blocking calls
+
+
+class ClockOffset:
+    """Estimate of how far a remote clock is ahead of the local one"""
+
+    def __init__(self, samples=CLOCK_SAMPLES):
+        self.samples = deque(maxlen=samples)  # (round trip, offset)
+
+    def add_sample(self, t0, t1, t2, t3):
+        offset = ((t1 - t0) + (t2 - t3)) / 2
+        round_trip = (t3 - t0) - (t2 - t1)
+        self.samples.append((round_trip, offset))
+
+    @property
+    def offset(self):
+        """Offset from the quickest recent exchange"""
+        if not self.samples:
+            return 0
+        round_trip, offset = min(self.samples)
+        return offset
+
+    def to_local(self, remote_time):
+        return remote_time - self.offset
+
+    def stats(self):
+        """Offset and round trip of the exchanges, in ms"""
+        if not self.samples:
+            return {}
+        round_trips, offsets = np.array(self.samples).T * 1000
+        return {
+            "samples": len(self.samples),
+            "offset_ms": self.offset * 1000,
+            "offset_spread_ms": float(np.max(offsets) - np.min(offsets)),
+            "round_trip_min_ms": float(np.min(round_trips)),
+            "round_trip_median_ms": float(np.median(round_trips)),
+        }
+
+
+class StreamPublisher:
+    """Runs on the camera's host. Serves one stream (a LiveStream, or anything
+    else with a reel and shutter_sync) to a RemoteStream on the central host"""
+
+    def __init__(self, stream, base_port, compress=True, clock_skew=0):
+        self.stream = stream
+        self.port = stream.port
+        self.base_port = base_port
+        self.compress = compress
+        # seconds added to every time this publisher reports; stands in for
+        # a host whose clock differs from the central one when testing locally
+        self.clock_skew = clock_skew
+
+        self.stop_event = Event()
+        self.frames_sent = 0
+        self.frames_dropped = 0
+
+        self.context = zmq.Context.instance()
+        self.frame_socket = self.context.socket(zmq.PUSH)
+        self.frame_socket.setsockopt(zmq.SNDHWM, FRAME_QUEUE_DEPTH)
+        self.frame_socket.setsockopt(zmq.LINGER, 0)
+        self.frame_socket.bind(f"tcp://*:{base_port}")
+
+        self.control_socket = self.context.socket(zmq.REP)
+        self.control_socket.setsockopt(zmq.LINGER, 0)
+        self.control_socket.bind(f"tcp://*:{base_port + 1}")
+        logging.info(f"Publishing port {self.port} on tcp://*:{base_port} (control on {base_port + 1})")
+
+    def clock(self):
+        return time.perf_counter() + self.clock_skew
+
+    def start(self):
+        self.stream.push_to_reel = True
+        self.frame_thread = Thread(target=self.send_frames, args=[], daemon=True)
+        self.frame_thread.start()
+        self.control_thread = Thread(target=self.answer_control, args=[], daemon=True)
+        self.control_thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.control_thread.join()
+        self.frame_thread.join()
+        self.frame_socket.close()
+        self.control_socket.close()
+
+    def answer_control(self):
+        """Fire the local shutter when asked, and reply with the times the
+        request came in and the reply went out for the clock estimate"""
+        poller = zmq.Poller()
+        poller.register(self.control_socket, zmq.POLLIN)
+
+        while not self.stop_event.is_set():
+            if not poller.poll(POLL_INTERVAL):
+                continue
+            request = self.control_socket.recv_json()
+            received = self.clock()
+
+            if request.get("fire"):
+                self.stream.shutter_sync.put("fire")
+
+            self.control_socket.send_json({"received": received, "sent": self.clock()})
+
+        logging.info(f"Control of port {self.port} ended")
+
+    def send_frames(self):
+        while not self.stop_event.is_set():
+            try:
+                frame_time, frame = self.stream.reel.get(timeout=POLL_INTERVAL / 1000)
+            except Empty:
+                continue
+
+            if frame_time == -1:
+                if not self.stop_event.is_set():
+                    # end of a recorded stream; pass the signal along
+                    self.send_frame(-1, np.array([], dtype="uint8"))
+                break
+
+            self.send_frame(frame_time + self.clock_skew, frame)
+
+        logging.info(f"Publishing of port {self.port} ended")
+
+    def send_frame(self, frame_time, frame):
+        if isinstance(frame, FramePacket):
+            if frame.compressed or self.compress:
+                # MJPEG passthrough frames go as the camera sent them
+                jpeg = frame.encoded(JPEG_QUALITY)
+            else:
+                jpeg, frame = None, frame.frame
+        elif self.compress and frame.size > 0:
+            _, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        else:
+            jpeg = None
+
+        header = {"port": self.port, "frame_time": frame_time}
+        if jpeg is not None:
+            header["jpeg"] = True
+            payload = jpeg
+        else:
+            header.update({"jpeg": False, "shape": list(frame.shape), "dtype": str(frame.dtype)})
+            payload = np.ascontiguousarray(frame)
+
+        try:
+            self.frame_socket.send_multipart([json.dumps(header).encode(), payload], flags=zmq.NOBLOCK)
+            self.frames_sent += 1
+        except zmq.Again:
+            self.frames_dropped += 1
+            logging.debug(f"Link from port {self.port} backed up; frame at {frame_time} dropped")
+
+
+class RemoteStream:
+    """Stands in on the central host for a stream served by a StreamPublisher"""
+
+    def __init__(self, port, host="localhost", base_port=5555):
+        self.port = port
+        self.address = f"tcp://{host}:{base_port}"
+        self.control_address = f"tcp://{host}:{base_port + 1}"
+
+        self.reel = Queue(-1)
+        self.shutter_sync = Queue(-1)
+        self.push_to_reel = False
+        self.stop_event = Event()
+
+        self.clock = ClockOffset()
+        self.frames_received = 0
+        self.fire_failures = 0
+
+        self.context = zmq.Context.instance()
+        self.frame_socket = self.context.socket(zmq.PULL)
+        self.frame_socket.setsockopt(zmq.LINGER, 0)
+        self.frame_socket.connect(self.address)
+        self.control_socket = self.connect_control()
+
+    def connect_control(self):
+        socket = self.context.socket(zmq.REQ)
+        socket.setsockopt(zmq.LINGER, 0)
+        socket.setsockopt(zmq.RCVTIMEO, CONTROL_TIMEOUT)
+        socket.connect(self.control_address)
+        return socket
+
+    def start(self):
+        """Estimate the clock offset, then begin taking in frames. As with the
+        TraceStream, call once the stream has been handed to a Synchronizer"""
+        for _ in range(SYNC_BURST):
+            self.exchange(fire=False)
+        logging.info(f"Clock at port {self.port}: {self.clock.stats()}")
+
+        self.receive_thread = Thread(target=self.receive_frames, args=[], daemon=True)
+        self.receive_thread.start()
+        self.control_thread = Thread(target=self.control_worker, args=[], daemon=True)
+        self.control_thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.shutter_sync.put("release control_worker if waiting")
+
+    def exchange(self, fire):
+        """One request to the publisher, fired or not, taken as a clock sample"""
+        sent = time.perf_counter()
+        try:
+            self.control_socket.send_json({"fire": fire, "sent": sent})
+            reply = self.control_socket.recv_json()
+        except zmq.Again:
+            # a REQ socket that missed its reply can't send again; start over
+            logging.warning(f"No reply from publisher of port {self.port}; reconnecting")
+            self.control_socket.close()
+            self.control_socket = self.connect_control()
+            return False
+        received = time.perf_counter()
+        self.clock.add_sample(sent, reply["received"], reply["sent"], received)
+        return True
+
+    def control_worker(self):
+        """Forward shutter firings to the publisher, and keep sampling the
+        clock while there are none"""
+        while not self.stop_event.is_set():
+            try:
+                item = self.shutter_sync.get(timeout=SYNC_INTERVAL)
+            except Empty:
+                item = None
+            if self.stop_event.is_set():
+                break
+
+            fire = item == "fire"
+            if not self.exchange(fire) and fire:
+                self.fire_failures += 1
+
+        self.control_socket.close()
+        logging.info(f"Control of remote port {self.port} ended")
+
+    def receive_frames(self):
+        poller = zmq.Poller()
+        poller.register(self.frame_socket, zmq.POLLIN)
+
+        while not self.stop_event.is_set():
+            if not poller.poll(POLL_INTERVAL):
+                continue
+            header, payload = self.frame_socket.recv_multipart(copy=False)
+            header = json.loads(header.bytes)
+
+            if header["frame_time"] == -1:
+                self.reel.put([-1, np.array([], dtype="uint8")])
+                break
+
+            frame_time = self.clock.to_local(header["frame_time"])
+            buffer = np.frombuffer(payload.buffer, dtype=np.uint8)
+            if header["jpeg"]:
+                packet = FramePacket(frame_time, jpeg=buffer)
+            else:
+                frame = buffer.view(header["dtype"]).reshape(header["shape"])
+                packet = FramePacket(frame_time, frame=frame)
+
+            self.frames_received += 1
+            if self.push_to_reel:
+                self.reel.put([frame_time, packet])
+
+        self.frame_socket.close()
+        logging.info(f"Frames from remote port {self.port} ended")
+
+
+def publish_camera(port, base_port, compress=True):
+    """Serve a local camera until interrupted"""
+    from src.cameras.camera import Camera
+    from src.cameras.live_stream import LiveStream
+
+    stream = LiveStream(Camera(port))
+    publisher = StreamPublisher(stream, base_port, compress)
+    publisher.start()
+    print(f"Publishing camera {port} on port {base_port}; ctrl+c to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        publisher.stop()
+        stream.stop()
+
+
+def publish_trace(port, base_port, clock_skew, fps, duration, seed):
+    """A stand-in camera host serving a generated timing trace (see
+    trace_stream.py) as though its clock were off by clock_skew"""
+    from src.cameras.trace_stream import TimingTrace
+
+    trace = TimingTrace.generate([port], fps=fps, duration=duration, seed=seed)
+    stream = trace.build_streams(realtime=True)[port]
+    publisher = StreamPublisher(stream, base_port, compress=True, clock_skew=clock_skew)
+    stream.start()
+    publisher.start()
+    publisher.stop_event.wait()
+
+
+if __name__ == "__main__":
+    import multiprocessing as mp
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "publish":
+        publish_camera(int(sys.argv[2]), int(sys.argv[3]))
+        sys.exit()
+
+    from src.cameras.synchronizer import Synchronizer
+
+    FPS = 30
+    RUN_TIME = 5  # seconds
+    BASE_PORT = 5555
+    CLOCK_SKEWS = {0: 0, 1: 2.5, 2: -1.3}  # seconds each "host" is off by
+
+    publishers = {}
+    for port, skew in CLOCK_SKEWS.items():
+        base_port = BASE_PORT + 2 * port
+        args = (port, base_port, skew, FPS, RUN_TIME + 5, port)
+        publishers[port] = mp.Process(target=publish_trace, args=args, daemon=True)
+        publishers[port].start()
+
+    streams = {port: RemoteStream(port, "localhost", BASE_PORT + 2 * port) for port in CLOCK_SKEWS}
+    syncr = Synchronizer(streams, fps_target=FPS)
+    for stream in streams.values():
+        stream.start()
+    time.sleep(RUN_TIME)
+
+    for port, stream in streams.items():
+        clock = stream.clock.stats()
+        print(
+            f"port {port}: clock off by {CLOCK_SKEWS[port] * 1000:.1f} ms, estimated "
+            f"{clock['offset_ms']:.1f} ms (round trip {clock['round_trip_min_ms']:.2f} ms); "
+            f"{stream.frames_received} frames received"
+        )
+    stats = syncr.skew_stats()
+    print(
+        f"{stats['bundles']} bundles at {syncr.fps:.1f} fps, {stats['incomplete_bundles']} incomplete, "
+        f"spread mean {stats['spread_mean_ms']:.1f} ms / p95 {stats['spread_p95_ms']:.1f} ms"
+    )
+
+    for stream in streams.values():
+        stream.stop()
+    for process in publishers.values():
+        process.terminate()
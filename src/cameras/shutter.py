@@ -0,0 +1,176 @@
+# A single trigger shared by every stream of a synchronizer. Firing it bumps
+# a generation count and wakes all waiting roll_camera loops at once through
+# one condition variable, rather than putting "fire" on one queue after
+# another, which left the last port waking up later than the first.
+#
+# Each stream is given a ShutterHandle in place of its shutter_sync queue.
+# The handle keeps the Queue interface that the stream loops already use:
+#   - get() blocks until the shutter has fired since the last get(). Every
+#     firing is seen once by every handle, so a stream that falls behind
+#     still catches up one frame at a time as it would with a queue.
+#   - put() releases only that handle, e.g. to break a loop out of its wait
+#     when the stream is stopped or changes resolution.
+#
+# The time from firing to each handle taking the firing is recorded so that
+# the per-port wake skew can be reported. A stream that was still busy with
+# its last frame when the shutter fired takes it late, when it next calls
+# get(); that lateness counts as well, and is often the larger part.
+
+import logging
+import time
+from collections import deque
+from queue import Empty
+from threading import Condition
+
+import numpy as np
+
+WAKE_HISTORY = 500  # firings kept for wake statistics
+
+
+class Shutter:
+    def __init__(self):
+        self.condition = Condition()
+        self.generation = 0
+        self.fire_times = deque(maxlen=WAKE_HISTORY)  # (generation, time fired)
+        self.handles = {}
+
+        # seconds from firing to taking the firing, by port
+        self.wake_delays = {}
+        self.late_arrivals = {}  # alongside each delay, whether the port wasn't yet waiting
+        # spread of wake times across ports for each firing
+        self.wake_spreads = deque(maxlen=WAKE_HISTORY)
+        self._wakes = {}  # generation: wake times of ports so far
+
+    def handle(self, port):
+        """A queue-like trigger for the stream at this port"""
+        handle = ShutterHandle(self, port)
+        self.register(handle)
+        return handle
+
+    def register(self, handle):
+        with self.condition:
+            handle.seen = self.generation
+            self.handles[handle.port] = handle
+            self.wake_delays[handle.port] = deque(maxlen=WAKE_HISTORY)
+            self.late_arrivals[handle.port] = deque(maxlen=WAKE_HISTORY)
+
+    def fire(self, count=1):
+        """Release every waiting stream to capture `count` frames"""
+        with self.condition:
+            fire_time = time.perf_counter()
+            for _ in range(count):
+                self.generation += 1
+                self.fire_times.append((self.generation, fire_time))
+            self.condition.notify_all()
+
+    def fire_time(self, generation):
+        for gen, fire_time in reversed(self.fire_times):
+            if gen == generation:
+                return fire_time
+        return None
+
+    def record_wake(self, port, generation, wake_time, waited=True):
+        """Called with the condition held by a handle taking this generation,
+        whether it was waiting when it fired or only arrived afterwards"""
+        fire_time = self.fire_time(generation)
+        if fire_time is None:
+            return
+        self.wake_delays[port].append(wake_time - fire_time)
+        self.late_arrivals[port].append(not waited)
+
+        wakes = self._wakes.setdefault(generation, [])
+        wakes.append(wake_time)
+        if len(wakes) == len(self.handles):
+            self.wake_spreads.append(max(wakes) - min(wakes))
+            del self._wakes[generation]
+
+        # a handle that moved to another shutter never reports; don't hold on forever
+        for gen in [g for g in self._wakes if g < self.generation - WAKE_HISTORY]:
+            del self._wakes[gen]
+
+    def wake_stats(self):
+        """Per-port delay from firing to waking (or to arriving, for a port
+        that wasn't yet waiting), and the spread of wake times across ports,
+        in milliseconds"""
+        with self.condition:
+            stats = {"ports": {}}
+            for port, delays in self.wake_delays.items():
+                if len(delays) == 0:
+                    continue
+                delays = np.array(delays) * 1000
+                stats["ports"][port] = {
+                    "wakes": len(delays),
+                    "arrived_late": int(sum(self.late_arrivals[port])),
+                    "delay_mean_ms": float(np.mean(delays)),
+                    "delay_p95_ms": float(np.percentile(delays, 95)),
+                    "delay_max_ms": float(np.max(delays)),
+                }
+            if len(self.wake_spreads) > 0:
+                spreads = np.array(self.wake_spreads) * 1000
+                stats["spread_mean_ms"] = float(np.mean(spreads))
+                stats["spread_p95_ms"] = float(np.percentile(spreads, 95))
+                stats["spread_max_ms"] = float(np.max(spreads))
+        return stats
+
+
+class ShutterHandle:
+    def __init__(self, shutter, port):
+        self.shutter = shutter
+        self.port = port
+        self.seen = shutter.generation  # last generation acted upon
+        self.released = 0  # releases put() directly on this handle
+
+    def rebind(self, shutter):
+        """Move over to the shutter of a new synchronizer, waking a loop that
+        is waiting on the old one so it starts waiting on the new one"""
+        old_shutter = self.shutter
+        shutter.register(self)
+        with old_shutter.condition:
+            old_shutter.handles.pop(self.port, None)
+            self.shutter = shutter
+            old_shutter.condition.notify_all()
+
+    def _pending(self):
+        return self.released > 0 or self.shutter.generation > self.seen
+
+    def get(self, block=True, timeout=None):
+        end_time = None if timeout is None else time.perf_counter() + timeout
+        while True:
+            shutter = self.shutter
+            with shutter.condition:
+                waited = False
+                while not self._pending() and shutter is self.shutter:
+                    if not block:
+                        raise Empty
+                    remaining = None if end_time is None else end_time - time.perf_counter()
+                    if remaining is not None and remaining <= 0:
+                        raise Empty
+                    shutter.condition.wait(remaining)
+                    waited = True
+
+                if shutter is not self.shutter:
+                    continue  # rebound while waiting; wait on the new shutter
+
+                if self.released > 0:
+                    self.released -= 1
+                    return "released"
+
+                self.seen += 1
+                shutter.record_wake(self.port, self.seen, time.perf_counter(), waited)
+                return "fire"
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def put(self, item=None, block=True, timeout=None):
+        """Release this handle only (the item is ignored, as it was on the queue)"""
+        with self.shutter.condition:
+            self.released += 1
+            self.shutter.condition.notify_all()
+            logging.debug(f"Shutter handle at port {self.port} released: {item}")
+
+    def qsize(self):
+        return self.released + self.shutter.generation - self.seen
+
+    def empty(self):
+        return not self._pending()
@@ -0,0 +1,169 @@
+# A bounded queue for the consumers of a producer that fans out to many
+# subscribers (the Synchronizer's bundles, most notably). It presents the
+# get/put interface of a Queue, so it can be handed to subscribe_to_bundle()
+# in place of one, but each subscriber chooses what happens when it falls
+# behind, using the overflow policies of the FrameReel:
+#   - block: lossless. The producer waits for room, so a slow consumer
+#     holds up every other subscriber of that producer
+#   - drop_oldest: the oldest waiting item is discarded to make room. With
+#     a maxsize of 1 the consumer only ever sees the latest item (see latest())
+#   - drop_newest: the new item is discarded
+# A plain Queue() as a subscriber is unbounded; a consumer that can't keep up
+# grows it without limit. The async iterators of async_iterators.py are
+# Subscriptions drained on an event loop.
+#
+# Each subscription keeps its own counters so that a lagging consumer can be
+# spotted (and its drops attributed) without having to guess from the
+# producer's side. It also times how long the consumer spends on each item
+# (from one get() returning to the next being called), which is the most
+# items per second it can take.
+
+import logging
+import time
+from collections import deque
+from queue import Empty, Full
+from threading import Condition
+
+import numpy as np
+
+from src.cameras.frame_reel import OVERFLOW_POLICIES
+
+PROCESSING_HISTORY = 30  # items over which consumer processing time is judged
+
+
+class Subscription:
+    def __init__(self, maxsize=8, overflow="block", name=None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Overflow policy must be one of {OVERFLOW_POLICIES}, not {overflow}")
+        if maxsize < 1:
+            raise ValueError("A subscription must hold at least 1 item")
+
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.name = name
+
+        self.items = deque()  # [time put, item]
+        self.condition = Condition()
+        self.closed = False
+
+        # counters
+        self.delivered = 0  # items put, whether or not they were later dropped
+        self.taken = 0
+        self.dropped = 0
+        self.peak_depth = 0
+        self.blocked_time = 0  # seconds the producer spent waiting for room
+        self.returned_time = None  # when get() last handed out an item
+        self.processing_times = deque(maxlen=PROCESSING_HISTORY)  # seconds between items
+
+    @classmethod
+    def lossless(cls, maxsize=8, name=None):
+        return cls(maxsize, "block", name)
+
+    @classmethod
+    def latest(cls, name=None):
+        """Holds only the most recent item; anything not yet taken is replaced"""
+        return cls(1, "drop_oldest", name)
+
+    def put(self, item, block=True, timeout=None):
+        """Called from the producer thread; mirrors Queue.put()"""
+        with self.condition:
+            if self.closed:
+                return  # nobody is listening any more
+
+            if len(self.items) >= self.maxsize:
+                if self.overflow == "drop_newest":
+                    self.delivered += 1
+                    self.dropped += 1
+                    return
+                elif self.overflow == "drop_oldest":
+                    self.items.popleft()
+                    self.dropped += 1
+                elif not block:
+                    raise Full
+                else:
+                    wait_start = time.perf_counter()
+                    has_room = self.condition.wait_for(
+                        lambda: len(self.items) < self.maxsize or self.closed, timeout
+                    )
+                    self.blocked_time += time.perf_counter() - wait_start
+                    if not has_room:
+                        raise Full
+                    if self.closed:
+                        return
+
+            self.items.append([time.perf_counter(), item])
+            self.delivered += 1
+            self.peak_depth = max(self.peak_depth, len(self.items))
+            self.condition.notify_all()
+
+    def put_nowait(self, item):
+        self.put(item, block=False)
+
+    def get(self, block=True, timeout=None):
+        """Mirrors Queue.get(). A closed subscription raises Empty once drained"""
+        with self.condition:
+            if self.returned_time is not None:
+                # the consumer has been busy with the last item until now
+                self.processing_times.append(time.perf_counter() - self.returned_time)
+                self.returned_time = None
+            if block:
+                self.condition.wait_for(lambda: self.items or self.closed, timeout)
+            if not self.items:
+                raise Empty
+
+            _, item = self.items.popleft()
+            self.taken += 1
+            self.returned_time = time.perf_counter()
+            self.condition.notify_all()
+            return item
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def qsize(self):
+        return len(self.items)
+
+    def empty(self):
+        return len(self.items) == 0
+
+    def full(self):
+        return len(self.items) >= self.maxsize
+
+    def lag(self):
+        """Seconds the oldest waiting item has been waiting"""
+        with self.condition:
+            if not self.items:
+                return 0
+            return time.perf_counter() - self.items[0][0]
+
+    def processing_time(self):
+        """Median seconds the consumer spends on an item (None until known)"""
+        with self.condition:
+            if len(self.processing_times) == 0:
+                return None
+            return float(np.median(self.processing_times))
+
+    def close(self):
+        """Stop accepting items and free a producer or consumer that is
+        waiting. Items already queued can still be taken"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "overflow": self.overflow,
+            "maxsize": self.maxsize,
+            "depth": len(self.items),
+            "peak_depth": self.peak_depth,
+            "lag_sec": self.lag(),
+            "delivered": self.delivered,
+            "taken": self.taken,
+            "dropped": self.dropped,
+            "blocked_sec": self.blocked_time,
+            "processing_sec": self.processing_time(),
+        }
+
+    def __repr__(self):
+        return f"Subscription({self.name}, {self.overflow}, maxsize={self.maxsize})"
@@ -8,6 +8,7 @@ logging.basicConfig(filename=LOG_FILE, filemode="w", format=LOG_FORMAT, level=LO
 
 import sys
 import time
+from collections import deque
 from pathlib import Path
 from queue import Queue
 from threading import Thread, Event
@@ -15,31 +16,129 @@ from threading import Thread, Event
 import cv2
 import numpy as np
 
+from src.cameras.bundle_history import BundleHistory
+from src.cameras.frame_bundle import FrameBundle
+from src.cameras.frame_packet import FramePacket, FrameData
+from src.cameras.pacer import Pacer
+from src.cameras.port_rings import PortRings
+from src.cameras.shutter import Shutter, ShutterHandle
+from src.cameras.subscription import Subscription
+
+# "read": each stream reads (grab + decode) on its own thread when the shutter fires
+# "grab_retrieve": the bundler grabs every camera back-to-back, then the
+#   streams decode in parallel. Frames are stamped at grab, so they line up better
+CAPTURE_MODES = ("read", "grab_retrieve")
+SKEW_HISTORY = 1000  # bundles kept for skew statistics
+RATE_HISTORY = 30  # frames per port used to measure the rate it delivers at
+WAIT_TIMEOUT = 0.05  # seconds between checks on reconnecting streams while waiting for frames
+GRAB_TIMEOUT = 1  # seconds all ports together may take to finish decoding before the next grab
+
+
+def exclusive_min(values):
+    """For each element, the minimum of all the other elements (inf if there
+    are none). Every element sees the overall minimum except the minimum
+    itself, which sees the second smallest"""
+    if len(values) < 2:
+        return np.full(len(values), np.inf)
+    lowest = values.argmin()
+    result = np.full(len(values), values[lowest])
+    others = values.copy()
+    others[lowest] = np.inf
+    result[lowest] = others.min()
+    return result
+
+
+def assign_frames(current, upcoming):
+    """Decide for every port at once whether its current frame belongs in
+    the layer being built, given arrays of the current and next frame time
+    of each port. A frame is held back for the next layer if some other
+    port's next frame was read before it, or if it is closer in time to the
+    other ports' next frames than to their current ones.
+
+    Returns which ports are assigned, and which were held back for coming
+    after another port's next frame"""
+    # for each port, the earliest next frame and latest current frame of the *other* ports
+    earliest_next = exclusive_min(upcoming)
+    latest_current = -exclusive_min(-current)
+
+    after_next = current > earliest_next
+    closer_to_next = (earliest_next - current) < (current - latest_current)
+    assigned = ~(after_next | closer_to_next)
+    return assigned, after_next
+
+
 class Synchronizer:
-    def __init__(self, streams: dict, fps_target):
+    def __init__(self, streams: dict, fps_target, capture_mode="read", port_rates=None, master_port=None):
         self.streams = streams
         self.current_bundle = None
 
         self.notice_subscribers = []  # queues that will be notified of new bundles
         self.bundle_subscribers = []    # queues that will receive actual frame data
         
-        self.frame_data = {}
         self.stop_event = Event()
+        self.history = None  # recent bundles for consumers that start late; see keep_history()
+        self.rate_controller = None  # adjusts fps_target when set; see rate_controller.py
 
         self.ports = []
         for port, stream in self.streams.items():
             self.ports.append(port)
 
+        # streams that are reconnecting (e.g. changing resolution) are left
+        # out of bundles until they are delivering again
+        self.paused_ports = set()
+        self.active_ports = list(self.ports)
+
+        # Cameras running at mixed rates (e.g. 30 and 60 fps) are given their
+        # nominal rates as port_rates. Each port is then fired at its own
+        # rate, and a bundle is built for every frame of the master port (the
+        # slowest, unless chosen): every other port contributes the frame
+        # nearest in time to the master's, and the rest of a faster port's
+        # frames are decimated. With fps_target None the shutter is not paced
+        # but fired on demand, port by port, as replay needs. Otherwise
+        # fps_target becomes the master's rate, which is the rate of bundles
+        self.port_rates = port_rates
+        self.multirate = port_rates is not None
+        if self.multirate:
+            missing = [port for port in self.ports if port not in port_rates]
+            if missing:
+                raise ValueError(f"No rate given for ports {missing}")
+            if master_port is None:
+                master_port = min(self.ports, key=lambda port: port_rates[port])
+            if master_port not in self.ports:
+                raise ValueError(f"Master port {master_port} is not among the streams")
+            if fps_target is not None:
+                fps_target = port_rates[master_port]
+        self.master_port = master_port
+
         self.fps_target = fps_target
         if fps_target is not None:
             self.fps = fps_target
+        # fires the shutter on a fixed grid of deadlines at fps_target; see pacer.py
+        self.pacer = Pacer(fps_target)
+
+        if capture_mode not in CAPTURE_MODES:
+            raise ValueError(f"Capture mode must be one of {CAPTURE_MODES}, not {capture_mode}")
+        if capture_mode == "grab_retrieve":
+            for port, stream in self.streams.items():
+                if not hasattr(stream, "grab"):
+                    raise ValueError(f"Stream at port {port} does not support grab/retrieve capture")
+                stream.grab_retrieve = True
+        self.capture_mode = capture_mode
+
+        self.attach_shutter()
 
         self.initialize_ledgers()
         self.spin_up() 
 
     def stop(self):
         self.stop_event.set()
+        self.frame_rings.wake()
+        for q in self.bundle_subscribers:
+            if isinstance(q, Subscription):
+                q.close()  # free the bundler if it is waiting on a full one
         self.bundler.join()
+        if self.shutter_thread is not None:
+            self.shutter_thread.join()
         for t in self.threads:
             t.join()
             
@@ -47,8 +146,25 @@ class Synchronizer:
     def initialize_ledgers(self):
 
         self.port_frame_count = {port: 0 for port in self.ports}
-        self.port_current_frame = {port: 0 for port in self.ports}
-        self.mean_frame_times = []
+        self.port_frame_times = {port: deque(maxlen=RATE_HISTORY) for port in self.ports}
+        self.fires_sent = {port: 0 for port in self.ports}  # firings on demand, port by port
+        self.last_master_time = None  # frame time of the master in the last multi-rate bundle
+        self.matched_last = {port: False for port in self.ports}  # port had a frame in that bundle
+        # harvested frames waiting to be bundled; see port_rings.py
+        self.frame_rings = PortRings(self.ports)
+        self.active_rows = self.frame_rings.rows(self.active_ports)
+        # only the most recent layers are used to estimate the frame rate
+        self.mean_frame_times = deque(maxlen=10)
+        self.initialize_skew_stats()
+
+    def initialize_skew_stats(self):
+        # for judging how well frames line up across ports
+        self.bundle_spreads = deque(maxlen=SKEW_HISTORY)  # seconds between first and last frame
+        self.dropped_frames = {port: 0 for port in self.ports}
+        # frames passed over for a nearer one when a faster port is brought down to the master's rate
+        self.decimated_frames = {port: 0 for port in self.ports}
+        self.incomplete_bundles = 0
+        self.bundle_count = 0
     
     def spin_up(self):
 
@@ -61,23 +177,51 @@ class Synchronizer:
         logging.info("Frame harvesters just submitted")
 
         logging.info("Starting frame bundler...")
-        self.bundler = Thread(target=self.bundle_frames, args=(), daemon=True)
+        if self.multirate:
+            self.bundler = Thread(target=self.bundle_frames_multirate, args=(), daemon=True)
+        else:
+            self.bundler = Thread(target=self.bundle_frames, args=(), daemon=True)
         self.bundler.start()
+
+        # with mixed rates the shutter is fired apart from bundling so that a
+        # slow port being waited on never holds back the firing of a fast one
+        self.shutter_thread = None
+        if self.multirate and self.fps_target is not None:
+            self.shutter_thread = Thread(target=self.fire_at_port_rates, args=(), daemon=True)
+            self.shutter_thread.start()
         
     def subscribe_to_notice(self, q):
         # subscribers are notified via the queue that a new frame bundle is available
         # this is intended to avoid issues with latency due to multiple iterations
         # of frames being passed from one queue to another
+        # NOTE: current_bundle may have moved on by the time the notice is read.
+        # To get exactly the newest bundle, subscribe_to_bundle(Subscription.latest())
         logging.info("Adding queue to receive notice of bundle update")
         self.notice_subscribers.append(q)
 
     def subscribe_to_bundle(self, q):
-        logging.info("Adding queue to receive frame bundle")
+        # q is put every bundle. A plain Queue grows without limit if its consumer
+        # falls behind; a Subscription bounds it (see subscription.py)
+        logging.info(f"Adding queue to receive frame bundle: {q}")
         self.bundle_subscribers.append(q)
 
     def release_bundle_q(self,q):
-        logging.info("Releasing record queue")
+        logging.info(f"Releasing bundle queue: {q}")
         self.bundle_subscribers.remove(q)
+        if isinstance(q, Subscription):
+            q.close()  # in case the bundler is waiting on it
+
+    def keep_history(self, **limits):
+        """Hold on to recent bundles (the last 2 seconds by default; see
+        bundle_history.py for the limits). Returns the history"""
+        if self.history is None:
+            self.history = BundleHistory(**limits)
+            self.subscribe_to_bundle(self.history)
+        return self.history
+
+    def subscriber_stats(self):
+        """Depth, lag and drops of each bundle subscriber that keeps count"""
+        return [q.stats() for q in self.bundle_subscribers if isinstance(q, Subscription)]
 
     def harvest_frames(self, stream):
         port = stream.port
@@ -96,82 +240,188 @@ class Synchronizer:
             if frame_time == -1: # signal from recorded stream that end of file reached
                 break
             # once toggled, keep pushing the poison pill
-            
-            self.frame_data[f"{port}_{frame_index}"] = {
-                "port": port,
-                "frame": frame,
-                "frame_index": frame_index,
-                "frame_time": frame_time,
-            }
+
+            # streams in MJPEG passthrough deliver packets of undecoded JPEG;
+            # "frame" is only decoded if a bundle consumer reads it
+            if not isinstance(frame, FramePacket):
+                frame = FramePacket(frame_time, frame=frame)
+
+            self.port_frame_times[port].append(frame_time)
+            self.frame_rings.push(
+                port,
+                FrameData(
+                    port=port,
+                    packet=frame,
+                    frame_index=frame_index,
+                    frame_time=frame_time,
+                ),
+            )
 
             logging.debug(f"Frame data harvested from reel {port} with index {frame_index} and frame time of {frame_time}")
             self.port_frame_count[port] += 1
 
         logging.info(f"Frame harvester for port {port} completed")
 
-    # get minimum value of frame_time for next layer
-    def earliest_next_frame(self, port):
-        """Looks at next unassigned frame across the ports to determine
-        the earliest time at which each of them was read"""
-        times_of_next_frames = []
-        for p in self.ports:
-            next_index = self.port_current_frame[p] + 1
-            frame_data_key =  f"{p}_{next_index}"
-            
-            # problem with outpacing the threads reading data in, so wait if need be
-            while frame_data_key not in self.frame_data.keys():
-                logging.debug(f"Waiting in a loop for frame data to populate with key: {frame_data_key}")
-                time.sleep(.001)
+    def is_reconnecting(self, port):
+        return getattr(self.streams[port], "reconnecting", False)
 
-            next_frame_time = self.frame_data[frame_data_key]["frame_time"]
-            if p != port:
-                times_of_next_frames.append(next_frame_time)
+    def update_active_ports(self):
+        """Pause ports whose stream is reconnecting so the others are not
+        held up waiting on them, and bring them back once they deliver again"""
+        for port in self.ports:
+            if self.is_reconnecting(port):
+                if port not in self.paused_ports:
+                    logging.info(f"Port {port} is reconnecting; leaving it out of bundles")
+                    self.paused_ports.add(port)
+            elif port in self.paused_ports and self.ready_to_rejoin(port):
+                logging.info(f"Port {port} is delivering again; adding it back to bundles")
+                self.paused_ports.remove(port)
+
+        active_ports = [p for p in self.ports if p not in self.paused_ports]
+        if active_ports != self.active_ports:
+            self.active_ports = active_ports
+            self.active_rows = self.frame_rings.rows(active_ports)
+
+    def ready_to_rejoin(self, port):
+        """Discard any frames read before the stream reconnected, then check
+        that a current and next frame are available"""
+        reconnect_time = getattr(self.streams[port], "reconnect_time", None)
+        with self.frame_rings.condition:
+            while self.frame_rings.pending(port) > 0:
+                if reconnect_time is None or self.frame_rings.current_time(port) >= reconnect_time:
+                    break
+                self.frame_rings.pop(port)
+
+            return self.frame_rings.pending(port) > 1
+
+    def wait_for_next_frames(self):
+        """Wait for the harvesters to bring in the next frame of each active
+        port. Returns False on stop or if a port drops out while waiting"""
+        with self.frame_rings.condition:
+            while not self.frame_rings.has_next(self.active_rows):
+                if self.stop_event.is_set():
+                    return False
+                if any(self.is_reconnecting(p) for p in self.active_ports):
+                    return False
+                logging.debug("Waiting for the next frame of each active port")
+                # harvesters notify on each new frame; the timeout is only to
+                # notice streams that begin reconnecting
+                self.frame_rings.condition.wait(WAIT_TIMEOUT)
+        return True
+
+    def assign_layer(self):
+        """Current frame times of the active ports, which of them go in the
+        layer being built, and which were held back for coming after a next
+        frame (see assign_frames)"""
+        current = self.frame_rings.current_times(self.active_rows)
+        upcoming = self.frame_rings.next_times(self.active_rows)
+        assigned, after_next = assign_frames(current, upcoming)
+        return current, assigned, after_next
 
-        return min(times_of_next_frames)
-    
-    def latest_current_frame(self, port):
-        """Provides the latest frame_time of the current frames not inclusive of the provided port """
-        times_of_current_frames = []
-        for p in self.ports:
-            current_index = self.port_current_frame[p]
-            current_frame_time = self.frame_data[f"{p}_{current_index}"]["frame_time"]
-            if p != port:
-                times_of_current_frames.append(current_frame_time)
-                
-        return max(times_of_current_frames)
-    
     def frame_slack(self):
         """Determine how many unassigned frames are sitting in self.dataframe"""
 
-        slack = [
-            self.port_frame_count[port] - self.port_current_frame[port]
-            for port in self.ports
-        ]
+        slack = self.frame_rings.count[self.active_rows]
         logging.debug(f"Slack in frames is {slack}")
-        return min(slack)
+        return int(slack.min()) if len(slack) > 0 else 0
 
-    def average_fps(self):
-        """"""
-        # only look at the most recent layers
-        if len(self.mean_frame_times) > 10:
-            self.mean_frame_times = self.mean_frame_times[-10:]
+    def attach_shutter(self):
+        """Give each stream a handle on one shared shutter so that they are
+        all released at once. Streams whose trigger is not an in-process
+        queue (i.e. the ProcessStream) keep getting "fire" put on it"""
+        self.shutter = Shutter()
+        self.queue_triggered_ports = []
 
-        delta_t = np.diff(self.mean_frame_times)
-        mean_delta_t = np.mean(delta_t)
+        for port, stream in self.streams.items():
+            if isinstance(stream.shutter_sync, ShutterHandle):
+                # stream was used by an earlier synchronizer
+                stream.shutter_sync.rebind(self.shutter)
+            elif isinstance(stream.shutter_sync, Queue):
+                old_queue = stream.shutter_sync
+                stream.shutter_sync = self.shutter.handle(port)
+                # a loop already waiting on the queue (e.g. a RecordedStream
+                # started before the synchronizer) would otherwise never wake
+                old_queue.put("shutter replaced")
+            else:
+                self.queue_triggered_ports.append(port)
+
+    def pacing_stats(self):
+        """How closely shutter firings keep to fps_target"""
+        return self.pacer.stats()
+
+    def wake_stats(self):
+        """Delay from firing the shutter to each stream waking up"""
+        return self.shutter.wake_stats()
+
+    def fire_shutters(self):
+        """Trigger every stream to capture one frame and push it to its reel"""
+        if self.capture_mode == "grab_retrieve":
+            ports = self.grab_ports(self.ports)
+        else:
+            ports = self.ports
+
+        if len(ports) == len(self.ports):
+            self.shutter.fire()
+            for port in self.queue_triggered_ports:
+                self.streams[port].shutter_sync.put("fire")
+        else:
+            # only those that grabbed have a frame to retrieve
+            for port in ports:
+                self.streams[port].shutter_sync.put("fire")
+
+    def grab_ports(self, ports):
+        """Grab a frame at each of the ports, back-to-back so that the frames
+        are latched close together, and return the ports that grabbed. Any
+        decode still in progress is waited out first, with the ports sharing
+        one deadline, and a port that misses it sits this frame out"""
+        deadline = time.perf_counter() + GRAB_TIMEOUT
+        ready_ports = []
+        for port in ports:
+            if self.is_reconnecting(port):
+                continue
+            if self.streams[port].ready_to_grab(max(deadline - time.perf_counter(), 0)):
+                ready_ports.append(port)
+
+        return [port for port in ready_ports if self.streams[port].grab()]
+
+    def skew_stats(self):
+        """Summary of timestamp spread within bundles and of frames dropped
+        for being out of sync"""
+        spreads = np.array(self.bundle_spreads) * 1000  # ms
+        stats = {
+            "capture_mode": self.capture_mode,
+            "bundles": self.bundle_count,
+            "incomplete_bundles": self.incomplete_bundles,
+            "dropped_frames": dict(self.dropped_frames),
+            "decimated_frames": dict(self.decimated_frames),
+            "ring_overflow": dict(self.frame_rings.overflow),
+        }
+        if len(spreads) > 0:
+            stats.update(
+                {
+                    "spread_mean_ms": float(np.mean(spreads)),
+                    "spread_median_ms": float(np.median(spreads)),
+                    "spread_p95_ms": float(np.percentile(spreads, 95)),
+                    "spread_max_ms": float(np.max(spreads)),
+                }
+            )
+        return stats
 
-        return 1 / mean_delta_t
+    def average_fps(self):
+        """Mean rate over the most recent layers. The mean of the successive
+        differences is just the overall span divided by their count"""
+        span = self.mean_frame_times[-1] - self.mean_frame_times[0] if self.mean_frame_times else 0
+        if span <= 0:
+            return getattr(self, "fps", 0)  # not enough to go on yet
+        return (len(self.mean_frame_times) - 1) / span
 
     def bundle_frames(self):
 
         logging.info(f"Waiting for all ports to begin harvesting corners...")
 
         # need to have 2 frames to assess bundling
-        for port in self.ports:
-            self.streams[port].shutter_sync.put("fire")
-            self.streams[port].shutter_sync.put("fire")
-
-
-        sync_time = time.perf_counter()
+        self.fire_shutters()
+        self.fire_shutters()
 
         bundle_index = 0
 
@@ -182,74 +432,265 @@ class Synchronizer:
             if self.frame_slack() < 2:
                 # Trigger device to proceed with reading frame and pushing to reel
                 if self.fps_target is not None:
-                    wait_time = 1 / self.fps_target
-                    while time.perf_counter() < sync_time + wait_time:
-                        time.sleep(0.001)
+                    self.pacer.wait(self.fps_target)
+
+                self.fire_shutters()
 
-                sync_time = time.perf_counter()
-                for port in self.ports:
-                    self.streams[port].shutter_sync.put("fire")
+            self.update_active_ports()
+            if not self.active_ports or not self.wait_for_next_frames():
+                time.sleep(0.001)
+                continue
 
             next_layer = {}
-            layer_frame_times = []
-            
-            # build earliest next/latest current dictionaries for each port to determine where to put frames           
-            # must be done before going in and making any updates to the frame index
-            earliest_next = {}
-            latest_current = {}
             
+            # the rings are held while the layer is assembled so that a full
+            # ring can't drop a frame out from under it
+            with self.frame_rings.condition:
+                current_times, assigned, after_next = self.assign_layer()
+
+                for port, frame_time, assign, late in zip(
+                    self.active_ports, current_times, assigned, after_next
+                ):
+                    if assign:
+                        # add the data and move on to the port's next frame
+                        next_layer[port] = FrameData(self.frame_rings.pop(port), bundle_index=bundle_index)
+                        logging.debug(f"Adding to layer from port {port} at index {next_layer[port]['frame_index']} and frame time: {frame_time}")
+                    else:
+                        # definitly should be put in the next layer and not this one
+                        next_layer[port] = None
+                        self.dropped_frames[port] += 1
+                        if late:
+                            logging.warning(f"Skipped frame at port {port}: > earliest_next")
+                        else:
+                            # only applying for 2 camera setup where I noticed this was an issue (frames stay out of synch)
+                            logging.warning(f"Skipped frame at port {port}: delta < time-latest_current")
+
+                layer_frame_times = current_times[assigned]
+
+            logging.debug(f"Unassigned Frames: {len(self.frame_rings)}")
+
+            self.publish_layer(next_layer, layer_frame_times, bundle_index)
+            bundle_index += 1
 
+        logging.info("Frame bundler successfully ended")
+
+    def publish_layer(self, next_layer, layer_frame_times, bundle_index):
+        """Bundle up a finished layer, update the statistics and hand the
+        bundle to every subscriber"""
+        # paused ports still appear in the bundle, just without a frame
+        next_layer = FrameBundle(
+            {port: next_layer.get(port) for port in self.ports}, bundle_index, self.port_fps()
+        )
+
+        if len(layer_frame_times) > 0:
+            self.mean_frame_times.append(layer_frame_times.mean())
+
+        if len(layer_frame_times) < len(self.ports):
+            self.incomplete_bundles += 1
+        if len(layer_frame_times) > 1:
+            self.bundle_spreads.append(layer_frame_times.max() - layer_frame_times.min())
+        self.bundle_count += 1
+
+        self.current_bundle = next_layer
+        # notify other processes that the current bundle is ready for processing
+        # only for tasks that can risk missing a frame bundle
+        for q in self.notice_subscribers:
+            logging.debug(f"Giving notice of new bundle via {q}")
+            q.put("new bundle available")
+
+        # a lossless Subscription that is full holds the bundler here
+        for q in list(self.bundle_subscribers):
+            logging.debug(f"Placing new bundle on queue: {q}")
+            q.put(self.current_bundle)
+
+        self.fps = self.average_fps()
+
+    def port_fps(self):
+        """Rate each port has been delivering frames at, over its most recent frames"""
+        port_fps = {}
+        for port, frame_times in self.port_frame_times.items():
+            span = frame_times[-1] - frame_times[0] if len(frame_times) > 1 else 0
+            port_fps[port] = (len(frame_times) - 1) / span if span > 0 else None
+        return port_fps
+
+    def rate_stats(self):
+        """Nominal and measured rate of each port, and what became of its frames"""
+        port_fps = self.port_fps()
+        return {
+            "master_port": self.master_port,
+            "ports": {
+                port: {
+                    "nominal_fps": None if self.port_rates is None else self.port_rates[port],
+                    "measured_fps": port_fps[port],
+                    "frames": self.port_frame_count[port],
+                    "decimated": self.decimated_frames[port],
+                    "dropped": self.dropped_frames[port],
+                }
+                for port in self.ports
+            },
+        }
+
+    def fire_ports(self, ports):
+        """Trigger only the given streams to capture one frame each"""
+        if self.capture_mode == "grab_retrieve":
+            ports = self.grab_ports(ports)
+
+        if len(ports) == len(self.ports):
+            # all at once, through the shared shutter
+            self.shutter.fire()
+            for port in self.queue_triggered_ports:
+                self.streams[port].shutter_sync.put("fire")
+        else:
+            # a ShutterHandle releases just its own stream when put to
+            for port in ports:
+                self.streams[port].shutter_sync.put("fire")
+
+        for port in ports:
+            self.fires_sent[port] += 1
+
+    def fire_at_port_rates(self):
+        """Fire each port on its own grid of deadlines. The pacer ticks at
+        the fastest port's rate, and a slower port fires on the ticks where
+        its own count of frames due goes up, so rates need not divide evenly
+        (a port then fires within one tick of when it is due)"""
+        fastest = max(self.port_rates.values())
+        logging.info(f"Firing ports at their own rates {self.port_rates} on a {fastest} fps grid")
+
+        while not self.stop_event.is_set():
+            self.pacer.wait(fastest)
+            tick = self.pacer.grid_index - 1  # skipped ticks move this on too
+
+            due = []
             for port in self.ports:
-                earliest_next[port] = self.earliest_next_frame(port)
-                latest_current[port] = self.latest_current_frame(port)
-                current_frame_index = self.port_current_frame[port]
-                
-                
-            for port in self.ports:
-                current_frame_index = self.port_current_frame[port]
-
-                port_index_key = f"{port}_{current_frame_index}"
-                current_frame_data = self.frame_data[port_index_key]
-                frame_time = current_frame_data["frame_time"]
-
-                # don't put a frame in a bundle if the next bundle has a frame before it
-                if frame_time > earliest_next[port]:
-                    # definitly should be put in the next layer and not this one
-                    next_layer[port] = None
-                    logging.warning(f"Skipped frame at port {port}: > earliest_next")
-                elif earliest_next[port] - frame_time < frame_time-latest_current[port]: # frame time is closer to earliest next than latest current
-                    # if it's closer to the earliest next frame than the latest current frame, bump it up
-                    # only applying for 2 camera setup where I noticed this was an issue (frames stay out of synch)
-                    next_layer[port] = None
-                    logging.warning(f"Skipped frame at port {port}: delta < time-latest_current")
+                ratio = self.port_rates[port] / fastest
+                if np.floor(tick * ratio) > np.floor((tick - 1) * ratio):
+                    due.append(port)
+            self.fire_ports(due)
+
+        logging.info("Port rate shutter ended")
+
+    def awaiting_fire(self, port):
+        """Firings on demand that the port has not yet answered with a frame"""
+        return self.fires_sent[port] > self.port_frame_count[port]
+
+    def match_window(self, master_time):
+        """Times of the frames that are nearer to this master frame than to
+        the one before or after it. The master's next frame has often not
+        arrived yet, in which case it is expected one period on"""
+        master_fps = self.port_fps()[self.master_port] or self.port_rates[self.master_port]
+        period = 1 / master_fps
+
+        previous_time = self.last_master_time
+        if previous_time is None:
+            previous_time = master_time - period
+        if self.frame_rings.pending(self.master_port) > 1:
+            next_time = self.frame_rings.next_time(self.master_port)
+        else:
+            next_time = master_time + period
+        return (previous_time + master_time) / 2, (master_time + next_time) / 2
+
+    def wait_for_master_frame(self):
+        """Time of the master port's next frame, or None on stop or if the
+        master is reconnecting"""
+        master = self.master_port
+        with self.frame_rings.condition:
+            while self.frame_rings.pending(master) == 0:
+                if self.stop_event.is_set() or self.is_reconnecting(master):
+                    return None
+                if self.fps_target is None and not self.awaiting_fire(master):
+                    self.fire_ports([master])
+                self.frame_rings.condition.wait(WAIT_TIMEOUT)
+            return self.frame_rings.current_time(master)
+
+    def wait_for_frame_after(self, port, master_time, window_end):
+        """Wait until the port has a frame from after the master's, so the
+        nearest to it is known. A paced port only gets as long as a frame
+        of its own could still be on the way; after that the bundle goes
+        ahead without it rather than holding up the master cadence"""
+        deadline = window_end + 1 / self.port_rates[port]
+        with self.frame_rings.condition:
+            while self.frame_rings.latest_time(port) < master_time:
+                if self.stop_event.is_set() or self.is_reconnecting(port):
+                    return
+                if self.fps_target is None:
+                    if not self.awaiting_fire(port):
+                        self.fire_ports([port])
+                    self.frame_rings.condition.wait(WAIT_TIMEOUT)
                 else:
-                    # add the data and increment the index
-                    next_layer[port] = self.frame_data.pop(port_index_key)
-                    next_layer[port]["bundle_index"] = bundle_index
-                    self.port_current_frame[port] += 1
-                    layer_frame_times.append(frame_time)
-                    logging.debug(f"Adding to layer from port {port} at index {current_frame_index} and frame time: {frame_time}")
-                    
-            logging.debug(f"Unassigned Frames: {len(self.frame_data)}")
-
-            self.mean_frame_times.append(np.mean(layer_frame_times))
-
-            self.current_bundle = next_layer
-            # notify other processes that the current bundle is ready for processing
-            # only for tasks that can risk missing a frame bundle
-            for q in self.notice_subscribers:
-                logging.debug(f"Giving notice of new bundle via {q}")
-                q.put("new bundle available")
-
-            for q in self.bundle_subscribers:
-                logging.debug(f"Placing new bundle on queue: {q}")
-                logging.debug("Placing bundle on subscribers queue")
-                q.put(self.current_bundle)
-            
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        logging.debug(f"No frame at port {port} after {master_time}; bundling without waiting further")
+                        return
+                    self.frame_rings.condition.wait(min(remaining, WAIT_TIMEOUT))
+
+    def take_nearest(self, port, master_time, window):
+        """Pop the port's frame nearest to the master's if it falls in the
+        window. Other frames in the window are decimated. Frames from before
+        the window are left over from the last bundle: decimated if the port
+        had a frame in it, and otherwise dropped, as no master frame was near
+        enough to take them. Later frames are left for the bundles to come"""
+        times = self.frame_rings.pending_times(port)
+        window_start, window_end = window
+
+        stale = int(np.sum(times < window_start))
+        for _ in range(stale):
+            self.frame_rings.pop(port)
+        if self.matched_last[port]:
+            self.decimated_frames[port] += stale
+        else:
+            self.dropped_frames[port] += stale
+
+        times = times[stale:]
+        in_window = int(np.sum(times < window_end))
+        self.matched_last[port] = in_window > 0
+        if in_window == 0:
+            return None
+
+        nearest = int(np.argmin(np.abs(times[:in_window] - master_time)))
+        for _ in range(nearest):
+            self.frame_rings.pop(port)
+        self.decimated_frames[port] += nearest
+        return self.frame_rings.pop(port)
+
+    def bundle_frames_multirate(self):
+        logging.info(f"Bundling at the cadence of port {self.master_port}")
+        bundle_index = 0
+
+        while not self.stop_event.is_set():
+            self.update_active_ports()
+            if self.master_port not in self.active_ports:
+                # wait for the master to finish reconnecting
+                self.stop_event.wait(WAIT_TIMEOUT)
+                continue
+
+            master_time = self.wait_for_master_frame()
+            if master_time is None:
+                continue
+
+            window = self.match_window(master_time)
+            others = [port for port in self.active_ports if port != self.master_port]
+            for port in others:
+                self.wait_for_frame_after(port, master_time, window[1])
+
+            next_layer = {}
+            with self.frame_rings.condition:
+                # the master's next frame may have come in while waiting
+                window = self.match_window(master_time)
+                next_layer[self.master_port] = FrameData(
+                    self.frame_rings.pop(self.master_port), bundle_index=bundle_index
+                )
+                layer_frame_times = [master_time]
+                for port in others:
+                    frame_data = self.take_nearest(port, master_time, window)
+                    if frame_data is not None:
+                        next_layer[port] = FrameData(frame_data, bundle_index=bundle_index)
+                        layer_frame_times.append(frame_data["frame_time"])
+
+            self.last_master_time = master_time
+            self.publish_layer(next_layer, np.array(layer_frame_times), bundle_index)
             bundle_index += 1
-            self.fps = self.average_fps()
 
-        logging.info("Frame bundler successfully ended")
+        logging.info("Multi-rate frame bundler successfully ended")
 
 
 
@@ -0,0 +1,496 @@
+# Stand-in cameras that render the session's charuco board under scripted
+# poses so that the full pipeline can be exercised (and load tested) without
+# any hardware attached. Because every camera's intrinsics, distortion and
+# extrinsics are known, the output of calibration and triangulation can be
+# checked against ground truth.
+#
+# The SyntheticCapture mimics the parts of cv2.VideoCapture used by the
+# Camera and the streams (read, grab, retrieve, get, set, isOpened, release),
+# and the SyntheticCamera is a Camera that opens one of these instead of a
+# device. Anything that accepts a Camera will accept a SyntheticCamera.
+#
+# World frame of reference: +Y is down and the board sits about the origin
+# facing cameras that are spread along an arc on the -Z side.
+
+import logging
+import time
+
+import cv2
+import numpy as np
+
+from src.cameras.camera import Camera
+
+SYNTHETIC_RESOLUTIONS = [(640, 480), (1024, 576), (1280, 720), (1920, 1080)]
+DEFAULT_DISTORTION = np.array([[-0.05, 0.01, 0.0, 0.0, 0.0]])
+BACKGROUND = 110  # gray level of the world around the board
+PIXELS_PER_SQUARE = 120  # resolution of the board texture
+JPEG_QUALITY = 90  # of frames handed over undecoded, as an MJPG device would
+
+
+class ScriptedPoses:
+    """Pose of the board center in the world over time, linearly interpolated
+    between keyframes of (seconds, rvec, tvec) and looped"""
+
+    def __init__(self, keyframes, loop=True):
+        self.times = np.array([k[0] for k in keyframes], dtype=np.float64)
+        self.rvecs = np.array([np.ravel(k[1]) for k in keyframes], dtype=np.float64)
+        self.tvecs = np.array([np.ravel(k[2]) for k in keyframes], dtype=np.float64)
+        self.loop = loop
+
+    def __call__(self, t):
+        if self.loop:
+            t = self.times[0] + (t - self.times[0]) % (self.times[-1] - self.times[0])
+
+        rvec = [np.interp(t, self.times, self.rvecs[:, i]) for i in range(3)]
+        tvec = [np.interp(t, self.times, self.tvecs[:, i]) for i in range(3)]
+        return np.array(rvec), np.array(tvec)
+
+
+def default_poses():
+    """A slow sway of the board in front of the cameras that keeps it in view
+    while exercising tilt in both directions"""
+    tilt = np.radians(25)
+    keyframes = [
+        (0, [0, 0, 0], [0, 0, 0]),
+        (2, [tilt, 0, 0], [0.05, 0, 0.05]),
+        (4, [0, tilt, 0.1], [0, 0.05, -0.05]),
+        (6, [-tilt, 0, 0], [-0.05, 0, 0.05]),
+        (8, [0, -tilt, -0.1], [0, -0.05, -0.05]),
+        (10, [0, 0, 0], [0, 0, 0]),
+    ]
+    return ScriptedPoses(keyframes)
+
+
+def default_camera_matrix(resolution):
+    width, height = resolution
+    focal_length = 0.9 * width
+    return np.array(
+        [[focal_length, 0, width / 2], [0, focal_length, height / 2], [0, 0, 1]],
+        dtype=np.float64,
+    )
+
+
+def look_at(position, target=(0, 0, 0)):
+    """Rotation and translation (world -> camera) for a camera at position
+    that is pointed at target, keeping world +Y as image down"""
+    position = np.array(position, dtype=np.float64)
+    z_axis = np.array(target, dtype=np.float64) - position
+    z_axis = z_axis / np.linalg.norm(z_axis)
+    x_axis = np.cross([0, 1, 0], z_axis)
+    x_axis = x_axis / np.linalg.norm(x_axis)
+    y_axis = np.cross(z_axis, x_axis)
+
+    rotation = np.stack([x_axis, y_axis, z_axis])
+    translation = -rotation @ position
+    return rotation, translation.reshape(3, 1)
+
+
+class SyntheticCaptureFactory:
+    """Everything needed to build a SyntheticCapture. Kept free of OpenCV
+    objects so that it can be pickled over to a capture process"""
+
+    def __init__(
+        self,
+        charuco,
+        camera_matrix,
+        distortion,
+        rotation,
+        translation,
+        resolution=(640, 480),
+        fps=30,
+        noise=2.0,
+        poses=None,
+        start_time=None,
+        open_delay=0,
+    ):
+        self.charuco = charuco
+        self.camera_matrix = np.array(camera_matrix, dtype=np.float64)
+        self.distortion = np.array(distortion, dtype=np.float64)
+        self.rotation = np.array(rotation, dtype=np.float64)
+        self.translation = np.array(translation, dtype=np.float64).reshape(3, 1)
+
+        # camera matrix is defined for the base resolution and scaled as needed
+        self.base_resolution = tuple(resolution)
+        self.resolution = tuple(resolution)  # resolution a new capture opens at
+        self.fps = fps
+        self.noise = noise
+        self.poses = default_poses() if poses is None else poses
+
+        # shared by all cameras of an array so that they see the same board pose
+        self.start_time = time.perf_counter() if start_time is None else start_time
+
+        # seconds to open a capture; real devices can take a second or more
+        self.open_delay = open_delay
+
+    def __call__(self):
+        time.sleep(self.open_delay)
+        return SyntheticCapture(self)
+
+    def board_pose(self, frame_time):
+        """Rotation and translation (board -> world) at the given perf_counter time"""
+        rvec, tvec = self.poses(frame_time - self.start_time)
+        rotation, _ = cv2.Rodrigues(rvec)
+
+        # poses describe the board center, but board points originate at a corner
+        square_length = self.charuco.board.getSquareLength()
+        center = np.array(
+            [[self.charuco.columns * square_length / 2], [self.charuco.rows * square_length / 2], [0]]
+        )
+        translation = tvec.reshape(3, 1) - rotation @ center
+        return rotation, translation
+
+    def camera_matrix_at(self, resolution):
+        scale_x = resolution[0] / self.base_resolution[0]
+        scale_y = resolution[1] / self.base_resolution[1]
+        scale = np.array([[scale_x], [scale_y], [1]])
+        return self.camera_matrix * scale
+
+    def ground_truth(self, frame_time, resolution=None):
+        """The true board pose (board -> camera) and image location of every
+        charuco corner for a frame captured at frame_time"""
+        resolution = self.resolution if resolution is None else resolution
+        camera_matrix = self.camera_matrix_at(resolution)
+
+        board_rotation, board_translation = self.board_pose(frame_time)
+        rotation = self.rotation @ board_rotation
+        translation = self.rotation @ board_translation + self.translation
+        rvec, _ = cv2.Rodrigues(rotation)
+
+        board_loc = self.charuco.board.chessboardCorners
+        img_loc, _ = cv2.projectPoints(board_loc, rvec, translation, camera_matrix, self.distortion)
+
+        return {
+            "rvec": rvec,
+            "tvec": translation,
+            "ids": np.arange(len(board_loc)).reshape(-1, 1),
+            "img_loc": img_loc.astype(np.float32),
+            "board_loc": board_loc,
+        }
+
+
+class SyntheticCapture:
+    def __init__(self, factory):
+        self.factory = factory
+        self.opened = True
+
+        self.resolution = factory.resolution
+        self.exposure = -6.0
+        self.fourcc = 0
+        self.convert_rgb = True  # False returns the JPEG bytes (MJPEG passthrough)
+        self.frame_index = -1  # index of most recently grabbed frame
+        self.grab_time = None
+
+        self.square_length = factory.charuco.board.getSquareLength()
+        self.board_img = self.render_board()
+        self._undistorted_grid = None  # built lazily; depends on resolution
+
+        self._rng = np.random.default_rng()
+
+    def render_board(self):
+        charuco = self.factory.charuco
+        margin = PIXELS_PER_SQUARE // 2
+        width = charuco.columns * PIXELS_PER_SQUARE + 2 * margin
+        height = charuco.rows * PIXELS_PER_SQUARE + 2 * margin
+        board_img = charuco.board.draw((width, height), marginSize=margin)
+        if charuco.inverted:
+            board_img = ~board_img
+
+        # maps a pixel of the board image to board coordinates (meters)
+        meters_per_pixel = self.square_length / PIXELS_PER_SQUARE
+        self.board_img_to_board = np.array(
+            [
+                [meters_per_pixel, 0, -margin * meters_per_pixel],
+                [0, meters_per_pixel, -margin * meters_per_pixel],
+                [0, 0, 1],
+            ]
+        )
+        return board_img
+
+    @property
+    def camera_matrix(self):
+        return self.factory.camera_matrix_at(self.resolution)
+
+    def isOpened(self):
+        return self.opened
+
+    def getBackendName(self):
+        return "SYNTHETIC"
+
+    def release(self):
+        self.opened = False
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.resolution[0]
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.resolution[1]
+        if prop == cv2.CAP_PROP_EXPOSURE:
+            return self.exposure
+        if prop == cv2.CAP_PROP_FPS:
+            return self.factory.fps or 0
+        if prop == cv2.CAP_PROP_FOURCC:
+            return self.fourcc
+        if prop == cv2.CAP_PROP_CONVERT_RGB:
+            return float(self.convert_rgb)
+        return 0
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            # like a real device, settle on the closest supported resolution
+            nearest = min(SYNTHETIC_RESOLUTIONS, key=lambda res: abs(res[0] - value))
+            if nearest != self.resolution:
+                self.resolution = nearest
+                self._undistorted_grid = None
+            return True
+        if prop == cv2.CAP_PROP_EXPOSURE:
+            self.exposure = value
+            return True
+        if prop == cv2.CAP_PROP_FOURCC:
+            self.fourcc = value
+            return True
+        if prop == cv2.CAP_PROP_CONVERT_RGB:
+            self.convert_rgb = bool(value)
+            return True
+        return False
+
+    def grab(self):
+        """Latch the most recent frame, or wait for the next one if that has
+        already been grabbed, as a free running camera with a one frame
+        buffer would"""
+        if not self.opened:
+            return False
+
+        now = time.perf_counter()
+        if self.factory.fps:
+            elapsed = now - self.factory.start_time
+            latest_index = int(elapsed * self.factory.fps)
+            if latest_index > self.frame_index:
+                self.frame_index = latest_index
+            else:
+                self.frame_index += 1
+            deadline = self.factory.start_time + self.frame_index / self.factory.fps
+            time.sleep(max(0, deadline - now))
+            self.grab_time = deadline
+        else:
+            self.frame_index += 1
+            self.grab_time = now
+        return True
+
+    def retrieve(self, image=None):
+        if self.grab_time is None:
+            return False, None
+
+        frame = self.render(self.grab_time)
+        if not self.convert_rgb:
+            # the device's JPEG, as a flat buffer of bytes
+            _, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+            return True, jpeg.ravel()
+
+        if image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+            frame = image
+        return True, frame
+
+    def read(self, image=None):
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def render(self, frame_time):
+        width, height = self.resolution
+        camera_matrix = self.camera_matrix
+
+        board_rotation, board_translation = self.factory.board_pose(frame_time)
+        rotation = self.factory.rotation @ board_rotation
+        translation = self.factory.rotation @ board_translation + self.factory.translation
+
+        if translation[2, 0] <= 0:
+            # board is behind the camera
+            gray = np.full((height, width), BACKGROUND, dtype=np.uint8)
+        else:
+            # homography from board image pixels to (undistorted) camera pixels
+            board_plane = np.column_stack([rotation[:, 0], rotation[:, 1], translation])
+            homography = camera_matrix @ board_plane @ self.board_img_to_board
+
+            if np.any(self.factory.distortion):
+                if self._undistorted_grid is None:
+                    self._undistorted_grid = self.build_undistorted_grid()
+                board_pixels = cv2.perspectiveTransform(
+                    self._undistorted_grid, np.linalg.inv(homography)
+                ).reshape(height, width, 2)
+                gray = cv2.remap(
+                    self.board_img,
+                    board_pixels,
+                    None,
+                    cv2.INTER_LINEAR,
+                    borderMode=cv2.BORDER_CONSTANT,
+                    borderValue=BACKGROUND,
+                )
+            else:
+                gray = cv2.warpPerspective(
+                    self.board_img,
+                    homography,
+                    (width, height),
+                    borderMode=cv2.BORDER_CONSTANT,
+                    borderValue=BACKGROUND,
+                )
+
+        if self.factory.noise:
+            noise = self._rng.normal(0, self.factory.noise, gray.shape)
+            gray = np.clip(gray + noise, 0, 255).astype(np.uint8)
+
+        return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+    def build_undistorted_grid(self):
+        """For every (distorted) output pixel, the location it would have in an
+        undistorted image. Computed once per resolution"""
+        width, height = self.resolution
+        logging.info(f"Building distortion map for synthetic capture at {width}x{height}")
+        xs, ys = np.meshgrid(np.arange(width), np.arange(height))
+        pixels = np.stack([xs, ys], axis=-1).reshape(-1, 1, 2).astype(np.float32)
+        camera_matrix = self.camera_matrix
+        return cv2.undistortPoints(
+            pixels, camera_matrix, self.factory.distortion, P=camera_matrix
+        )
+
+
+class SyntheticCamera(Camera):
+    """A Camera that opens a SyntheticCapture rather than a device"""
+
+    def __init__(self, port, capture_factory, capability_cache=None):
+        self.capture_factory = capture_factory
+        super().__init__(port, capability_cache)
+
+    def open_capture(self):
+        return self.capture_factory()
+
+    def ground_truth(self, frame_time):
+        return self.capture_factory.ground_truth(frame_time, self.resolution)
+
+
+class SyntheticArray:
+    """A set of synthetic cameras spread along an arc, all looking at the
+    same moving board. Provides the ground truth calibration of the array"""
+
+    def __init__(
+        self,
+        charuco,
+        camera_count,
+        resolution=(640, 480),
+        fps=30,
+        noise=2.0,
+        distance=0.8,
+        arc=np.radians(60),
+        poses=None,
+        open_delay=0,
+    ):
+        self.charuco = charuco
+        self.ports = list(range(camera_count))
+
+        start_time = time.perf_counter()
+        poses = default_poses() if poses is None else poses
+
+        if camera_count > 1:
+            angles = np.linspace(-arc / 2, arc / 2, camera_count)
+        else:
+            angles = [0]
+
+        self.capture_factories = {}
+        for port, angle in zip(self.ports, angles):
+            position = (distance * np.sin(angle), 0, -distance * np.cos(angle))
+            rotation, translation = look_at(position)
+
+            self.capture_factories[port] = SyntheticCaptureFactory(
+                charuco,
+                default_camera_matrix(resolution),
+                DEFAULT_DISTORTION,
+                rotation,
+                translation,
+                resolution=resolution,
+                fps=fps,
+                noise=noise,
+                poses=poses,
+                start_time=start_time,
+                open_delay=open_delay,
+            )
+
+    def get_cameras(self):
+        """Build a dictionary of SyntheticCameras keyed by port, with the true
+        intrinsics already applied as though they had been calibrated"""
+        cameras = {}
+        for port, factory in self.capture_factories.items():
+            cam = SyntheticCamera(port, factory)
+            cam.camera_matrix = factory.camera_matrix_at(cam.resolution)
+            cam.distortion = factory.distortion
+            cam.error = 0
+            cam.grid_count = 0
+            cameras[port] = cam
+        return cameras
+
+    def ground_truth_config(self):
+        """A dictionary laid out like a session config.toml, holding the true
+        intrinsics of each camera and extrinsics of each camera pair"""
+        config = {}
+        for port, factory in self.capture_factories.items():
+            config[f"cam_{port}"] = {
+                "port": port,
+                "resolution": list(factory.base_resolution),
+                "rotation_count": 0,
+                "error": 0.0,
+                "camera_matrix": factory.camera_matrix.tolist(),
+                "distortion": factory.distortion.tolist(),
+                "exposure": -6.0,
+                "grid_count": 0,
+                "ignore": False,
+            }
+
+        for port_A in self.ports:
+            for port_B in self.ports:
+                if port_A < port_B:
+                    factory_A = self.capture_factories[port_A]
+                    factory_B = self.capture_factories[port_B]
+                    # same convention as cv2.stereoCalibrate: x_B = R x_A + T
+                    rotation = factory_B.rotation @ factory_A.rotation.T
+                    translation = factory_B.translation - rotation @ factory_A.translation
+                    config[f"stereo_{port_A}_{port_B}"] = {
+                        "grid_count": 0,
+                        "rotation": rotation.tolist(),
+                        "translation": translation.tolist(),
+                        "RMSE": 0.0,
+                    }
+        return config
+
+
+if __name__ == "__main__":
+    from src.calibration.charuco import Charuco
+    from src.calibration.corner_tracker import CornerTracker
+
+    charuco = Charuco(
+        4, 5, 11, 8.5, aruco_scale=0.75, square_size_overide_cm=5.25, inverted=True
+    )
+    trackr = CornerTracker(charuco)
+
+    synthetic_array = SyntheticArray(charuco, camera_count=3)
+    cameras = synthetic_array.get_cameras()
+
+    while True:
+        for port, cam in cameras.items():
+            success, frame = cam.capture.read()
+            frame_time = cam.capture.grab_time
+
+            ids, img_loc, board_loc = trackr.get_corners(frame)
+            truth = cam.ground_truth(frame_time)
+
+            if ids.any():
+                error = img_loc[:, 0, :] - truth["img_loc"][ids[:, 0], 0, :]
+                rmse = np.sqrt(np.mean(np.sum(error**2, axis=1)))
+                text = f"{len(ids)} corners | RMSE vs truth: {rmse:.2f} px"
+            else:
+                text = "no corners found"
+
+            cv2.putText(frame, text, (10, 30), cv2.FONT_HERSHEY_PLAIN, 1.5, (0, 0, 255), 2)
+            cv2.imshow(f"Synthetic port {port}: 'q' to quit", frame)
+
+        if cv2.waitKey(1) == ord("q"):
+            cv2.destroyAllWindows()
+            break
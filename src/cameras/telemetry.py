@@ -0,0 +1,228 @@
+# Lightweight per-stream capture telemetry, intended to make it obvious which
+# camera is throttling the array. Every update is O(1): samples are counted
+# into fixed histogram bins and percentiles are only worked out (by walking
+# the bins) when someone asks for them.
+#
+# Each histogram keeps two sets of counts:
+#   - recent: the current and previous window of WINDOW seconds, for a
+#     rolling view that the GUI can poll
+#   - session: everything since the stream started, for the end-of-session dump
+
+import logging
+import math
+import time
+from threading import Lock
+
+import numpy as np
+import toml
+
+WINDOW = 10  # seconds per rolling window
+PERCENTILES = (50, 95, 99)
+
+
+class LogHistogram:
+    """Histogram over log-spaced bins so that both sub-millisecond and
+    multi-second values are resolved to within a few percent"""
+
+    def __init__(self, minimum=1e-5, maximum=10, bins_per_decade=40):
+        self.minimum = minimum
+        self.bins_per_decade = bins_per_decade
+        decades = math.log10(maximum / minimum)
+        self.bin_count = int(math.ceil(decades * bins_per_decade)) + 2  # plus under/overflow
+
+        # value reported for each bin: the geometric middle of bin i, which
+        # spans minimum * 10**((i-1, i) / bins_per_decade)
+        self.values = minimum * 10 ** ((np.arange(self.bin_count) - 0.5) / bins_per_decade)
+        self.values[0] = minimum
+        self.values[-1] = maximum
+
+        self.session = np.zeros(self.bin_count, dtype=np.int64)
+        self.current = np.zeros(self.bin_count, dtype=np.int64)
+        self.previous = np.zeros(self.bin_count, dtype=np.int64)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def bin(self, value):
+        if value < self.minimum:
+            return 0
+        index = int(math.log10(value / self.minimum) * self.bins_per_decade) + 1
+        return min(index, self.bin_count - 1)
+
+    def add(self, value):
+        index = self.bin(value)
+        self.session[index] += 1
+        self.current[index] += 1
+        self.total += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def rotate(self):
+        """Start a new rolling window"""
+        self.previous, self.current = self.current, self.previous
+        self.current[:] = 0
+
+    def percentile(self, q, counts):
+        """Value of the bin holding the q-th percentile"""
+        count = counts.sum()
+        if count == 0:
+            return None
+        index = int(np.searchsorted(np.cumsum(counts), count * q / 100))
+        return float(self.values[index])
+
+    def summary(self, recent=True, scale=1):
+        counts = self.current + self.previous if recent else self.session
+        summary = {"count": int(counts.sum())}
+        for q in PERCENTILES:
+            value = self.percentile(q, counts)
+            summary[f"p{q}"] = None if value is None else value * scale
+        if not recent and self.count > 0:
+            summary["mean"] = float(self.total / self.count * scale)
+            summary["max"] = float(self.max * scale)
+        return summary
+
+
+class CountHistogram(LogHistogram):
+    """Histogram of small non-negative integers (e.g. queue depth), one bin each"""
+
+    def __init__(self, maximum=64):
+        self.minimum = 0
+        self.bin_count = maximum + 2  # plus overflow
+        self.values = np.arange(self.bin_count, dtype=np.float64)
+
+        self.session = np.zeros(self.bin_count, dtype=np.int64)
+        self.current = np.zeros(self.bin_count, dtype=np.int64)
+        self.previous = np.zeros(self.bin_count, dtype=np.int64)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0
+
+    def bin(self, value):
+        return min(int(value), self.bin_count - 1)
+
+
+class StreamTelemetry:
+    def __init__(self, port, window=WINDOW):
+        self.port = port
+        self.window = window
+        self.lock = Lock()  # written by the stream thread, read by the GUI
+
+        self.read_latency = LogHistogram()  # seconds spent reading a frame
+        self.frame_interval = LogHistogram()  # seconds between consecutive frames
+        self.reel_depth = CountHistogram()  # unread frames after each push
+
+        self.frames = 0
+        self.failed_reads = 0
+        self.dropped = 0
+        self.reconnects = 0
+
+        self.started = time.perf_counter()
+        self.window_start = self.started
+        self.last_frame_time = None
+
+    def _check_window(self, now):
+        if now - self.window_start > self.window:
+            for histogram in (self.read_latency, self.frame_interval, self.reel_depth):
+                histogram.rotate()
+            self.window_start = now
+
+    def record_read(self, read_start, read_stop, frame_time=None):
+        frame_time = (read_start + read_stop) / 2 if frame_time is None else frame_time
+        with self.lock:
+            self._check_window(read_stop)
+            self.read_latency.add(read_stop - read_start)
+            if self.last_frame_time is not None:
+                self.frame_interval.add(frame_time - self.last_frame_time)
+            self.last_frame_time = frame_time
+            self.frames += 1
+
+    def record_failed_read(self):
+        with self.lock:
+            self.failed_reads += 1
+
+    def record_depth(self, depth):
+        with self.lock:
+            self.reel_depth.add(depth)
+
+    def record_drop(self, count=1):
+        with self.lock:
+            self.dropped += count
+
+    def record_reconnect(self):
+        with self.lock:
+            self.reconnects += 1
+            # the gap across a reconnect says nothing about the camera's pace
+            self.last_frame_time = None
+
+    def summary(self, recent=True):
+        """Percentiles of latency and interval (ms), queue depth and counters.
+        recent=True covers the last one to two windows; False the whole session"""
+        with self.lock:
+            interval = self.frame_interval.summary(recent, scale=1000)
+            fps = None if interval["p50"] is None else 1000 / interval["p50"]
+            return {
+                "port": self.port,
+                "fps": fps,
+                "read_latency_ms": self.read_latency.summary(recent, scale=1000),
+                "frame_interval_ms": interval,
+                "reel_depth": self.reel_depth.summary(recent),
+                "frames": self.frames,
+                "failed_reads": self.failed_reads,
+                "dropped": self.dropped,
+                "reconnects": self.reconnects,
+                "seconds": time.perf_counter() - self.started,
+            }
+
+
+def slowest_port(summaries):
+    """The port whose median frame interval is longest, i.e. the likely
+    bottleneck of the array"""
+    paced = {
+        port: summary["frame_interval_ms"]["p50"]
+        for port, summary in summaries.items()
+        if summary["frame_interval_ms"]["p50"] is not None
+    }
+    if not paced:
+        return None
+    return max(paced, key=paced.get)
+
+
+def dump_telemetry(summaries, path):
+    """Write session telemetry for each port to a toml file"""
+    summaries = dict(summaries)
+    output = {f"port_{port}": _drop_none(summary) for port, summary in summaries.items()}
+    output["slowest_port"] = slowest_port(summaries)
+    output = _drop_none(output)
+
+    logging.info(f"Saving capture telemetry to {path}")
+    with open(path, "w") as f:
+        toml.dump(output, f)
+
+
+def _drop_none(d):
+    """toml has no null"""
+    return {
+        key: _drop_none(value) if isinstance(value, dict) else value
+        for key, value in d.items()
+        if value is not None
+    }
+
+
+if __name__ == "__main__":
+    # show the cost of an update and what a summary looks like
+    telemetry = StreamTelemetry(port=0)
+    rng = np.random.default_rng()
+    latencies = rng.lognormal(np.log(0.01), 0.3, 100_000)
+
+    start = time.perf_counter()
+    frame_time = 0
+    for latency in latencies:
+        telemetry.record_read(frame_time, frame_time + latency)
+        telemetry.record_depth(rng.integers(0, 4))
+        frame_time += 1 / 30
+    elapsed = time.perf_counter() - start
+
+    print(f"{elapsed / len(latencies) * 1e6:.1f} microseconds per frame recorded")
+    print(f"numpy percentiles of latency (ms): {np.percentile(latencies, PERCENTILES) * 1000}")
+    print(toml.dumps(_drop_none(telemetry.summary(recent=False))))
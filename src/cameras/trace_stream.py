@@ -0,0 +1,235 @@
+# Streams that replay the frame timing of a real rig, jitter, stalls, drops
+# and all, so that changes to the Synchronizer can be tried against the
+# pathologies our cameras actually produce rather than perfectly periodic
+# frames. Like the RecordedStream, a TraceStream presents the `reel` and
+# `shutter_sync` queues that a Synchronizer harvests from, but the frames
+# carry no image content to speak of; only their timing matters.
+#
+# A TimingTrace is the frame times of each port. It can be read from the
+# frame_time_history.csv saved alongside a recording, generated with chosen
+# pathologies (and a seed, so the same trace comes out every time), and
+# saved in the same csv layout.
+#
+# Replay comes in two flavours:
+#   - realtime: each frame is released at its place on the trace relative to
+#     when replay began, and stamped with that time. A stream that is not
+#     fired for a while hands over the most recent frame, as a camera
+#     holding one frame in its buffer would
+#   - as fast as possible (realtime=False): every fire of the shutter gets
+#     the next frame of the trace, stamped with its original time. The
+#     Synchronizer sorts frames into bundles purely by their timestamps, so
+#     replaying a trace this way gives the same bundles on every run
+
+import logging
+import time
+from pathlib import Path
+from queue import Queue
+from threading import Thread, Event
+
+import numpy as np
+import pandas as pd
+
+FRAME_SHAPE = (48, 64, 3)  # frames are placeholders; keep them small
+
+
+class TimingTrace:
+    def __init__(self, frame_times: dict):
+        # port: array of frame times in seconds, increasing
+        self.frame_times = {
+            port: np.sort(np.asarray(times, dtype=np.float64)) for port, times in frame_times.items()
+        }
+        self.ports = sorted(self.frame_times.keys())
+
+    @classmethod
+    def from_history(cls, path):
+        """Frame times of each port from a recording's frame_time_history.csv.
+        Frames that were dropped on the way into bundles are missing from
+        the file, and show up as the gaps they were"""
+        history = pd.read_csv(path)
+        frame_times = {}
+        for port, port_history in history.groupby("port"):
+            frame_times[int(port)] = port_history.sort_values("frame_index")["frame_time"].to_numpy()
+        logging.info(f"Loaded timing trace of ports {list(frame_times.keys())} from {path}")
+        return cls(frame_times)
+
+    @classmethod
+    def generate(
+        cls,
+        ports,
+        fps=30,
+        duration=10,
+        jitter=0.002,
+        offset=0.005,
+        stall_rate=0.2,
+        stall_length=0.25,
+        drop_rate=0.02,
+        seed=0,
+    ):
+        """A trace with known pathologies:
+        - jitter: standard deviation (seconds) of each frame about its slot
+        - offset: standard deviation of each port's phase relative to the others
+        - stall_rate: stalls per second per port. Frames due during a stall
+          of up to stall_length seconds arrive together at its end, after
+          which the camera carries on at its usual cadence
+        - drop_rate: fraction of frames that never arrive"""
+        rng = np.random.default_rng(seed)
+        frame_count = int(duration * fps)
+        frame_times = {}
+        for port in ports:
+            times = np.arange(frame_count) / fps
+            times += rng.normal(0, offset)
+            times += rng.normal(0, jitter, frame_count)
+
+            stall_count = rng.poisson(stall_rate * duration)
+            for stall_time in rng.uniform(0, duration, stall_count):
+                stall_end = stall_time + rng.uniform(0, stall_length)
+                times[(times > stall_time) & (times < stall_end)] = stall_end
+
+            kept = rng.random(frame_count) >= drop_rate
+            frame_times[port] = np.maximum.accumulate(times[kept])
+        return cls(frame_times)
+
+    def save(self, path):
+        """Saved in the layout of frame_time_history.csv"""
+        rows = {"port": [], "frame_index": [], "frame_time": []}
+        for port, times in self.frame_times.items():
+            rows["port"].extend([port] * len(times))
+            rows["frame_index"].extend(range(len(times)))
+            rows["frame_time"].extend(times.tolist())
+        pd.DataFrame(rows).to_csv(path, index=False, header=True)
+
+    @property
+    def start_time(self):
+        return min(times[0] for times in self.frame_times.values() if len(times) > 0)
+
+    @property
+    def duration(self):
+        end_time = max(times[-1] for times in self.frame_times.values() if len(times) > 0)
+        return end_time - self.start_time
+
+    def summary(self):
+        """Per-port view of the timing pathologies in the trace, in ms"""
+        summary = {}
+        for port, times in self.frame_times.items():
+            intervals = np.diff(times) * 1000
+            if len(intervals) == 0:
+                continue
+            median = float(np.median(intervals))
+            summary[port] = {
+                "frames": len(times),
+                "interval_median_ms": median,
+                "interval_p99_ms": float(np.percentile(intervals, 99)),
+                "interval_max_ms": float(np.max(intervals)),
+                # more than one and a half frames between frames: a drop or a stall
+                "gaps": int(np.sum(intervals > 1.5 * median)),
+            }
+        return summary
+
+    def build_streams(self, realtime=True):
+        return {
+            port: TraceStream(port, self.frame_times[port], realtime, trace_start=self.start_time)
+            for port in self.ports
+        }
+
+
+class TraceStream:
+    def __init__(self, port, frame_times, realtime=True, trace_start=None, frame_shape=FRAME_SHAPE):
+        self.port = port
+        self.frame_times = np.asarray(frame_times, dtype=np.float64)
+        self.realtime = realtime
+
+        self.reel = Queue(-1)
+        self.shutter_sync = Queue(-1)
+        self.push_to_reel = False
+        self.stop_event = Event()
+
+        self.frame = np.zeros(frame_shape, dtype=np.uint8)
+        self.frame.flags.writeable = False  # one frame is shared by every reel entry
+        self.next_index = 0  # index on the trace of the next frame to deliver
+        self.frames_skipped = 0  # passed over by the realtime replay while not fired
+
+        # the start of the trace (shared by all of its ports) lines up with
+        # replay_start on the replay clock, which is set by start()
+        if trace_start is None:
+            trace_start = self.frame_times[0] if len(self.frame_times) else 0
+        self.trace_start = trace_start
+        self.replay_start = None
+
+    def start(self, replay_start=None):
+        """Begin replay, once the stream has been handed to a Synchronizer.
+        Streams replaying one trace should share a replay_start so that
+        their frames keep their relative timing"""
+        self.replay_start = time.perf_counter() if replay_start is None else replay_start
+        self.thread = Thread(target=self.replay_worker, args=[], daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.shutter_sync.put("release replay_worker if waiting")
+
+    def replay_time(self, index):
+        """Time on the replay clock at which a frame on the trace arrives"""
+        return self.replay_start + self.frame_times[index] - self.trace_start
+
+    def next_frame_time(self):
+        if self.realtime:
+            return self.next_realtime_frame()
+
+        frame_time = self.frame_times[self.next_index]
+        self.next_index += 1
+        return frame_time
+
+    def next_realtime_frame(self):
+        """Wait for the next frame to arrive, or if later frames have already
+        arrived, take the most recent of them"""
+        now = time.perf_counter()
+        arrived = np.searchsorted(self.frame_times, now - self.replay_start + self.trace_start, "right")
+        if arrived > self.next_index:
+            self.frames_skipped += arrived - self.next_index - 1
+            self.next_index = arrived - 1
+        else:
+            time.sleep(max(0, self.replay_time(self.next_index) - now))
+
+        frame_time = self.replay_time(self.next_index)
+        self.next_index += 1
+        return frame_time
+
+    def replay_worker(self):
+        logging.info(f"Beginning replay of timing trace at port {self.port}")
+
+        while not self.stop_event.is_set():
+            _ = self.shutter_sync.get()
+            if self.stop_event.is_set():
+                break
+
+            if self.next_index >= len(self.frame_times):
+                logging.info(f"Ending timing trace replay at port {self.port}")
+                # same signal the RecordedStream gives at the end of the file
+                self.reel.put([-1, np.array([], dtype="uint8")])
+                break
+
+            # like the RecordedStream, always push; a frame consumed without
+            # being pushed would throw off the replay
+            frame_time = self.next_frame_time()
+            self.reel.put([frame_time, self.frame])
+
+        logging.info(f"Trace replay stopped at port {self.port}")
+
+
+def start_streams(streams):
+    """Start replay of every stream from one shared instant"""
+    replay_start = time.perf_counter()
+    for stream in streams.values():
+        stream.start(replay_start)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1:
+        trace = TimingTrace.from_history(Path(sys.argv[1]))
+    else:
+        trace = TimingTrace.generate(ports=[0, 1, 2], duration=5)
+
+    for port, stats in trace.summary().items():
+        print(port, stats)
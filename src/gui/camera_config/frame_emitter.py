@@ -59,14 +59,15 @@ class FrameEmitter(QThread):
         self.quit()
 
     def cv2_to_qlabel(self, frame):
-        Image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        FlippedImage = cv2.flip(Image, 1)
+        # Qt reads BGR directly, so no color conversion is needed
+        FlippedImage = cv2.flip(frame, 1)
 
         qt_frame = QImage(
             FlippedImage.data,
             FlippedImage.shape[1],
             FlippedImage.shape[0],
-            QImage.Format.Format_RGB888,
+            FlippedImage.strides[0],
+            QImage.Format.Format_BGR888,
         )
         return qt_frame
 
@@ -32,6 +32,7 @@ from PyQt6.QtWidgets import (
 
 from src.session import Session
 from src.gui.left_sidebar.camera_table import CameraTable
+from src.gui.left_sidebar.telemetry_table import TelemetryTable
 
 class CameraSummary(QWidget):
     def __init__(self, session):
@@ -53,6 +54,10 @@ class CameraSummary(QWidget):
         self.camera_table.setFixedSize(250, 150)
         vbox.addWidget(self.camera_table)
 
+        self.telemetry_table = TelemetryTable(self.session)
+        self.telemetry_table.setFixedSize(250, 150)
+        vbox.addWidget(self.telemetry_table)
+
         self.hbox.addLayout(vbox)
         
 
@@ -54,7 +54,7 @@ class FPSControl(QWidget):
         
         def on_frame_rate_spin(fps_rate):
             try:
-                self.session.synchronizer.fps_target = fps_rate
+                self.session.set_fps_target(fps_rate)
                 logging.info(f"Changing synchronizer frame rate")
             except(AttributeError):
                 logging.warning("Unable to change synch fps...may need to load stream tools") 
@@ -0,0 +1,99 @@
+# Live view of per-stream capture telemetry so that a camera throttling the
+# array stands out. The slowest port (longest median frame interval) is
+# highlighted.
+import logging
+
+LOG_FILE = r"log\telemetry_table.log"
+LOG_LEVEL = logging.DEBUG
+# LOG_LEVEL = logging.INFO
+LOG_FORMAT = " %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s"
+
+logging.basicConfig(filename=LOG_FILE, filemode="w", format=LOG_FORMAT, level=LOG_LEVEL)
+
+import sys
+from pathlib import Path
+
+from PyQt6.QtCore import QTimer
+from PyQt6.QtGui import QColor
+from PyQt6.QtWidgets import (
+    QAbstractItemView,
+    QApplication,
+    QTableWidget,
+    QTableWidgetItem,
+    QVBoxLayout,
+    QWidget,
+)
+
+from src.cameras.telemetry import slowest_port
+from src.session import Session
+
+REFRESH_MS = 1000
+
+
+class TelemetryTable(QWidget):
+    def __init__(self, session):
+        super().__init__()
+
+        vbox = QVBoxLayout()
+
+        self.session = session
+        self.table = QTableWidget()
+        # make table read only
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+
+        self.setLayout(vbox)
+        vbox.addWidget(self.table)
+
+        self._headers = ["port", "fps", "read p95 ms", "interval p99 ms", "depth p95", "dropped", "reconnects"]
+        self.table.setColumnCount(len(self._headers))
+        self.table.setHorizontalHeaderLabels(self._headers)
+        self.table.verticalHeader().setVisible(False)
+
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.update_data)
+        self.timer.start(REFRESH_MS)
+        self.update_data()
+
+    def update_data(self):
+        telemetry = self.session.capture_telemetry(recent=True)
+        slowest = slowest_port(telemetry)
+
+        self.table.setRowCount(len(telemetry))
+        for row, (port, summary) in enumerate(sorted(telemetry.items())):
+            dropped = summary["dropped"] + summary.get("out_of_sync", 0)
+            values = [
+                port,
+                summary["fps"],
+                summary["read_latency_ms"]["p95"],
+                summary["frame_interval_ms"]["p99"],
+                summary["reel_depth"]["p95"],
+                dropped,
+                summary["reconnects"],
+            ]
+            for column, value in enumerate(values):
+                if value is None:
+                    text = "-"
+                elif isinstance(value, float):
+                    text = f"{value:.1f}"
+                else:
+                    text = str(value)
+                item = QTableWidgetItem(text)
+                if port == slowest and len(telemetry) > 1:
+                    item.setBackground(QColor(255, 220, 180))
+                self.table.setItem(row, column, item)
+
+        self.table.resizeColumnsToContents()
+
+
+if __name__ == "__main__":
+    repo = Path(__file__).parent.parent.parent.parent
+    config_path = Path(repo, "sessions", "high_res_session")
+
+    session = Session(config_path)
+    session.load_cameras()
+    session.load_streams()
+
+    app = QApplication(sys.argv)
+    window = TelemetryTable(session)
+    window.show()
+    app.exec()
@@ -57,20 +57,17 @@ class StereoCalDialog(QScrollArea):
         self.top_controls = QHBoxLayout()
         self.top_controls.setContentsMargins(20, 0, 20, 0)
 
-        # add a spin box to control the frame rate
+        # add a spin box to control the frame rate; the rate is adjusted to
+        # what calibration keeps up with, so this is the most it will run at
         self.frame_rate_spin = QSpinBox()
-        self.frame_rate_spin.setValue(6)
-
-        self.session.stereocalibrator.synchronizer.fps_target = (
-            self.frame_rate_spin.value()
-        )
+        self.frame_rate_spin.setValue(int(self.session.rate_controller.max_fps))
 
         def on_frame_rate_spin(fps_rate):
-            self.session.stereocalibrator.synchronizer.fps_target = fps_rate
+            self.session.set_fps_target(fps_rate)
 
         self.frame_rate_spin.valueChanged.connect(on_frame_rate_spin)
 
-        self.top_controls.addWidget(QLabel("FPS:"))
+        self.top_controls.addWidget(QLabel("Max FPS:"))
         self.top_controls.addWidget(self.frame_rate_spin)
 
         # and a spin box to control how many captures needed to calibrate
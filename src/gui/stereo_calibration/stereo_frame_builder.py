@@ -16,11 +16,14 @@ import numpy as np
 
 from src.cameras.synchronizer import Synchronizer
 
+MAX_PREVIEW_LEVEL = 3  # deepest pyramid level thumbnails are built from
 
 class StereoFrameBuilder:
     def __init__(self, stereo_calibrator, single_frame_height=250):
         self.stereo_calibrator = stereo_calibrator
         self.single_frame_height = single_frame_height
+        self.preview_scale = {}  # size of the frame being drawn on relative to the original
+        self.preview_width = {}  # width of the frame being drawn on, for mirroring corners
 
         self.get_camera_rotation()
 
@@ -49,31 +52,30 @@ class StereoFrameBuilder:
             return frameA, frameB
 
         elif (
-            "ids" not in self.current_bundle[portA]
-            or "ids" not in self.current_bundle[portB]
+            not self.current_bundle.annotations.has(portA, "ids")
+            or not self.current_bundle.annotations.has(portB, "ids")
         ):
             return frameA, frameB
         else:
-            ids_A = self.current_bundle[portA]["ids"]
-            ids_B = self.current_bundle[portB]["ids"]
+            corners_A = self.current_bundle.annotations.of_port(portA)
+            corners_B = self.current_bundle.annotations.of_port(portB)
+            ids_A, ids_B = corners_A["ids"], corners_B["ids"]
             common_ids = np.intersect1d(ids_A, ids_B)
             
-            img_loc_A = self.current_bundle[portA]["img_loc"]
-            img_loc_B = self.current_bundle[portB]["img_loc"]
+            img_loc_A = corners_A["img_loc"]
+            img_loc_B = corners_B["img_loc"]
+            scale_A = self.preview_scale[portA]
+            scale_B = self.preview_scale[portB]
 
             for _id, img_loc in zip(ids_A, img_loc_A):
                 if _id in common_ids:
-                    x = round(float(img_loc[0,0]))
-                    y = round(float(img_loc[0,1]))
-
-                    cv2.circle(frameA, (x, y), 5, (0, 0, 220), 3)
+                    point = self.preview_point(portA, img_loc[0])
+                    cv2.circle(frameA, point, self.scaled(5, scale_A), (0, 0, 220), self.scaled(3, scale_A))
 
             for _id, img_loc in zip(ids_B, img_loc_B):
                 if _id in common_ids:
-                    x = round(float(img_loc[0,0]))
-                    y = round(float(img_loc[0,1]))
-
-                    cv2.circle(frameB, (x, y), 5, (0, 0, 220), 3)
+                    point = self.preview_point(portB, img_loc[0])
+                    cv2.circle(frameB, point, self.scaled(5, scale_B), (0, 0, 220), self.scaled(3, scale_B))
             return frameA, frameB
 
     def draw_common_corner_history(self, frameA, portA, frameB, portB):
@@ -81,26 +83,47 @@ class StereoFrameBuilder:
         pair = (portA, portB)
         img_loc_A = self.stereo_calibrator.stereo_inputs[pair]["img_loc_A"]
         img_loc_B = self.stereo_calibrator.stereo_inputs[pair]["img_loc_B"]
+        scale_A = self.preview_scale[portA]
+        scale_B = self.preview_scale[portB]
 
         for cornerset in img_loc_A:
             for corner in cornerset:
-                corner = (int(corner[0][0]), int(corner[0][1]))
-                cv2.circle(frameA, corner, 2, (255, 165, 0), 2, 1)
+                corner = self.preview_point(portA, corner[0])
+                cv2.circle(frameA, corner, self.scaled(2, scale_A), (255, 165, 0), self.scaled(2, scale_A), 1)
 
         for cornerset in img_loc_B:
             for corner in cornerset:
-                corner = (int(corner[0][0]), int(corner[0][1]))
-                cv2.circle(frameB, corner, 2, (255, 165, 0), 2, 1)
+                corner = self.preview_point(portB, corner[0])
+                cv2.circle(frameB, corner, self.scaled(2, scale_B), (255, 165, 0), self.scaled(2, scale_B), 1)
 
         return frameA, frameB
 
+    def preview_point(self, port, img_loc):
+        """Where a point on the original frame lands on the mirrored preview"""
+        scale = self.preview_scale[port]
+        x = self.preview_width[port] - 1 - round(float(img_loc[0]) * scale)
+        y = round(float(img_loc[1]) * scale)
+        return (x, y)
+
+    def scaled(self, size, scale):
+        """Marker sizes shrink with the frame they are drawn on"""
+        return max(1, round(size * scale))
+
+    def preview_level(self, frame_shape):
+        """Deepest pyramid level that is still no smaller than the thumbnail,
+        so corners are drawn and borders padded on at most twice the pixels
+        that will be shown"""
+        edge = max(frame_shape[0], frame_shape[1])
+        level = 0
+        while level < MAX_PREVIEW_LEVEL and edge / 2 ** (level + 1) >= self.single_frame_height:
+            level += 1
+        return level
+
     def resize_to_square(self, frame):
         """To make sure that frames align well, scale them all to thumbnails
         squares with black borders."""
         logging.debug("resizing square")
 
-        frame = cv2.flip(frame, 1)
-
         height = frame.shape[0]
         width = frame.shape[1]
 
@@ -126,26 +149,38 @@ class StereoFrameBuilder:
 
     def get_frame_or_blank(self, port):
         """Synchronization issues can lead to some frames being None in the
-        bundle, so plug that with a blank frame"""
+        bundle, so plug that with a blank frame. Frames from the bundle are
+        read-only and shared with its other consumers"""
 
         edge = self.single_frame_height
         bundle = self.current_bundle[port]
         if bundle is None:
             logging.debug("plugging blank frame data")
             frame = np.zeros((edge, edge, 3), dtype=np.uint8)
+            self.preview_scale[port] = 1
         else:
-            frame = self.current_bundle[port]["frame"]
-
-        frame = frame.copy()
+            # the downscaled frame is cached on the packet, so it is shared
+            # with anything else previewing this frame
+            packet = self.current_bundle[port]["packet"]
+            level = self.preview_level(packet.frame.shape)
+            frame = packet.pyramid(level)
+            self.preview_scale[port] = 1 / 2**level
+
+        self.preview_width[port] = frame.shape[1]
         return frame
 
+    def mirrored(self, port):
+        """Preview frame flipped left to right. The flip makes a new image, so
+        this is also what corners are drawn on without touching the bundle"""
+        return cv2.flip(self.get_frame_or_blank(port), 1)
+
     def hstack_frames(self, pair):
         """place paired frames side by side"""
 
         portA, portB = pair
         logging.debug("Horizontally stacking paired frames")
-        frameA = self.get_frame_or_blank(portA)
-        frameB = self.get_frame_or_blank(portB)
+        frameA = self.mirrored(portA)
+        frameB = self.mirrored(portB)
 
         frameA, frameB = self.draw_common_corner_history(frameA, portA, frameB, portB)
         frameA, frameB = self.draw_common_corner_current(frameA, portA, frameB, portB)
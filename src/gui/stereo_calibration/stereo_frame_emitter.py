@@ -55,13 +55,13 @@ class StereoFrameEmitter(QThread):
         self.quit()
 
     def cv2_to_qlabel(self, frame):
-        Image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
+        # Qt reads BGR directly, so no color conversion is needed
         qt_frame = QImage(
-            Image.data,
-            Image.shape[1],
-            Image.shape[0],
-            QImage.Format.Format_RGB888,
+            frame.data,
+            frame.shape[1],
+            frame.shape[0],
+            frame.strides[0],
+            QImage.Format.Format_BGR888,
         )
         return qt_frame
 
@@ -0,0 +1,321 @@
+# Bundle a recorded session straight from its frame_time_history.csv.
+# Playing recordings back through the live Synchronizer means firing shutters
+# and waiting on threads for every frame, even though every timestamp is
+# known before the first frame is read. Here the frame times of all ports
+# are aligned in one go, giving a bundle table that replay and batch
+# processing can use directly.
+#
+# Alignment works against a reference timeline of bundle slots. It starts
+# as the frames of the port with the most frames; each other port is then
+# matched to it in a single vectorized step:
+#   - a frame joins a slot if each is the other's nearest neighbour and they
+#     are within the skew tolerance of each other
+#   - a frame that does not (its slot was dropped by the reference ports, or
+#     it is one of a burst of frames after a stall) opens a slot of its own
+# Slot times are the mean of their frames, and slots become bundles in time
+# order. Every frame lands in exactly one bundle and nothing is discarded.
+#
+# The bundle table has the layout of frame_time_history.csv, with the
+# bundle_index the alignment assigned each frame. Like the history, it names
+# the video file each frame is in, as a port whose resolution changed while
+# recording carries on in a new file.
+
+import logging
+
+LOG_FILE = r"log\offline_alignment.log"
+LOG_LEVEL = logging.DEBUG
+LOG_FORMAT = " %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s"
+
+logging.basicConfig(filename=LOG_FILE, filemode="w", format=LOG_FORMAT, level=LOG_LEVEL)
+
+import time
+from pathlib import Path
+from queue import Queue
+from threading import Thread, Event
+
+import cv2
+import numpy as np
+import pandas as pd
+
+from src.cameras.frame_bundle import FrameBundle
+from src.cameras.frame_packet import FramePacket, FrameData
+from src.cameras.pacer import Pacer
+from src.recording.recorded_stream import read_bundle_history
+
+BUNDLE_TABLE = "bundle_table.csv"
+
+
+def nearest(sorted_values, queries):
+    """Index of the nearest of the sorted values to each query"""
+    if len(sorted_values) == 1:
+        return np.zeros(len(queries), dtype=np.int64)
+    right = np.searchsorted(sorted_values, queries).clip(1, len(sorted_values) - 1)
+    left = right - 1
+    closer_to_left = queries - sorted_values[left] <= sorted_values[right] - queries
+    return np.where(closer_to_left, left, right)
+
+
+def mutual_nearest(reference, times, tolerance):
+    """For each of the sorted times, the index of the reference time it pairs
+    with, or -1. A pair must be each other's nearest and within tolerance"""
+    if len(reference) == 0 or len(times) == 0:
+        return np.full(len(times), -1, dtype=np.int64)
+
+    nearest_reference = nearest(reference, times)
+    nearest_time = nearest(times, reference)
+    mutual = nearest_time[nearest_reference] == np.arange(len(times))
+    close = np.abs(reference[nearest_reference] - times) <= tolerance
+    return np.where(mutual & close, nearest_reference, -1)
+
+
+def default_tolerance(frame_times):
+    """Half the median interval between frames across all ports"""
+    intervals = [np.diff(times) for times in frame_times.values() if len(times) > 1]
+    if not intervals:
+        return np.inf
+    return 0.5 * float(np.median(np.concatenate(intervals)))
+
+
+def align(frame_times: dict, tolerance=None):
+    """Bundle index of each frame, given the increasing frame times of each
+    port. Returns {port: array of bundle indices, one per frame}"""
+    frame_times = {port: np.asarray(times, dtype=np.float64) for port, times in frame_times.items()}
+    if tolerance is None:
+        tolerance = default_tolerance(frame_times)
+
+    # the slots of the reference timeline, kept in time order
+    slot_sum = np.empty(0)
+    slot_count = np.empty(0)
+    slots = {}  # port: slot of each frame
+
+    for port in sorted(frame_times, key=lambda p: -len(frame_times[p])):
+        times = frame_times[port]
+        slot_times = slot_sum / np.maximum(slot_count, 1)
+        order = np.argsort(slot_times, kind="stable")
+
+        matched = mutual_nearest(slot_times[order], times, tolerance)
+        port_slots = np.full(len(times), -1, dtype=np.int64)
+        port_slots[matched >= 0] = order[matched[matched >= 0]]
+
+        # frames without a match open new slots at the end
+        unmatched = port_slots < 0
+        port_slots[unmatched] = len(slot_sum) + np.arange(unmatched.sum())
+        slot_sum = np.concatenate([slot_sum, np.zeros(unmatched.sum())])
+        slot_count = np.concatenate([slot_count, np.zeros(unmatched.sum())])
+
+        np.add.at(slot_sum, port_slots, times)
+        np.add.at(slot_count, port_slots, 1)
+        slots[port] = port_slots
+        logging.debug(f"Port {port}: {len(times) - unmatched.sum()} frames matched, {unmatched.sum()} new slots")
+
+    # slots in time order become bundles
+    bundle_of_slot = np.empty(len(slot_sum), dtype=np.int64)
+    bundle_of_slot[np.argsort(slot_sum / slot_count, kind="stable")] = np.arange(len(slot_sum))
+    return {port: bundle_of_slot[port_slots] for port, port_slots in slots.items()}
+
+
+def read_frame_history(directory):
+    """Each port's rows of frame_time_history.csv in the order its frames
+    were written to video"""
+    history = read_bundle_history(directory)
+    return {
+        int(port): port_history.sort_values("frame_index").reset_index(drop=True)
+        for port, port_history in history.groupby("port")
+    }
+
+
+def bundle_table(port_history: dict, tolerance=None):
+    """Table of bundle_index, port, frame_index, frame_time and video for
+    every frame, ordered by bundle then port"""
+    frame_times = {port: history["frame_time"].to_numpy() for port, history in port_history.items()}
+    bundle_indices = align(frame_times, tolerance)
+
+    table = pd.concat(
+        [
+            pd.DataFrame(
+                {
+                    "bundle_index": bundle_indices[port],
+                    "port": port,
+                    "frame_index": history["frame_index"].to_numpy(),
+                    "frame_time": history["frame_time"].to_numpy(),
+                    "video": history["video"].to_numpy(),
+                }
+            )
+            for port, history in port_history.items()
+        ]
+    )
+    return table.sort_values(["bundle_index", "port"]).reset_index(drop=True)
+
+
+def align_recording(directory, tolerance=None):
+    """Align a recorded session and save its bundle table alongside it"""
+    start = time.perf_counter()
+    table = bundle_table(read_frame_history(directory), tolerance)
+    path = Path(directory, BUNDLE_TABLE)
+    table.to_csv(path, index=False, header=True)
+    logging.info(
+        f"Aligned {len(table)} frames into {table['bundle_index'].nunique()} bundles "
+        f"in {time.perf_counter() - start:.3f} sec; saved to {path}"
+    )
+    return table
+
+
+def alignment_stats(table, ports):
+    """Bundle count, incomplete bundles and spread of frame times within
+    bundles (ms), comparable to Synchronizer.skew_stats()"""
+    grouped = table.groupby("bundle_index")["frame_time"]
+    spreads = (grouped.max() - grouped.min())[grouped.count() > 1].to_numpy() * 1000
+    stats = {
+        "bundles": int(table["bundle_index"].nunique()),
+        "incomplete_bundles": int((grouped.count() < len(ports)).sum()),
+    }
+    if len(spreads) > 0:
+        stats.update(
+            {
+                "spread_mean_ms": float(np.mean(spreads)),
+                "spread_median_ms": float(np.median(spreads)),
+                "spread_p95_ms": float(np.percentile(spreads, 95)),
+                "spread_max_ms": float(np.max(spreads)),
+            }
+        )
+    return stats
+
+
+class AlignedPlayback:
+    """Plays a recorded session back in the bundles of its bundle table.
+    Bundles take the same form as the Synchronizer's, and subscribers attach
+    in the same way, so it can stand in for a Synchronizer fed by a
+    RecordedStreamPool. For batch work, iterate over bundles() instead"""
+
+    def __init__(self, directory, ports=None, tolerance=None):
+        self.directory = directory
+
+        table_path = Path(directory, BUNDLE_TABLE)
+        self.table = None
+        if table_path.exists() and tolerance is None:
+            self.table = pd.read_csv(table_path)
+        if self.table is None or "video" not in self.table.columns:
+            # tables saved before they named each frame's video are made again
+            self.table = align_recording(directory, tolerance)
+
+        self.ports = sorted(self.table["port"].unique()) if ports is None else list(ports)
+        self.table = self.table[self.table["port"].isin(self.ports)]
+
+        self.current_bundle = None
+        self.notice_subscribers = []
+        self.bundle_subscribers = []
+        self.stop_event = Event()
+
+    def subscribe_to_notice(self, q):
+        logging.info("Adding queue to receive notice of bundle update")
+        self.notice_subscribers.append(q)
+
+    def subscribe_to_bundle(self, q):
+        logging.info("Adding queue to receive frame bundle")
+        self.bundle_subscribers.append(q)
+
+    def release_bundle_q(self, q):
+        logging.info("Releasing record queue")
+        self.bundle_subscribers.remove(q)
+
+    def video_path(self, video):
+        return str(Path(self.directory, video))
+
+    def bundles(self):
+        """Each bundle in turn, reading every video once from start to end"""
+        # frames are written to video in frame_index order; a port moves on to
+        # its next video when its resolution changes, and never goes back
+        frame_order = self.table.groupby(["port", "video"])["frame_index"].rank(method="first").astype(int) - 1
+        captures = {}  # port: (video, capture)
+        frames_read = {}
+
+        try:
+            for bundle_index, rows in self.table.assign(video_frame=frame_order).groupby("bundle_index"):
+                bundle = {port: None for port in self.ports}
+                for row in rows.itertuples():
+                    video, capture = captures.get(row.port, (None, None))
+                    if row.video != video:
+                        if capture is not None:
+                            capture.release()
+                        capture = cv2.VideoCapture(self.video_path(row.video))
+                        captures[row.port] = (row.video, capture)
+                        frames_read[row.port] = 0
+
+                    while frames_read[row.port] < row.video_frame:
+                        # only if the table does not match the video; keep in step
+                        capture.grab()
+                        frames_read[row.port] += 1
+
+                    success, frame = capture.read()
+                    frames_read[row.port] += 1
+                    if not success:
+                        logging.warning(f"Port {row.port} video ended before frame index {row.frame_index}")
+                        continue
+
+                    bundle[row.port] = FrameData(
+                        port=row.port,
+                        packet=FramePacket(row.frame_time, frame=frame),
+                        frame_index=row.frame_index,
+                        frame_time=row.frame_time,
+                        bundle_index=bundle_index,
+                    )
+                yield FrameBundle(bundle, bundle_index)
+        finally:
+            for _, capture in captures.values():
+                capture.release()
+
+    def play(self, fps_target=None):
+        """Publish bundles to subscribers on a thread; as fast as they are
+        taken unless a frame rate is given"""
+        self.fps_target = fps_target
+        self.thread = Thread(target=self.play_worker, args=[], daemon=True)
+        self.thread.start()
+
+    def play_worker(self):
+        logging.info(f"Beginning aligned playback of {self.directory}")
+        pacer = Pacer(self.fps_target)
+        for bundle in self.bundles():
+            if self.stop_event.is_set():
+                break
+
+            if self.fps_target is not None:
+                pacer.wait()
+
+            self.current_bundle = bundle
+            for q in self.notice_subscribers:
+                q.put("new bundle available")
+            for q in self.bundle_subscribers:
+                q.put(bundle)
+
+        logging.info("Aligned playback ended")
+
+
+if __name__ == "__main__":
+    import sys
+
+    repo = Path(__file__).parent.parent.parent
+    if len(sys.argv) > 1:
+        session_directory = Path(sys.argv[1])
+    else:
+        session_directory = Path(repo, "sessions", "iterative_adjustment")
+
+    table = align_recording(session_directory)
+    ports = sorted(table["port"].unique())
+    print(alignment_stats(table, ports))
+
+    playback = AlignedPlayback(session_directory)
+    bundle_q = Queue()
+    playback.subscribe_to_bundle(bundle_q)
+    playback.play(fps_target=30)
+
+    while True:
+        bundle = bundle_q.get()
+        for port, frame_data in bundle.items():
+            if frame_data:
+                cv2.imshow(f"Port {port}", frame_data["frame"])
+
+        key = cv2.waitKey(1)
+        if key == ord("q"):
+            playback.stop_event.set()
+            cv2.destroyAllWindows()
+            break
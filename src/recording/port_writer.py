@@ -0,0 +1,176 @@
+# Writes the video of a single port, in a worker of its own, so that the
+# encoding of one camera's frames doesn't wait on another's. The VideoRecorder
+# hands each frame to the writer of its port and moves straight on to the
+# next; with three or more cameras, encoding them one after another in a
+# single thread is what had kept recordings from keeping up.
+#
+# Each writer is fed by a bounded queue. A frame that arrives when the queue
+# is full is dropped (and counted) rather than holding up the recorder, so a
+# port whose encoding can't keep pace loses frames of its own video without
+# slowing capture or any other port.
+#
+# The worker can be a thread (cv2 releases the GIL while encoding) or a
+# process, for when encoding should have a core to itself. Frames cross to a
+# process by pickling, which is a copy the thread avoids. A frame in a bundle
+# is a view of a reel buffer that isn't read into again while the view is
+# held (see frame_reel.py), so the thread is handed the frame itself. Frames captured as JPEG go over as they are, and
+# are only decoded by the worker if its writer needs them decoded.
+#
+# Counts of frames written and the time spent writing them are kept in
+# shared memory so that the throughput of a process can be read from here.
+
+import logging
+import multiprocessing as mp
+import time
+from queue import Full, Queue
+from threading import Thread
+
+import cv2
+
+WRITER_QUEUE_DEPTH = 30  # frames per port waiting to be written (about a second at 30 fps)
+WRITER_KINDS = ("thread", "process")
+
+
+class MJPEGWriter:
+    """Writes frames as a raw MJPEG stream (concatenated JPEGs), which
+    cv2.VideoCapture reads back like any other video. Frames captured with
+    MJPEG passthrough are written as the bytes the camera sent, with no
+    decode and no re-encode; anything else is encoded on the way in"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "wb")
+
+    def write(self, frame):
+        _, jpeg = cv2.imencode(".jpg", frame)
+        self.write_jpeg(jpeg)
+
+    def write_jpeg(self, jpeg):
+        self.file.write(jpeg.tobytes())
+
+    def isOpened(self):
+        return not self.file.closed
+
+    def release(self):
+        self.file.close()
+
+
+def build_video_writer(path, frame_size, fps):
+    logging.info(f"Building video writer for {path} at {frame_size}")
+    if path.endswith(".mjpeg"):
+        # frame size is carried in each JPEG
+        return MJPEGWriter(path)
+    fourcc = cv2.VideoWriter_fourcc(*"MP4V")
+    return cv2.VideoWriter(path, fourcc, fps, tuple(frame_size))
+
+
+def write_frames(frame_q, written, write_time):
+    """Worker loop. Items on the queue are ("open", path, frame_size, fps) to
+    start a new file, ("frame", frame) or ("jpeg", jpeg) to write, and None
+    to finish up"""
+    writer = None
+    while True:
+        item = frame_q.get()
+        if item is None:
+            break
+
+        kind = item[0]
+        if kind == "open":
+            if writer is not None:
+                writer.release()
+            writer = build_video_writer(*item[1:])
+            continue
+
+        start = time.perf_counter()
+        if kind == "jpeg" and isinstance(writer, MJPEGWriter):
+            writer.write_jpeg(item[1])
+        elif kind == "jpeg":
+            writer.write(cv2.imdecode(item[1], cv2.IMREAD_COLOR))
+        else:
+            writer.write(item[1])
+        elapsed = time.perf_counter() - start
+
+        with written.get_lock():
+            written.value += 1
+        with write_time.get_lock():
+            write_time.value += elapsed
+
+    # a proper release is strictly necessary to ensure file is readable
+    if writer is not None:
+        writer.release()
+
+
+class PortWriter:
+    def __init__(self, port, kind="thread", maxsize=WRITER_QUEUE_DEPTH):
+        if kind not in WRITER_KINDS:
+            raise ValueError(f"Writer kind must be one of {WRITER_KINDS}, not {kind}")
+
+        self.port = port
+        self.kind = kind
+        self.maxsize = maxsize
+
+        # counters
+        self.offered = 0  # frames handed to write()
+        self.dropped = 0
+        self.written = mp.Value("i", 0)
+        self.write_time = mp.Value("d", 0.0)  # seconds spent in the writer itself
+
+        if kind == "thread":
+            self.frame_q = Queue(maxsize)
+            worker = Thread
+        else:
+            self.frame_q = mp.Queue(maxsize)
+            worker = mp.Process
+        self.worker = worker(
+            target=write_frames, args=(self.frame_q, self.written, self.write_time), daemon=True
+        )
+
+        self.worker.start()
+        self.start_time = time.perf_counter()
+        logging.info(f"Started {kind} writer for port {port}")
+
+    def open(self, path, frame_size, fps):
+        """Carry on in a new file from the next frame written; waits for room
+        on the queue, as this can't be dropped"""
+        self.frame_q.put(("open", path, frame_size, fps))
+
+    def write(self, packet, block=False):
+        """Queue the frame of a packet to be written. Returns False if the
+        queue was full and the frame was dropped"""
+        self.offered += 1
+        if packet.compressed:
+            item = ("jpeg", packet.jpeg)
+        else:
+            item = ("frame", packet.frame)
+
+        try:
+            self.frame_q.put(item, block=block)
+        except Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def stop(self):
+        """Write out whatever is still queued and close the file"""
+        self.frame_q.put(None)
+        self.worker.join()
+        logging.info(f"Writer for port {self.port} stopped: {self.stats()}")
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.start_time
+        written = self.written.value
+        write_time = self.write_time.value
+        return {
+            "port": self.port,
+            "kind": self.kind,
+            "offered": self.offered,
+            "written": written,
+            "dropped": self.dropped,
+            "waiting": self.offered - self.dropped - written,
+            "write_fps": written / elapsed if elapsed > 0 else 0,
+            "write_ms_mean": 1000 * write_time / written if written else None,
+            "capacity_fps": written / write_time if write_time > 0 else None,
+        }
+
+    def __repr__(self):
+        return f"PortWriter(port={self.port}, kind={self.kind})"
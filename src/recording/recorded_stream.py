@@ -4,6 +4,13 @@
 # this is useful for two purposes:
 #   1: future testing (don't have to keep recording live video)
 #   2: future off-line processing of pre-recorded video.
+# For off-line processing that doesn't need the live Synchronizer's behaviour,
+# offline_alignment.py bundles a recording without it.
+#
+# A port whose resolution changed during recording carries on in a new video
+# file (see video_recorder.py). The "video" column of frame_time_history.csv
+# names the file each frame was written to, and playback moves on to the
+# next file where it changes.
 
 import logging
 
@@ -20,6 +27,23 @@ import cv2
 import pandas as pd
 
 
+def single_video(directory, port):
+    """File name of the port's video in a recording made in one file per port"""
+    if Path(directory, f"port_{port}.mp4").exists():
+        return f"port_{port}.mp4"
+    # recorded with MJPEG passthrough (see video_recorder.py)
+    return f"port_{port}.mjpeg"
+
+
+def read_bundle_history(directory):
+    """frame_time_history.csv, with the video file each frame is in. Older
+    recordings have no video column, as each port was kept in a single file"""
+    bundle_history = pd.read_csv(Path(directory, "frame_time_history.csv"))
+    if "video" not in bundle_history.columns:
+        bundle_history["video"] = [single_video(directory, port) for port in bundle_history["port"]]
+    return bundle_history
+
+
 class RecordedStream:
     """Analogous to the live stream, this will place frames on a queue ("reel", probably need to 
     change that cutesy little thing). These can then be harvested and bundled by a Synchronizer"""
@@ -28,14 +52,12 @@ class RecordedStream:
         self.port = port
         self.directory = directory
 
-        video_path = str(Path(self.directory, f"port_{port}.mp4"))
-        bundle_history_path = str(Path(self.directory, f"frame_time_history.csv"))
         self.reel = Queue(-1)
-        self.capture = cv2.VideoCapture(video_path)
 
-        bundle_history = pd.read_csv(bundle_history_path)
+        bundle_history = read_bundle_history(self.directory)
 
-        self.port_history = bundle_history[bundle_history["port"] == port]
+        # frames were written to video in frame_index order
+        self.port_history = bundle_history[bundle_history["port"] == port].sort_values("frame_index")
         self.start_frame_index = self.port_history["frame_index"].min()
         self.last_frame_index = self.port_history["frame_index"].max()
         self.shutter_sync = Queue(-1)
@@ -49,29 +71,35 @@ class RecordedStream:
         """Places list of [frame_time, frame] on the reel for reading by a synchronizer,
         mimicking the behaviour of the LiveStream. 
         """
-        frame_index = self.start_frame_index
+        video = None
+        capture = None
 
-        while True:
+        for row in self.port_history.itertuples():
             
             _ = self.shutter_sync.get()
 
-            frame_time = self.port_history[self.port_history["frame_index"] == frame_index][
-                "frame_time"
-            ]
-            frame_time = float(frame_time)
-            success, frame = self.capture.read()
+            if row.video != video:
+                if capture is not None:
+                    capture.release()
+                video = row.video
+                logging.info(f"Playing back {video} at port {self.port}")
+                capture = cv2.VideoCapture(str(Path(self.directory, video)))
+
+            frame_time = float(row.frame_time)
+            success, frame = capture.read()
 
             if not success:
                 break
 
-            logging.debug(f"Placing frame on reel {self.port} for frame time: {frame_time} and frame index: {frame_index}")
+            logging.debug(f"Placing frame on reel {self.port} for frame time: {frame_time} and frame index: {row.frame_index}")
             self.reel.put([frame_time, frame])
-            frame_index += 1
 
-            if frame_index > self.last_frame_index:
-                logging.info(f"Ending recorded playback at port {self.port}")
-                self.reel.put([-1, np.array([], dtype="uint8")])
-                break
+        else:
+            logging.info(f"Ending recorded playback at port {self.port}")
+            self.reel.put([-1, np.array([], dtype="uint8")])
+
+        if capture is not None:
+            capture.release()
 
 
 class RecordedStreamPool:
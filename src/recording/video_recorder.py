@@ -8,84 +8,183 @@ LOG_FORMAT = " %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s"
 logging.basicConfig(filename=LOG_FILE, filemode="w", format=LOG_FORMAT, level=LOG_LEVEL)
 
 from pathlib import Path
-from queue import Queue
+from queue import Empty, Queue
 from threading import Thread
-import cv2
 import sys
 import pandas as pd
 
+from src.cameras.subscription import Subscription
 from src.cameras.synchronizer import Synchronizer
+from src.recording.port_writer import PortWriter, WRITER_KINDS, WRITER_QUEUE_DEPTH
+
+# bundles waiting to be handed to the port writers. The hand off is quick, so
+# this only fills if the recorder thread itself is starved
+RECORD_QUEUE_DEPTH = 30
+
 
 class VideoRecorder:
 
-    def __init__(self, synchronizer):
+    def __init__(self, synchronizer, writer="thread", writer_queue_depth=WRITER_QUEUE_DEPTH):
+        """writer: "thread" or "process"; each port's video is written by a
+        worker of its own of this kind (see port_writer.py)"""
+        if writer not in WRITER_KINDS:
+            raise ValueError(f"Writer kind must be one of {WRITER_KINDS}, not {writer}")
         self.syncronizer = synchronizer
+        self.writer = writer
+        self.writer_queue_depth = writer_queue_depth
 
         # connect video recorder to synchronizer via a "bundle in" queue
         self.recording = False
+        self.pre_roll = 0
+        self.rate_controller = None  # held at a steady rate while recording
+        self.port_writers = {}
+        self.videos = {}  # port: file name of the video currently being written
 
     def build_video_writers(self):
         
-        # create a dictionary of videowriters
-        self.video_writers = {}
+        # create a dictionary of port writers, each with its video open
+        self.port_writers = {}
         for port, stream in self.syncronizer.streams.items():
-
-            path = str(Path(self.destination_folder, f"port_{port}.mp4"))
-            logging.info(f"Building video writer for port {port}; recording to {path}")
-            fourcc = cv2.VideoWriter_fourcc(*"MP4V")
-            fps = self.syncronizer.fps_target
-            frame_size = stream.camera.resolution
-            
-            writer = cv2.VideoWriter(path, fourcc,fps, frame_size )
-            self.video_writers[port] = writer
+            self.port_writers[port] = PortWriter(port, self.writer, self.writer_queue_depth)
+            self.open_video(port, f"port_{port}", stream.camera.resolution)
+
+    def video_path(self, port, name):
+        """Ports capturing MJPEG are stored as such to avoid re-encoding"""
+        stream = self.syncronizer.streams[port]
+        suffix = ".mjpeg" if getattr(stream, "mjpeg_passthrough", False) else ".mp4"
+        return str(Path(self.destination_folder, name + suffix))
+
+    def open_video(self, port, name, frame_size):
+        """Frames written to the port from here on go into a new file. Each
+        frame's file is kept in the frame time history so that playback
+        (see recorded_stream.py) can follow the port from one to the next"""
+        path = self.video_path(port, name)
+        self.port_writers[port].open(path, frame_size, self.syncronizer.fps_target)
+        self.videos[port] = Path(path).name
+
+    def subscribe_to_resolution_changes(self):
+        self.resolution_change_q = Queue()
+        self.pending_resolution_changes = []
+        for stream in self.syncronizer.streams.values():
+            if hasattr(stream, "subscribe_to_resolution_change"):
+                stream.subscribe_to_resolution_change(self.resolution_change_q)
+
+    def release_resolution_changes(self):
+        for stream in self.syncronizer.streams.values():
+            if hasattr(stream, "release_resolution_q"):
+                stream.release_resolution_q(self.resolution_change_q)
+
+    def check_resolution_change(self, port, frame_time):
+        """A VideoWriter is fixed to one frame size, so when a port changes
+        resolution its video carries on in a new file named for the new size"""
+        while not self.resolution_change_q.empty():
+            self.pending_resolution_changes.append(self.resolution_change_q.get())
+
+        for change in self.pending_resolution_changes.copy():
+            if change["port"] == port and frame_time >= change["first_frame_time"]:
+                self.pending_resolution_changes.remove(change)
+                width, height = change["resolution"]
+                self.open_video(port, f"port_{port}_{width}x{height}", change["resolution"])
+                logging.info(f"Resolution at port {port} changed; continuing recording in {self.videos[port]}")
 
 
     def save_frame_worker(self):
 
         self.build_video_writers()
+        self.subscribe_to_resolution_changes()
         # build dict that will be stored to csv
         self.bundle_history = {"bundle_index": [],
                                "port":[],
                                "frame_index":[],
-                               "frame_time":[]}
-        bundle_index = 0
+                               "frame_time":[],
+                               "video":[]}
+        self.bundle_index = 0
 
-        self.bundle_in_q = Queue(-1)
+        self.bundle_in_q = Subscription(RECORD_QUEUE_DEPTH, "drop_oldest", name="video recorder")
         self.syncronizer.subscribe_to_bundle(self.bundle_in_q)       
 
+        # subscribed first so that nothing falls between the pre-roll and the live bundles
+        last_written = -1
+        for frame_bundle in self.pre_roll_bundles():
+            # these have already waited in the history, so can wait for the writers
+            self.write_bundle(frame_bundle, block=True)
+            last_written = frame_bundle.bundle_index
+
         while self.recording:
-            frame_bundle = self.bundle_in_q.get() 
+            try:
+                frame_bundle = self.bundle_in_q.get(timeout=0.5)
+            except Empty:
+                continue  # nothing new; check whether recording has stopped
             logging.debug("Pulling bundle from record queue")
 
-            for port, bundle in frame_bundle.items():
-                if bundle is not None:
-                    # read in the data for this frame for this port
-                    frame = bundle["frame"]
-                    frame_index = bundle["frame_index"]
-                    frame_time = bundle["frame_time"]
-
-                    # store the frame
-                    self.video_writers[port].write(frame)
-
-                    # store to assocated data in the dictionary
-                    self.bundle_history["bundle_index"].append(bundle_index)
-                    self.bundle_history["port"].append(port)
-                    self.bundle_history["frame_index"].append(frame_index)
-                    self.bundle_history["frame_time"].append(frame_time)
-
-                    # these two lines of code are just for ease of debugging 
-                    cv2.imshow(f"port: {port}", frame)
-                    key = cv2.waitKey(1)
-
-            bundle_index += 1
+            if frame_bundle.bundle_index is not None and frame_bundle.bundle_index <= last_written:
+                continue  # already written from the pre-roll
+            self.write_bundle(frame_bundle)
 
         self.syncronizer.release_bundle_q(self.bundle_in_q)
+        if self.bundle_in_q.dropped > 0:
+            logging.warning(f"Recording fell behind; {self.bundle_in_q.dropped} bundles were not written")
+        logging.info(f"Record queue stats: {self.bundle_in_q.stats()}")
+        self.release_resolution_changes()
 
-        # a proper release is strictly necessary to ensure file is readable
-        for port, bundle in frame_bundle.items():
-            self.video_writers[port].release()
+        # each writer finishes its queue and releases its file
+        for port, port_writer in self.port_writers.items():
+            port_writer.stop()
+        self.report_throughput()
 
         self.store_bundle_history()
+
+    def pre_roll_bundles(self):
+        """Bundles from the seconds before recording began, if the
+        synchronizer is keeping a history of them"""
+        history = getattr(self.syncronizer, "history", None)
+        if self.pre_roll <= 0:
+            return []
+        if history is None:
+            logging.warning("No bundle history kept by the synchronizer; recording without pre-roll")
+            return []
+
+        bundles = history.since(self.pre_roll)
+        logging.info(f"Writing {len(bundles)} bundles of pre-roll from the bundle history")
+        return bundles
+
+    def write_bundle(self, frame_bundle, block=False):
+        """Hand each frame of the bundle to the writer of its port. Only frames
+        that make it onto a writer's queue go into the frame time history"""
+        for port, bundle in frame_bundle.items():
+            if bundle is not None:
+                # read in the data for this frame for this port
+                packet = bundle["packet"]
+                frame_index = bundle["frame_index"]
+                frame_time = bundle["frame_time"]
+
+                # store the frame
+                self.check_resolution_change(port, frame_time)
+                if not self.port_writers[port].write(packet, block=block):
+                    continue
+
+                # store to assocated data in the dictionary
+                self.bundle_history["bundle_index"].append(self.bundle_index)
+                self.bundle_history["port"].append(port)
+                self.bundle_history["frame_index"].append(frame_index)
+                self.bundle_history["frame_time"].append(frame_time)
+                self.bundle_history["video"].append(self.videos[port])
+
+        self.bundle_index += 1
+
+    def stats(self):
+        """Frames written and dropped by each port's writer, and how fast"""
+        return {port: port_writer.stats() for port, port_writer in self.port_writers.items()}
+
+    def report_throughput(self):
+        for port, stats in self.stats().items():
+            capacity = stats["capacity_fps"]
+            logging.info(
+                f"Port {port} wrote {stats['written']} frames at {stats['write_fps']:.1f} fps "
+                f"(could take {capacity or 0:.1f} fps); {stats['dropped']} dropped"
+            )
+            if stats["dropped"] > 0:
+                logging.warning(f"Writer for port {port} fell behind; {stats['dropped']} frames were not written")
     
     def store_bundle_history(self):
         df = pd.DataFrame(self.bundle_history)
@@ -95,11 +194,19 @@ class VideoRecorder:
         df.to_csv(bundle_hist_path, index = False, header = True)
         
          
-    def start_recording(self, destination_folder):
+    def start_recording(self, destination_folder, pre_roll=0):
+        """pre_roll: seconds from before the call to include, taken from the
+        synchronizer's bundle history (see Synchronizer.keep_history)"""
 
         logging.info(f"All video data to be saved to {destination_folder}")
 
         self.destination_folder = destination_folder
+        self.pre_roll = pre_roll
+
+        # the video's frame rate is fixed when its writer is built
+        self.rate_controller = getattr(self.syncronizer, "rate_controller", None)
+        if self.rate_controller is not None:
+            self.rate_controller.hold()
         self.recording = True
         self.recording_thread = Thread(target=self.save_frame_worker, args=[], daemon=True)
         self.recording_thread.start() 
@@ -107,6 +214,9 @@ class VideoRecorder:
 
     def stop_recording(self):
         self.recording = False
+        if self.rate_controller is not None:
+            self.rate_controller.resume()
+            self.rate_controller = None
 
 
 
@@ -11,6 +11,7 @@ LOG_FORMAT = " %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s"
 logging.basicConfig(filename=LOG_FILE, filemode="w", format=LOG_FORMAT, level=LOG_LEVEL)
 
 import sys
+import time
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from os.path import exists
@@ -25,18 +26,26 @@ from src.calibration.corner_tracker import CornerTracker
 from src.calibration.monocalibrator import MonoCalibrator
 from src.calibration.stereocalibrator import StereoCalibrator
 from src.cameras.camera import Camera
+from src.cameras.capability_cache import CapabilityCache
+from src.cameras.rate_controller import RateController
 from src.cameras.synchronizer import Synchronizer
 from src.cameras.live_stream import LiveStream
+from src.cameras.process_stream import ProcessStream
+from src.cameras.synthetic_camera import SyntheticArray
+from src.cameras.telemetry import dump_telemetry
 from src.recording.video_recorder import VideoRecorder
 from src.gui.stereo_calibration.stereo_frame_builder import StereoFrameBuilder
 from src.gui.stereo_calibration.stereo_frame_emitter import StereoFrameEmitter
 
 #%%
 MAX_CAMERA_PORT_CHECK = 10
+# bounds on the rate stereo calibration runs at
+STEREO_MIN_FPS = 2
+STEREO_MAX_FPS = 30
 
 
 class Session:
-    def __init__(self, directory):
+    def __init__(self, directory, capture_backend="thread", mjpeg_passthrough=False):
 
         self.folder = PurePath(directory).name
         self.path = directory
@@ -51,6 +60,20 @@ class Session:
 
         self.synchronizer_created = False
 
+        # "thread": LiveStream reads frames on a thread in this process
+        # "process": ProcessStream reads frames in a child process per camera
+        if capture_backend not in ("thread", "process"):
+            raise ValueError(f"Unknown capture backend: {capture_backend}")
+        self.capture_backend = capture_backend
+
+        # carry frames as the JPEG the camera sent, decoding only when needed
+        # (thread backend only; see frame_packet.py)
+        self.mjpeg_passthrough = mjpeg_passthrough
+
+        # remembers what each device can do so that reconnecting is quick
+        self.capability_cache = CapabilityCache()
+        self.camera_discovery_time = None
+
         self.load_config()
         self.load_charuco()
 
@@ -177,7 +200,7 @@ class Session:
                     logging.info(f"Ignoring camera at port {port}")
                     pass  # don't load it in
                 else:
-                    self.cameras[port] = Camera(port)
+                    self.cameras[port] = Camera(port, self.capability_cache)
                     cam = self.cameras[port]  # just for ease of reference
                     cam.rotation_count = params["rotation_count"]
                     cam.exposure = params["exposure"]
@@ -196,6 +219,7 @@ class Session:
             except:
                 logging.info("Unable to connect... camera may be in use.")
 
+        discovery_start = time.perf_counter()
         with ThreadPoolExecutor() as executor:
             for key, params in self.config.items():
                 if key.startswith("cam"):
@@ -205,6 +229,11 @@ class Session:
                         logging.info(f"Beginning to load {key} with params {params}")
                         executor.submit(add_preconfigured_cam, params)
 
+        self.camera_discovery_time = time.perf_counter() - discovery_start
+        logging.info(
+            f"Loaded {len(self.cameras)} cameras in {self.camera_discovery_time:.2f} seconds"
+        )
+
     def find_cameras(self):
         """This will seek to connect to the first N cameras. It will clear out any previous calibration
         data, including stereocalibration data"""
@@ -212,14 +241,15 @@ class Session:
         def add_cam(port):
             try:
                 logging.info(f"Trying port {port}")
-                cam = Camera(port)
+                cam = Camera(port, self.capability_cache)
                 logging.info(f"Success at port {port}")
                 self.cameras[port] = cam
                 self.save_camera(port)
-                self.streams[port] = LiveStream(cam)
+                self.streams[port] = self.build_stream(cam)
             except:
                 logging.info(f"No camera at port {port}")
 
+        discovery_start = time.perf_counter()
         with ThreadPoolExecutor() as executor:
             for i in range(0, MAX_CAMERA_PORT_CHECK):
                 if i in self.cameras.keys():
@@ -228,6 +258,11 @@ class Session:
                 else:
                     executor.submit(add_cam, i)
 
+        self.camera_discovery_time = time.perf_counter() - discovery_start
+        logging.info(
+            f"Found {len(self.cameras)} cameras in {self.camera_discovery_time:.2f} seconds"
+        )
+
         # remove potential stereocalibration data
 
         for key in self.config.copy().keys():
@@ -243,13 +278,55 @@ class Session:
                 pass  # only add if not added yet
             else:
                 logging.info(f"Loading Stream for port {port}")
-                self.streams[port] = LiveStream(cam)
+                self.streams[port] = self.build_stream(cam)
+
+    def load_synthetic_cameras(self, camera_count, **kwargs):
+        """Populate the session with cameras that render the session charuco
+        rather than reading from devices. Keyword arguments are passed on to
+        the SyntheticArray (resolution, fps, noise, etc.)"""
+        self.synthetic_array = SyntheticArray(self.charuco, camera_count, **kwargs)
+
+        for port, cam in self.synthetic_array.get_cameras().items():
+            logging.info(f"Adding synthetic camera at port {port}")
+            self.cameras[port] = cam
+            self.streams[port] = self.build_stream(cam)
+
+    def build_stream(self, cam):
+        if self.capture_backend == "process":
+            return ProcessStream(cam)
+        else:
+            stream = LiveStream(cam)
+            if self.mjpeg_passthrough:
+                stream.set_mjpeg_passthrough()
+            return stream
+
+    def capture_telemetry(self, recent=True):
+        """Per-port capture statistics (see telemetry.py). Frames the
+        synchronizer dropped as out of sync are included when it exists"""
+        telemetry = {}
+        for port, stream in self.streams.items():
+            if not hasattr(stream, "telemetry"):
+                continue
+            telemetry[port] = stream.telemetry.summary(recent)
+            if hasattr(self, "synchronizer"):
+                telemetry[port]["out_of_sync"] = self.synchronizer.dropped_frames[port]
+        return telemetry
+
+    def save_telemetry(self):
+        telemetry = self.capture_telemetry(recent=False)
+        if telemetry:
+            dump_telemetry(telemetry, Path(self.path, "capture_telemetry.toml"))
 
     def disconnect_cameras(self):
         """Destroy all camera reading associated threads working down to the cameras
         themselves so that the session cameras can be later reconstructed (potentially
         with additional or fewer cameras)"""
 
+        try:
+            self.save_telemetry()
+        except OSError:
+            logging.warning("Unable to save capture telemetry")
+
         try:
             logging.info("Attempting to shutdown monocalibrators")
             for port, monocal in self.monocalibrators.items():
@@ -333,6 +410,10 @@ class Session:
         else:
             logging.info("Creating stereo tools...")
             self.synchronizer = Synchronizer(self.streams, fps_target=6.2)
+            # settles on the rate the stereo calibration can keep up with
+            self.rate_controller = RateController(
+                self.synchronizer, min_fps=STEREO_MIN_FPS, max_fps=STEREO_MAX_FPS
+            )
             self.corner_tracker = CornerTracker(self.charuco)
             self.stereocalibrator = StereoCalibrator(
                 self.synchronizer, self.corner_tracker
@@ -341,9 +422,20 @@ class Session:
             self.stereo_frame_emitter = StereoFrameEmitter(self.stereo_frame_builder)
             self.stereo_frame_emitter.start()
 
+    def set_fps_target(self, fps):
+        """The rate asked for in the GUI. While the rate is being adjusted to
+        the consumers it is taken as the most to run at"""
+        rate_controller = getattr(self, "rate_controller", None)
+        if rate_controller is not None:
+            rate_controller.set_bounds(max_fps=fps)
+        else:
+            self.synchronizer.fps_target = fps
+
     def remove_stereo_tools(self):
         self.stereocalibrator.stop()
         del self.stereocalibrator
+        self.rate_controller.stop()
+        del self.rate_controller
         self.synchronizer.stop()
         del self.synchronizer
         # self.stereo_frame_builder
@@ -356,23 +448,29 @@ class Session:
         else:
             logging.warning("No synchronizer available to record video")
 
-    def adjust_resolutions(self):
+    def adjust_resolutions(self, wait=True):
         """Changes the camera resolution to the value in the configuration, as
-        log as it is not configured for the default resolution"""
+        log as it is not configured for the default resolution.
+
+        The cameras are changed side by side, each on a thread of its own, and
+        by default this returns once all of them are done. With wait=False it
+        returns straight away; streams that are reconnecting are left out of
+        synchronized bundles in the meantime, but camera.resolution is not
+        the new size until its change is complete"""
 
-        def adjust_res_worker(port):
-            stream = self.streams[port]
+        threads = []
+        for port, stream in self.streams.items():
             resolution = self.config[f"cam_{port}"]["resolution"]
             default_res = self.cameras[port].default_resolution
 
             if resolution[0] != default_res[0] or resolution[1] != default_res[1]:
                 logging.info(f"Beginning to change resolution at port {port} from {default_res[0:2]} to {resolution[0:2]}")
-                stream.change_resolution(resolution)
-                logging.info(f"Completed change of resolution at port {port} from {default_res[0:2]} to {resolution[0:2]}")
+                threads.append(stream.change_resolution(resolution, block=False))
 
-        with ThreadPoolExecutor() as executor:
-            for port in self.cameras.keys():
-                executor.submit(adjust_res_worker, port)
+        if wait:
+            for thread in threads:
+                thread.join()
+            logging.info("Completed all changes of resolution")
 
     def save_camera(self, port):
         cam = self.cameras[port]
@@ -444,6 +542,7 @@ if __name__ == "__main__":
 
     print("Finding Cameras...")
     session.find_cameras()
+    print(f"Camera discovery took {session.camera_discovery_time:.2f} seconds")
     print(session.get_stage())
     print(f"Camera pairs: {session.camera_pairs()}")
     print(f"Calibrated Camera pairs: {session.calibrated_camera_pairs()}")
@@ -54,6 +54,7 @@ class ArrayTriangulator:
             self.paired_point_qs[pair] = Queue(-1)
             self.stereo_triangulators[pair] = StereoTriangulator(camA, camB, self.paired_point_qs[pair])
 
+        self.packet_subscribers = []  # queues that will receive each triangulated packet
         self.stop = Event()
 
         self.thread = Thread(
@@ -61,6 +62,14 @@ class ArrayTriangulator:
         )
         self.thread.start()
 
+    def subscribe_to_packets(self, q):
+        logging.info("Adding queue to receive triangulated packets")
+        self.packet_subscribers.append(q)
+
+    def release_packet_q(self, q):
+        logging.info("Releasing triangulated packet queue")
+        self.packet_subscribers.remove(q)
+
     def triangulate_points_worker(self):
         # build a dictionary of lists that will form basis of dataframe output to csv
         aggregate_3d_points = {
@@ -93,6 +102,9 @@ class ArrayTriangulator:
                     for key, value in packet_data.items():
                         aggregate_3d_points[key].extend(value)
 
+                    for q in self.packet_subscribers:
+                        q.put(triangulated_packet)
+
                     print(triangulated_packet.bundle_index)
                     #TODO: #45 figure out how to get this to stop automatically
                     # might want to get the frame counts for the saved port data
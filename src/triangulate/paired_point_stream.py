@@ -62,11 +62,17 @@ class PairedPointStream:
             # find points in each of the frames
             for port in bundle.keys():
                 if bundle[port] is not None:
-                    frame = bundle[port]["frame"]
+                    frame_packet = bundle[port]["packet"]
                     frame_time = bundle[port]["frame_time"]
                     bundle_index = bundle[port]["bundle_index"]
 
-                    ids, loc_img, loc_board = self.tracker.get_corners(frame)
+                    if bundle.annotations.has(port, "ids"):
+                        # found by a StageEngine upstream (see bundle_stages.py)
+                        ids = bundle.annotation(port, "ids")
+                        loc_img = bundle.annotation(port, "img_loc")
+                        loc_board = bundle.annotation(port, "board_loc")
+                    else:
+                        ids, loc_img, loc_board = self.tracker.get_corners(frame_packet)
                     if ids.any():
                         points[port] = pd.DataFrame(
                             {